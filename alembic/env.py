@@ -1,7 +1,9 @@
+import asyncio
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from alembic import context
 
@@ -18,6 +20,7 @@ if config.config_file_name is not None:
 import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from database.db import get_database_url
 from database.models import Base
 target_metadata = Base.metadata
 
@@ -37,9 +40,32 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection, target_metadata=target_metadata
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    """Миграции через asyncpg по DATABASE_URL - тем же драйвером, что и бот"""
+    connectable = create_async_engine(get_database_url(), poolclass=pool.NullPool)
+
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
-    # Используем стандартную конфигурацию из alembic.ini
+    if os.getenv("DATABASE_URL"):
+        asyncio.run(run_async_migrations())
+        return
+
+    # Без DATABASE_URL используем стандартную конфигурацию из alembic.ini
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
@@ -47,12 +73,7 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        do_run_migrations(connection)
 
 
 if context.is_offline_mode():
@@ -0,0 +1,112 @@
+"""cities dictionary with integer keys instead of free-text city columns
+
+Revision ID: 0001_cities
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from config import POPULAR_CITIES, CITY_ALIASES
+from utils.city_matcher import CityMatcher, prettify_city_name
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_cities'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = [
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('aliases', postgresql.ARRAY(sa.String()), nullable=False, server_default='{}'),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+    ]
+    bind = op.get_bind()
+    # Пустую таблицу мог создать create_all при запуске бота до перехода на миграции
+    if sa.inspect(bind).has_table('cities'):
+        cities = sa.table('cities', *(sa.column(column.name, column.type) for column in columns))
+    else:
+        cities = op.create_table('cities', *columns)
+
+    # Сводим уже сохраненные названия ("Питер", "спб", "Санкт Петербург") к каноническим
+    matcher = CityMatcher(POPULAR_CITIES, CITY_ALIASES)
+    raw_cities = bind.execute(sa.text(
+        "SELECT city FROM users WHERE city IS NOT NULL UNION SELECT city FROM events"
+    )).scalars().all()
+    mapping = {}
+    for raw in raw_cities:
+        if raw and raw.strip():
+            match = matcher.resolve(raw)
+            # Длина cities.name ограничена 64 символами
+            mapping[raw] = match.city or matcher.learn(prettify_city_name(raw)[:64])
+
+    aliases = {}
+    for alias, city in CITY_ALIASES.items():
+        aliases.setdefault(city, []).append(alias)
+    names = list(dict.fromkeys([*POPULAR_CITIES, *mapping.values()]))
+    op.execute(
+        postgresql.insert(cities)
+        .values([{'name': name, 'aliases': aliases.get(name, [])} for name in names])
+        .on_conflict_do_nothing(index_elements=['name'])
+    )
+
+    op.add_column('users', sa.Column('city_id', sa.Integer(), nullable=True))
+    op.add_column('events', sa.Column('city_id', sa.Integer(), nullable=True))
+
+    if mapping:
+        city_map = sa.table('city_map', sa.column('raw', sa.String()), sa.column('name', sa.String()))
+        op.execute("CREATE TEMPORARY TABLE city_map (raw varchar, name varchar)")
+        op.bulk_insert(city_map, [{'raw': raw, 'name': name} for raw, name in mapping.items()])
+        for table in ('users', 'events'):
+            op.execute(
+                f"UPDATE {table} AS t SET city_id = c.id "
+                f"FROM city_map AS m JOIN cities AS c ON c.name = m.name "
+                f"WHERE t.city = m.raw"
+            )
+        op.execute("DROP TABLE city_map")
+
+    # У мероприятий с пустым городом берем город организатора, иначе - первый популярный город,
+    # иначе NOT NULL ниже прервет миграцию
+    op.execute(
+        "UPDATE events AS e SET city_id = u.city_id FROM users AS u "
+        "WHERE e.city_id IS NULL AND u.id = e.creator_id AND u.city_id IS NOT NULL"
+    )
+    bind.execute(
+        sa.text("UPDATE events SET city_id = (SELECT id FROM cities WHERE name = :name) WHERE city_id IS NULL"),
+        {"name": POPULAR_CITIES[0]}
+    )
+
+    op.alter_column('events', 'city_id', nullable=False)
+    op.create_foreign_key('users_city_id_fkey', 'users', 'cities', ['city_id'], ['id'])
+    op.create_foreign_key('events_city_id_fkey', 'events', 'cities', ['city_id'], ['id'])
+    op.create_index('ix_users_city_id', 'users', ['city_id'])
+    op.create_index('ix_events_city_id', 'events', ['city_id'])
+
+    op.drop_column('users', 'city')
+    op.drop_column('events', 'city')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('users', sa.Column('city', sa.String(), nullable=True))
+    op.add_column('events', sa.Column('city', sa.String(), nullable=True))
+    op.execute("UPDATE users AS u SET city = c.name FROM cities AS c WHERE c.id = u.city_id")
+    op.execute("UPDATE events AS e SET city = c.name FROM cities AS c WHERE c.id = e.city_id")
+    op.alter_column('events', 'city', nullable=False)
+
+    op.drop_index('ix_events_city_id', table_name='events')
+    op.drop_index('ix_users_city_id', table_name='users')
+    op.drop_constraint('events_city_id_fkey', 'events', type_='foreignkey')
+    op.drop_constraint('users_city_id_fkey', 'users', type_='foreignkey')
+    op.drop_column('events', 'city_id')
+    op.drop_column('users', 'city_id')
+    op.drop_table('cities')
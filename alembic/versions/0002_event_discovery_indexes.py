@@ -0,0 +1,42 @@
+"""indexes for eligibility-aware event discovery
+
+Revision ID: 0002_discovery
+Revises: 0001_cities
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_discovery'
+down_revision: Union[str, None] = '0001_cities'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Составной индекс покрывает и фильтр только по городу
+    op.create_index('ix_events_city_id_event_date', 'events', ['city_id', 'event_date'])
+    op.drop_index('ix_events_city_id', table_name='events')
+
+    # Повторные регистрации на одно мероприятие мешают уникальному индексу
+    op.execute(
+        "DELETE FROM event_participants AS a USING event_participants AS b "
+        "WHERE a.event_id = b.event_id AND a.user_id = b.user_id AND a.ctid > b.ctid"
+    )
+    op.create_index(
+        'uq_event_participants_event_user', 'event_participants', ['event_id', 'user_id'], unique=True
+    )
+    op.create_index('ix_event_participants_user_id', 'event_participants', ['user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_event_participants_user_id', table_name='event_participants')
+    op.drop_index('uq_event_participants_event_user', table_name='event_participants')
+    op.create_index('ix_events_city_id', 'events', ['city_id'])
+    op.drop_index('ix_events_city_id_event_date', table_name='events')
@@ -0,0 +1,61 @@
+"""append-only token ledger: idempotency keys, balances after operations, snapshots
+
+Revision ID: 0003_ledger
+Revises: 0002_discovery
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_ledger'
+down_revision: Union[str, None] = '0002_discovery'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('transactions', sa.Column('idempotency_key', sa.String(length=128), nullable=True))
+    op.add_column('transactions', sa.Column('balance_after', sa.Integer(), nullable=True))
+    op.create_unique_constraint('transactions_idempotency_key_key', 'transactions', ['idempotency_key'])
+    op.create_index('ix_transactions_user_id_id', 'transactions', ['user_id', 'id'])
+
+    # Пустую таблицу мог создать create_all при запуске бота до перехода на миграции
+    if not sa.inspect(op.get_bind()).has_table('balance_snapshots'):
+        op.create_table(
+            'balance_snapshots',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('balance', sa.Integer(), nullable=False),
+            sa.Column('last_transaction_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        )
+    op.create_index(
+        'ix_balance_snapshots_user_id_last_transaction_id', 'balance_snapshots', ['user_id', 'last_transaction_id'],
+        if_not_exists=True
+    )
+
+    # Журнал раньше не велся: записываем текущие балансы как начальные операции,
+    # чтобы сумма журнала совпадала с users.tokens
+    op.execute("UPDATE users SET tokens = 0 WHERE tokens IS NULL")
+    op.execute(
+        "INSERT INTO transactions (user_id, amount, description, idempotency_key, balance_after, created_at) "
+        "SELECT id, tokens, 'Начальный баланс', 'opening:' || id, tokens, now() "
+        "FROM users WHERE tokens <> 0"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM transactions WHERE idempotency_key LIKE 'opening:%'")
+    op.drop_index('ix_balance_snapshots_user_id_last_transaction_id', table_name='balance_snapshots')
+    op.drop_table('balance_snapshots')
+    op.drop_index('ix_transactions_user_id_id', table_name='transactions')
+    op.drop_constraint('transactions_idempotency_key_key', 'transactions', type_='unique')
+    op.drop_column('transactions', 'balance_after')
+    op.drop_column('transactions', 'idempotency_key')
@@ -0,0 +1,30 @@
+"""partial index for VIP expiry, demote already expired VIPs
+
+Revision ID: 0004_vip_expiry
+Revises: 0003_ledger
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_vip_expiry'
+down_revision: Union[str, None] = '0003_ledger'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Раньше user_type не сбрасывался после окончания VIP
+    op.execute("UPDATE users SET user_type = 'REGULAR' WHERE user_type = 'VIP' AND (vip_until IS NULL OR vip_until <= now())")
+    op.create_index('ix_users_vip_until', 'users', ['vip_until'], postgresql_where=sa.text("user_type = 'VIP'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_vip_until', table_name='users')
@@ -0,0 +1,53 @@
+"""resumable broadcasts, blocked bot flag on users
+
+Revision ID: 0005_broadcasts
+Revises: 0004_vip_expiry
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_broadcasts'
+down_revision: Union[str, None] = '0004_vip_expiry'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('is_blocked_bot', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # Пустую таблицу мог создать create_all при запуске бота до перехода на миграции
+    if not sa.inspect(op.get_bind()).has_table('broadcasts'):
+        op.create_table(
+            'broadcasts',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.Column('target', sa.String(length=16), nullable=False),
+            sa.Column('city_id', sa.Integer(), sa.ForeignKey('cities.id'), nullable=True),
+            sa.Column('status', sa.String(length=16), nullable=False),
+            sa.Column('created_by', sa.BigInteger(), nullable=False),
+            sa.Column('last_user_id', sa.Integer(), nullable=False),
+            sa.Column('sent', sa.Integer(), nullable=False),
+            sa.Column('failed', sa.Integer(), nullable=False),
+            sa.Column('blocked', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+            sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+    op.create_index(
+        'ix_broadcasts_status_running', 'broadcasts', ['updated_at'], postgresql_where=sa.text("status = 'running'"),
+        if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_broadcasts_status_running', table_name='broadcasts')
+    op.drop_table('broadcasts')
+    op.drop_column('users', 'is_blocked_bot')
@@ -0,0 +1,32 @@
+"""unique rating per event, rater and rated user for upserts
+
+Revision ID: 0006_rating_upsert
+Revises: 0005_broadcasts
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_rating_upsert'
+down_revision: Union[str, None] = '0005_broadcasts'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Повторные оценки могли появиться при параллельных запросах: оставляем последнюю
+    op.execute(
+        "DELETE FROM ratings a USING ratings b "
+        "WHERE a.event_id = b.event_id AND a.rater_id = b.rater_id AND a.rated_id = b.rated_id AND a.id < b.id"
+    )
+    op.create_unique_constraint('uq_ratings_event_rater_rated', 'ratings', ['event_id', 'rater_id', 'rated_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_ratings_event_rater_rated', 'ratings', type_='unique')
@@ -0,0 +1,28 @@
+"""separate reputation column, rating keeps per-vote increments
+
+Revision ID: 0007_user_reputation
+Revises: 0006_rating_upsert
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_user_reputation'
+down_revision: Union[str, None] = '0006_rating_upsert'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('reputation', sa.Integer(), server_default='100', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'reputation')
@@ -0,0 +1,353 @@
+"""
+Многопроцессный режим бота.
+
+Процесс-приемщик получает обновления через long polling, не разбирая их
+в модели aiogram, и раздает сырые обновления N процессам-воркерам по кольцу
+консистентного хэширования от from_user.id. Пользователь всегда попадает
+на один и тот же воркер, поэтому состояние FSM (MemoryStorage) и кэши процесса
+остаются локальными. Внешний брокер не нужен: обновления передаются через
+multiprocessing.Pipe.
+
+Воркеры регулярно присылают heartbeat. Упавший или зависший воркер убирается
+из кольца (его пользователи временно переходят к соседям), перезапускается
+и возвращается в кольцо, как только сообщит о готовности.
+
+Запуск: BOT_WORKERS=4 python main.py
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from config import BOT_TOKEN, CLUSTER_SETTINGS
+from utils.hash_ring import HashRing
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+
+# Сообщения воркера приемщику
+MSG_READY = "ready"
+MSG_HEARTBEAT = "heartbeat"
+
+
+def get_shard_key(update: Dict[str, Any]) -> int:
+    """
+    Возвращает ключ распределения для сырого обновления Telegram.
+
+    Обычно это from.id пользователя; для обновлений без пользователя - ID чата,
+    а если нет и его - update_id.
+    """
+    for value in update.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if user:
+                return user["id"]
+            chat = value.get("chat") or (value.get("message") or {}).get("chat")
+            if chat:
+                return chat["id"]
+    return update["update_id"]
+
+
+# --- Воркер ---
+
+def worker_main(name: str, conn: Connection) -> None:
+    """Точка входа процесса-воркера"""
+    try:
+        asyncio.run(_run_worker(name, conn))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _run_worker(name: str, conn: Connection) -> None:
+    from aiogram import Bot
+    from main import prepare_database, build_dispatcher, start_worker_jobs
+    from database.db import session_stats
+    from utils.bot_session import BotSession
+
+    # Таблицы и справочник городов уже подготовил приемщик
+    if not await prepare_database(seed=False):
+        return
+
+    bot = Bot(token=BOT_TOKEN, session=BotSession())
+    dp = build_dispatcher()
+
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def on_readable() -> None:
+        try:
+            while conn.poll():
+                inbox.put_nowait(conn.recv())
+        except (EOFError, OSError):
+            # Приемщик завершился - останавливаемся
+            loop.remove_reader(conn.fileno())
+            inbox.put_nowait(None)
+
+    async def handle(raw_update: Dict[str, Any]) -> None:
+        try:
+            await dp.feed_raw_update(bot, raw_update)
+        except Exception as e:
+            logger.exception(f"[{name}] Ошибка при обработке обновления {raw_update.get('update_id')}: {e}")
+
+    processed = 0
+
+    async def heartbeat() -> None:
+        while True:
+            conn.send((MSG_HEARTBEAT, processed))
+            await asyncio.sleep(CLUSTER_SETTINGS["heartbeat_interval"])
+
+    loop.add_reader(conn.fileno(), on_readable)
+    conn.send((MSG_READY, None))
+    heartbeat_task = asyncio.create_task(heartbeat())
+    worker_jobs = start_worker_jobs()
+    logger.info(f"[{name}] Воркер запущен")
+
+    # Обновления обрабатываются параллельно; порядок внутри чата
+    # обеспечивает UpdateExecutor из build_dispatcher()
+    tasks = set()
+    try:
+        while True:
+            raw_update = await inbox.get()
+            if raw_update is None:
+                break
+            task = asyncio.create_task(handle(raw_update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            processed += 1
+    finally:
+        heartbeat_task.cancel()
+        for job in worker_jobs:
+            job.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"[{name}] Запросы к Bot API: {bot.session.stats()}")
+        await bot.session.close()
+        logger.info(f"[{name}] Сессии базы данных: {session_stats()}")
+        logger.info(f"[{name}] Воркер остановлен, обработано обновлений: {processed}")
+
+
+# --- Приемщик ---
+
+@dataclass
+class _Worker:
+    name: str
+    process: Optional[multiprocessing.Process] = None
+    conn: Optional[Connection] = None
+    outbox: asyncio.Queue = field(default_factory=asyncio.Queue)
+    sender: Optional[asyncio.Task] = None
+    ready: bool = False
+    last_seen: float = 0.0
+    processed: int = 0
+    restarts: int = 0
+
+
+class Cluster:
+    """Процесс-приемщик: получает обновления и распределяет их по воркерам"""
+
+    def __init__(self, workers: int = CLUSTER_SETTINGS["workers"]):
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: Dict[str, _Worker] = {f"worker-{i}": _Worker(f"worker-{i}") for i in range(workers)}
+        self._ring = HashRing(virtual_nodes=CLUSTER_SETTINGS["virtual_nodes"])
+        # Обновления, пришедшие, когда ни один воркер не готов
+        self._pending: List[Dict[str, Any]] = []
+
+    # Управление воркерами
+
+    def _start_worker(self, worker: _Worker) -> None:
+        loop = asyncio.get_running_loop()
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=worker_main, args=(worker.name, child_conn), name=worker.name, daemon=True)
+        process.start()
+        child_conn.close()
+
+        worker.process = process
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.last_seen = time.monotonic()
+        loop.add_reader(parent_conn.fileno(), self._on_worker_message, worker)
+        worker.sender = asyncio.create_task(self._send_loop(worker))
+
+    def _stop_worker(self, worker: _Worker) -> List[Dict[str, Any]]:
+        """Останавливает воркер и возвращает обновления, которые он не успел получить"""
+        loop = asyncio.get_running_loop()
+        self._ring.remove_node(worker.name)
+        worker.ready = False
+
+        if worker.sender:
+            worker.sender.cancel()
+        if worker.conn:
+            loop.remove_reader(worker.conn.fileno())
+            worker.conn.close()
+        if worker.process and worker.process.is_alive():
+            worker.process.kill()
+
+        leftovers = []
+        while not worker.outbox.empty():
+            leftovers.append(worker.outbox.get_nowait())
+        return leftovers
+
+    def _on_worker_message(self, worker: _Worker) -> None:
+        try:
+            while worker.conn.poll():
+                kind, payload = worker.conn.recv()
+                worker.last_seen = time.monotonic()
+                if kind == MSG_READY:
+                    worker.ready = True
+                    self._ring.add_node(worker.name)
+                    logger.info(f"{worker.name} готов, воркеров в кольце: {len(self._ring)}")
+                    self._flush_pending()
+                elif kind == MSG_HEARTBEAT:
+                    worker.processed = payload
+        except (EOFError, OSError):
+            # Воркер завершился; перезапуск выполнит проверка здоровья
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+
+    async def _send_loop(self, worker: _Worker) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            raw_update = await worker.outbox.get()
+            try:
+                # send() блокируется, пока воркер не вычитает pipe, поэтому выполняем его в потоке
+                await loop.run_in_executor(None, worker.conn.send, raw_update)
+            except (BrokenPipeError, OSError):
+                # Обновление вернется в распределение при перезапуске воркера
+                worker.outbox.put_nowait(raw_update)
+                return
+
+    async def _health_check(self) -> None:
+        while True:
+            await asyncio.sleep(CLUSTER_SETTINGS["heartbeat_interval"])
+            now = time.monotonic()
+            for worker in self._workers.values():
+                alive = worker.process.is_alive()
+                stale = now - worker.last_seen > CLUSTER_SETTINGS["heartbeat_timeout"]
+                if alive and not stale:
+                    continue
+
+                reason = "завершился" if not alive else "не отвечает"
+                logger.warning(f"{worker.name} {reason}, перезапуск")
+                leftovers = self._stop_worker(worker)
+                worker.restarts += 1
+                self._start_worker(worker)
+                # Пользователи упавшего воркера временно обслуживаются соседями
+                for raw_update in leftovers:
+                    self._dispatch(raw_update)
+
+    # Распределение обновлений
+
+    def _dispatch(self, raw_update: Dict[str, Any]) -> None:
+        name = self._ring.get_node(get_shard_key(raw_update))
+        if name is None:
+            self._pending.append(raw_update)
+            return
+        self._workers[name].outbox.put_nowait(raw_update)
+
+    def _flush_pending(self) -> None:
+        pending, self._pending = self._pending, []
+        for raw_update in pending:
+            self._dispatch(raw_update)
+
+    async def _poll(self, http: aiohttp.ClientSession, allowed_updates: List[str]) -> None:
+        timeout = CLUSTER_SETTINGS["polling_timeout"]
+        offset = None
+        while True:
+            params = {"timeout": timeout, "allowed_updates": json.dumps(allowed_updates)}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with http.get(
+                    f"{TELEGRAM_API_URL}/getUpdates",
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=timeout + 10)
+                ) as response:
+                    payload = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not payload.get("ok"):
+                logger.warning(f"Telegram вернул ошибку: {payload.get('description')}")
+                await asyncio.sleep(1)
+                continue
+
+            for raw_update in payload["result"]:
+                offset = raw_update["update_id"] + 1
+                self._dispatch(raw_update)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние воркеров: готовность, очередь на отправку, обработано, перезапуски"""
+        return {
+            worker.name: {
+                "ready": worker.ready,
+                "queued": worker.outbox.qsize(),
+                "processed": worker.processed,
+                "restarts": worker.restarts,
+            }
+            for worker in self._workers.values()
+        }
+
+    async def run(self) -> None:
+        from aiogram import Bot
+        from database import db
+        from main import ALLOWED_UPDATES, prepare_database, set_commands, start_background_jobs
+        from utils.bot_session import BotSession
+
+        # Таблицы и справочник городов готовим один раз, до запуска воркеров
+        # Соединения приемщику не нужны: движок закрывается сразу после подготовки
+        if not await prepare_database(warm_up=False):
+            return
+        await db.engine.dispose()
+
+        # Бот приемщика нужен для настройки и фоновых задач, обновления он не обрабатывает
+        bot = Bot(token=BOT_TOKEN, session=BotSession())
+        try:
+            await set_commands(bot)
+        except Exception as e:
+            logger.warning(f"Не удалось установить команды бота: {e}")
+        await bot.delete_webhook(drop_pending_updates=True)
+
+        for worker in self._workers.values():
+            self._start_worker(worker)
+        logger.info(f"🚀 Запуск кластера: воркеров {len(self._workers)}")
+
+        health_task = asyncio.create_task(self._health_check())
+        background_jobs = start_background_jobs(bot)
+        try:
+            async with aiohttp.ClientSession() as http:
+                await self._poll(http, ALLOWED_UPDATES)
+        finally:
+            health_task.cancel()
+            for job in background_jobs:
+                job.cancel()
+            logger.info(f"Запросы к Bot API приемщика: {bot.session.stats()}")
+            await bot.session.close()
+            logger.info(f"Статистика воркеров: {self.stats()}")
+            for worker in self._workers.values():
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+            for worker in self._workers.values():
+                worker.process.join(timeout=10)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+
+def run_cluster() -> None:
+    """Запускает приемщик и воркеры"""
+    asyncio.run(Cluster().run())
+
+
+if __name__ == "__main__":
+    try:
+        run_cluster()
+    except KeyboardInterrupt:
+        logger.info("Кластер остановлен пользователем")
@@ -43,6 +43,19 @@ MIN_RATING_TO_VIEW = 0  # Минимальный рейтинг для прос
 # Стоимость VIP в токенах
 VIP_COST = 1500
 
+# Настройки окончания VIP-статуса
+VIP_SETTINGS = {
+    "expiry_check_interval": 300,  # Как часто понижать истекшие VIP (секунды)
+    "notice_batch_size": 25,  # Уведомлений об окончании VIP в одной пачке
+    "notice_batch_pause": 1,  # Пауза между пачками (секунды), лимит Telegram ~30 сообщений в секунду
+}
+
+# Настройки журнала токенов
+LEDGER_SETTINGS = {
+    "snapshot_interval": 3600,  # Как часто снимать балансы пользователей (секунды)
+    "snapshot_lag": 60,  # Операции моложе этого возраста (секунды) попадут в следующий снимок
+}
+
 # Настройки для рейтинга
 RATING_IMPACT = {
     1: -10,  # Одна звезда: -10 к рейтингу
@@ -52,6 +65,33 @@ RATING_IMPACT = {
     5: 10    # Пять звезд: +10 к рейтингу
 }
 
+# Настройки пересчета репутации по графу оценок
+REPUTATION_SETTINGS = {
+    "interval": 24 * 60 * 60,  # Как часто пересчитывать репутацию (секунды)
+    "prior_weight": 5.0,  # Вес нейтральной оценки 3 в среднем балле каждого пользователя
+    "reciprocal_weight": 0.5,  # Вес оценки, если пользователи оценили друг друга
+    "max_iterations": 50,  # Максимум итераций до сходимости
+    "tolerance": 1e-4,  # Точность сходимости среднего балла
+    "load_batch_size": 100000,  # Строк оценок за одну выборку курсора
+}
+
+# Настройки ранжирования ленты мероприятий
+RANKING_SETTINGS = {
+    "page_size": 10,  # Сколько мероприятий показываем за раз (дальше - кнопка "Показать еще")
+    "cache_ttl": 60,  # Время жизни ленты пользователя в кэше (секунды)
+    "cache_size": 10000,  # Максимум лент (пользователь + город) в кэше
+    "time_half_life_hours": 72,  # Через сколько часов до начала близость по времени падает вдвое
+    "fill_saturation": 5,  # Участников, при которых мероприятие без лимита считается наполовину заполненным
+    # Веса признаков в итоговой оценке
+    "weights": {
+        "purpose": 0.35,  # Совпадение цели с прошлыми участиями
+        "creator_rating": 0.2,  # Репутация организатора (users.reputation)
+        "fill": 0.15,  # Заполненность
+        "time": 0.2,  # Близость по времени
+        "age": 0.1,  # Соответствие возрасту
+    },
+}
+
 # РАСШИРЕННЫЙ список популярных городов России
 POPULAR_CITIES = [
     # Миллионники
@@ -143,6 +183,103 @@ POPULAR_CITIES = [
     "Бийск"
 ]
 
+# Сокращения и разговорные названия городов (регистр, дефисы и "ё" не важны)
+CITY_ALIASES = {
+    "мск": "Москва",
+    "спб": "Санкт-Петербург",
+    "питер": "Санкт-Петербург",
+    "петербург": "Санкт-Петербург",
+    "ленинград": "Санкт-Петербург",
+    "нск": "Новосибирск",
+    "новосиб": "Новосибирск",
+    "екб": "Екатеринбург",
+    "екат": "Екатеринбург",
+    "нн": "Нижний Новгород",
+    "нижний": "Нижний Новгород",
+    "челяба": "Челябинск",
+    "ростов": "Ростов-на-Дону",
+    "ростов на дону": "Ростов-на-Дону",
+    "влад": "Владивосток",
+    "владик": "Владивосток",
+    "тлт": "Тольятти",
+    "кенигсберг": "Калининград",
+    "комсомольск": "Комсомольск-на-Амуре",
+}
+
+# Администраторы бота (Telegram ID через запятую)
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()}
+
+# Настройки выгрузки данных для аналитики
+EXPORT_SETTINGS = {
+    "batch_size": 5000,  # Строк за одну выборку серверного курсора
+    "max_document_size": 50 * 1024 * 1024,  # Лимит Telegram на отправку файла ботом
+}
+
+# Настройки рассылок администратора
+BROADCAST_SETTINGS = {
+    "rate": 25,  # Сообщений в секунду (общий лимит Telegram - около 30)
+    "batch_size": 500,  # Получателей между контрольными точками
+    "resume_interval": 5,  # Как часто запускать рассылки из очереди и искать прерванные (секунды)
+    "stale_timeout": 300,  # Рассылка без контрольной точки дольше этого времени считается прерванной
+}
+
+# Настройки шины инвалидации кэшей между процессами (Postgres LISTEN/NOTIFY)
+INVALIDATION_SETTINGS = {
+    "channel": "cache_invalidation",  # Канал NOTIFY
+    "keepalive_interval": 30,  # Как часто проверять соединение слушателя (секунды)
+    "reconnect_delay": 5,  # Пауза перед переподключением (секунды)
+}
+
+# Настройки кэша списков мероприятий города
+LISTING_CACHE_SETTINGS = {
+    "page_size": 200,  # Мероприятий на странице списка; лента пользователя дочитывает страницы по одной, по мере листания
+    "ttl": 15,  # Сколько секунд список считается свежим
+    "stale_ttl": 60,  # Сколько еще секунд устаревший список отдается, пока он обновляется в фоне
+    "cache_size": 5000,  # Максимум списков (город, страница, фильтры) в памяти
+}
+
+# Настройки исполнителя обновлений
+EXECUTOR_SETTINGS = {
+    "max_concurrency": int(os.getenv("EXECUTOR_MAX_CONCURRENCY", 32)),  # Одновременно обрабатываемых чатов
+    "queue_warning_depth": 10,  # Длина очереди одного чата, при которой пишем предупреждение
+}
+
+# Настройки многопроцессного режима (BOT_WORKERS > 1 включает кластер)
+CLUSTER_SETTINGS = {
+    "workers": int(os.getenv("BOT_WORKERS", 1)),  # Количество процессов-воркеров
+    "virtual_nodes": 128,  # Виртуальных узлов на воркера в кольце консистентного хэширования
+    "heartbeat_interval": 5,  # Как часто воркер сообщает о себе (секунды)
+    "heartbeat_timeout": 30,  # Через сколько секунд без сигнала воркер перезапускается
+    "polling_timeout": 30,  # Таймаут long polling в процессе-приемщике
+}
+
+# Настройки HTTP-сессии Bot API
+BOT_SESSION_SETTINGS = {
+    "timeout": 30,  # Таймаут запроса по умолчанию (секунды)
+    # Таймауты отдельных методов: быстрые ответы пользователю - короче, загрузка файлов - дольше
+    "method_timeouts": {
+        "answerCallbackQuery": 5,
+        "sendMessage": 15,
+        "editMessageText": 15,
+        "editMessageReplyMarkup": 15,
+        "deleteMessage": 10,
+        "sendPhoto": 60,
+        "sendDocument": 120,
+    },
+    "connection_limit": 100,  # Одновременных соединений с Bot API
+    "keepalive_timeout": 60,  # Сколько держать простаивающее соединение открытым (секунды)
+    "dns_cache_ttl": 300,  # Сколько кэшировать адрес api.telegram.org (секунды), 0 - не кэшировать
+    "slow_call": 1.0,  # Запрос дольше стольких секунд считается медленным
+}
+
+# Настройки запуска бота
+STARTUP_SETTINGS = {
+    # Схему ведет alembic (python create_tables.py перед запуском, см. Dockerfile);
+    # create_all при запуске - только для локальной разработки: DB_CREATE_TABLES=1
+    "create_tables": os.getenv("DB_CREATE_TABLES", "0") == "1",
+    "warm_connections": 5,  # Сколько соединений с базой данных открыть заранее
+}
+
 # Настройки для уведомлений
 NOTIFICATION_SETTINGS = {
     "event_reminder_hours": 2,  # За сколько часов напоминать о мероприятии
@@ -162,3 +299,55 @@ SECURITY_SETTINGS = {
     "max_events_per_day": 5,  # Максимум мероприятий в день для одного пользователя
     "max_registrations_per_day": 10,  # Максимум регистраций в день
 }
+
+# Контроль количества SQL-запросов на обновление
+QUERY_BUDGET_SETTINGS = {
+    # off - без подсчета (production), warn - предупреждение в логе, raise - ошибка (тесты и разработка)
+    "mode": os.getenv("QUERY_BUDGET_MODE", "off"),
+    "default": 15,  # Бюджет обработчиков без флага query_budget
+    "keep_statements": 10,  # Сколько первых запросов показывать в сообщении о превышении
+}
+
+# Настройки логирования
+LOGGING_SETTINGS = {
+    "level": os.getenv("LOG_LEVEL", "INFO"),
+    "format": os.getenv("LOG_FORMAT", "json"),  # "json" - одна строка JSON на запись, "text" - для чтения глазами
+    "slow_update": 1.0,  # Обновление дольше стольких секунд записывается предупреждением
+    # Доля сохраняемых INFO-записей по логгерам; предупреждения и ошибки сохраняются всегда
+    "sampling": {"middlewares.log_context": 0.1},
+}
+
+# Настройки контроля задержек цикла событий
+LOOP_MONITOR_SETTINGS = {
+    "interval": 0.5,  # Как часто измерять задержку цикла (секунды)
+    "lag_warning": 0.1,  # Задержка, при которой пишется предупреждение (секунды)
+    "stall_threshold": 0.5,  # Остановка цикла дольше стольких секунд записывается со стеком
+    "asyncio_debug": os.getenv("ASYNCIO_DEBUG") == "1",  # Отладочный режим asyncio: медленно, только для разработки
+    "profile_hz": 100,  # Снимков стека в секунду при профилировании
+    "profile_seconds": 30,  # Длительность профилирования по сигналу SIGUSR1
+    "max_profile_seconds": 300,  # Предел длительности для команды /profile_loop
+    "profile_dir": os.getenv("PROFILE_DIR", "profiles"),  # Куда сохранять профили
+}
+
+# Настройки контроля сессий базы данных (AsyncSessionContext)
+SESSION_SETTINGS = {
+    "warn_after": 10,  # Сессия, открытая дольше стольких секунд, попадает в лог
+    "check_interval": 5,  # Как часто проверять открытые сессии (секунды)
+}
+
+# Настройки защиты от флуда
+THROTTLING_SETTINGS = {
+    "rate": 1.0,  # Сколько единиц стоимости в секунду восстанавливается у пользователя
+    "burst": 8,  # Запас на серию быстрых нажатий
+    "overload_waiting": 200,  # Обновлений в очереди, при которых бот считается перегруженным
+    "notice_interval": 10,  # Не чаще раза в столько секунд сообщаем пользователю об ограничении
+    "purge_interval": 600,  # Как часто удалять данные неактивных пользователей (секунды)
+}
+
+# Настройки проверки лимитов SECURITY_SETTINGS
+QUOTA_SETTINGS = {
+    "window": 24 * 60 * 60,  # Скользящее окно лимитов (секунды)
+    "purge_interval": 3600,  # Как часто удалять счетчики неактивных пользователей (секунды)
+    # Redis нужен, только если пользователя обслуживают несколько независимых экземпляров бота
+    "redis_url": os.getenv("REDIS_URL"),
+}
@@ -1,12 +1,52 @@
+"""
+Подготовка схемы базы данных перед запуском бота (python create_tables.py).
+
+Пустая база данных создается по моделям (create_all) и помечается последней
+миграцией alembic; существующая обновляется миграциями: alembic upgrade head.
+"""
 import asyncio
-from sqlalchemy import text
-from database.db import engine
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from database import db
 from database.models import Base
 
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+async def create_tables() -> bool:
+    """
+    Создает таблицы, если база данных пустая.
+
+    Returns:
+        True, если таблицы созданы (миграции применять не нужно)
+    """
+    await db.init_db(create_tables=False)
+    try:
+        async with db.engine.begin() as conn:
+            tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+            if "users" in tables:
+                return False
+            await conn.run_sync(Base.metadata.create_all)
+            return True
+    finally:
+        await db.engine.dispose()
+
+
+def prepare_schema() -> None:
+    """Создает схему пустой базы данных или применяет к существующей миграции alembic"""
+    config = Config(ALEMBIC_INI)
+    # Миграции запускают свой цикл событий, поэтому alembic вызываем вне asyncio.run
+    if asyncio.run(create_tables()):
+        command.stamp(config, "head")
         print("Таблицы успешно созданы!")
+    else:
+        command.upgrade(config, "head")
+        print("Миграции применены!")
+
 
 if __name__ == "__main__":
-    asyncio.run(create_tables())
+    prepare_schema()
@@ -1,7 +1,14 @@
 import os
+import sys
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from sqlalchemy import MetaData
+from sqlalchemy.engine import make_url
 
 # --- Глобальные переменные для движка и фабрики сессий ---
 engine = None
@@ -9,16 +16,15 @@ async_session_maker = None
 Base = declarative_base() # Базовая модель для декларативного объявления таблиц
 metadata = MetaData() # MetaData для работы с таблицами (если она вам нужна отдельно от Base.metadata)
 
-# --- Инициализация базы данных ---
-async def init_db():
-    """
-    Инициализирует подключение к базе данных, создает движок,
-    фабрику сессий и, при необходимости, таблицы.
+logger = logging.getLogger(__name__)
+
+def get_database_url() -> str:
     """
-    global engine, async_session_maker
+    Возвращает DATABASE_URL с драйвером asyncpg.
 
-    # 1. Получаем DATABASE_URL из переменных окружения
-    # Это самое важное для Railway.
+    Railway дает URL в формате postgres:// или postgresql://,
+    а SQLAlchemy с asyncpg требует postgresql+asyncpg://
+    """
     database_url = os.getenv("DATABASE_URL")
 
     if not database_url:
@@ -26,15 +32,29 @@ async def init_db():
         # На Railway это будет означать проблему с конфигурацией.
         raise ValueError("DATABASE_URL environment variable is not set. Cannot initialize database.")
 
-    # 2. Исправляем URL для использования asyncpg вместо psycopg2
-    # Railway дает URL в формате postgres:// или postgresql://,
-    # а SQLAlchemy с asyncpg требует postgresql+asyncpg://
     if database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql+asyncpg://", 1)
     elif database_url.startswith("postgresql://") and "+asyncpg" not in database_url:
         database_url = database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return database_url
+
+# --- Инициализация базы данных ---
+async def init_db(create_tables: bool = True):
+    """
+    Инициализирует подключение к базе данных, создает движок,
+    фабрику сессий и, при необходимости, таблицы.
+    
+    Args:
+        create_tables: Создавать ли отсутствующие таблицы (воркеры кластера
+            подключаются к уже подготовленной базе и таблицы не трогают)
+    """
+    global engine, async_session_maker
 
-    print(f"DEBUG: Инициализация базы данных с URL: {database_url}") # Лог для отладки
+    # 1-2. Получаем DATABASE_URL из переменных окружения (это самое важное для Railway)
+    # с драйвером asyncpg вместо psycopg2
+    database_url = get_database_url()
+
+    logger.info(f"Инициализация базы данных: {make_url(database_url).render_as_string(hide_password=True)}")
 
     # 3. Создаем асинхронный движок SQLAlchemy
     # echo=False для production, future=True - хорошая практика для SQLAlchemy 2.0
@@ -49,16 +69,17 @@ async def init_db():
 
     # 4. Создаем все таблицы, если их нет
     # Это важно делать после создания engine.
-    try:
-        async with engine.begin() as conn:
-            # Base.metadata.create_all создаст таблицы, определенные через Base.
-            # Благодаря импорту `models` ниже, Base.metadata "увидит" все ваши модели.
-            await conn.run_sync(Base.metadata.create_all)
-        print("База данных успешно инициализирована и таблицы созданы/проверены.")
-    except Exception as e:
-        print(f"ОШИБКА при создании таблиц базы данных: {e}")
-        # Перевыбрасываем исключение, чтобы бот не запускался без БД
-        raise e
+    if create_tables:
+        try:
+            async with engine.begin() as conn:
+                # Base.metadata.create_all создаст таблицы, определенные через Base.
+                # Благодаря импорту `models` ниже, Base.metadata "увидит" все ваши модели.
+                await conn.run_sync(Base.metadata.create_all)
+            logger.info("Таблицы базы данных созданы/проверены")
+        except Exception as e:
+            logger.error(f"ОШИБКА при создании таблиц базы данных: {e}")
+            # Перевыбрасываем исключение, чтобы бот не запускался без БД
+            raise e
 
     # 5. Создаем фабрику для асинхронных сессий
     async_session_maker = async_sessionmaker(
@@ -69,31 +90,51 @@ async def init_db():
         autocommit=False, # Обычно False, чтобы явно управлять транзакциями
     )
 
-# --- ИСПРАВЛЕННАЯ функция для получения асинхронной сессии ---
-def get_async_session():
+# --- Прогрев пула соединений ---
+async def warm_up_pool(size: int) -> int:
     """
-    Функция для получения новой сессии базы данных.
-    Возвращает объект AsyncSession, который нужно закрывать после использования.
+    Заранее открывает соединения пула, чтобы первые обновления после запуска
+    не ждали подключения к базе данных.
     
-    Использование:
-    session = get_async_session()
-    try:
-        # работа с сессией
-        result = await session.execute(query)
-        await session.commit()
-    finally:
-        await session.close()
-    """
-    if async_session_maker is None:
-        raise RuntimeError("Database session maker is not initialized. Call init_db() first.")
+    Args:
+        size: Сколько соединений открыть (не больше размера пула)
     
-    return async_session_maker()
+    Returns:
+        Количество открытых соединений
+    """
+    if engine is None:
+        raise RuntimeError("Database engine is not initialized. Call init_db() first.")
+    size = min(size, engine.sync_engine.pool.size())
+    # Соединения держим открытыми одновременно, иначе пул вернет одно и то же
+    results = await asyncio.gather(*(engine.connect().start() for _ in range(size)), return_exceptions=True)
+    connections = [result for result in results if not isinstance(result, BaseException)]
+    await asyncio.gather(*(connection.close() for connection in connections))
+    if len(connections) < size:
+        logger.warning(f"Прогрев пула: открыто {len(connections)} из {size} соединений")
+    return len(connections)
 
-# --- Контекстный менеджер для сессии (альтернативный способ) ---
+# --- Учет открытых сессий ---
+@dataclass
+class _OpenSession:
+    session: AsyncSession
+    owner: str  # Функция, открывшая сессию
+    opened_at: float
+    warned: bool = False
+
+# Сессии, открытые через AsyncSessionContext: id(сессии) -> сведения о ней
+_open_sessions: Dict[int, _OpenSession] = {}
+_session_counters = {"opened": 0, "max_open": 0, "long_lived": 0}
+
+# --- Единый способ работы с сессией (unit of work) ---
 class AsyncSessionContext:
     """
     Асинхронный контекстный менеджер для сессии базы данных.
     
+    Единственный способ получить сессию: транзакцию фиксирует вызывающий код
+    через session.commit(), при исключении она откатывается, при выходе
+    сессия всегда закрывается и возвращает соединение в пул. Открытые сессии
+    учитываются, долгие находит check_sessions().
+    
     Использование:
     async with AsyncSessionContext() as session:
         result = await session.execute(query)
@@ -104,55 +145,67 @@ class AsyncSessionContext:
         if async_session_maker is None:
             raise RuntimeError("Database session maker is not initialized. Call init_db() first.")
         self.session = None
+        # Кто открыл сессию - для предупреждений о долгих сессиях
+        caller = sys._getframe(1)
+        self.owner = f"{caller.f_globals.get('__name__')}.{caller.f_code.co_name}"
     
     async def __aenter__(self):
         self.session = async_session_maker()
+        _open_sessions[id(self.session)] = _OpenSession(self.session, self.owner, time.monotonic())
+        _session_counters["opened"] += 1
+        _session_counters["max_open"] = max(_session_counters["max_open"], len(_open_sessions))
         return self.session
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
-            if exc_type:
-                await self.session.rollback()
-            await self.session.close()
+            try:
+                if exc_type:
+                    await self.session.rollback()
+                await self.session.close()
+            finally:
+                _open_sessions.pop(id(self.session), None)
 
-# --- Вспомогательная функция для безопасной работы с сессией ---
-async def safe_session_execute(operation):
+def check_sessions(warn_after: float) -> List[str]:
     """
-    Безопасное выполнение операции с базой данных.
+    Находит сессии, открытые дольше warn_after секунд, и пишет о них в лог (один раз на сессию).
     
-    Args:
-        operation: async функция, которая принимает session и выполняет операции с БД
+    Долгая сессия с открытой транзакцией держит соединение пула и блокировки;
+    если таких много, обработчики начинают ждать свободное соединение.
     
     Returns:
-        Результат операции или None в случае ошибки
-    
-    Example:
-        async def my_operation(session):
-            result = await session.execute(select(User).where(User.id == 1))
-            return result.scalar_one_or_none()
-        
-        user = await safe_session_execute(my_operation)
+        Владельцы найденных долгих сессий
     """
-    session = None
-    try:
-        session = get_async_session()
-        result = await operation(session)
-        await session.commit()
-        return result
-    except Exception as e:
-        if session:
-            await session.rollback()
-        print(f"Ошибка при выполнении операции с БД: {e}")
-        raise e
-    finally:
-        if session:
-            await session.close()
+    now = time.monotonic()
+    owners = []
+    for info in _open_sessions.values():
+        age = now - info.opened_at
+        if age < warn_after or info.warned:
+            continue
+        info.warned = True
+        _session_counters["long_lived"] += 1
+        owners.append(info.owner)
+        state = "с открытой транзакцией" if info.session.in_transaction() else "без транзакции"
+        logger.warning(f"Сессия из {info.owner} открыта {age:.0f} с ({state})")
+    return owners
+
+def session_stats() -> Dict[str, Any]:
+    """Открытые сессии, сессии с транзакцией, состояние пула соединений"""
+    stats = {
+        "open": len(_open_sessions),
+        "in_transaction": sum(1 for info in _open_sessions.values() if info.session.in_transaction()),
+        **_session_counters,
+    }
+    if engine is not None:
+        pool = engine.sync_engine.pool
+        stats["pool_checked_out"] = pool.checkedout()
+        stats["pool_size"] = pool.size()
+    return stats
 
 # --- ОБЯЗАТЕЛЬНО: Импортируем ваш файл models.py, где определены все модели ---
 # Это позволяет SQLAlchemy обнаружить все модели, наследующие от Base,
 # и создать для них таблицы при вызове Base.metadata.create_all().
 try:
     from database import models # Импортируем models.py, который находится в той же папке database
-    print("Модели базы данных успешно импортированы")
+    logger.debug("Модели базы данных успешно импортированы")
 except ImportError as e:
-    print(f"ПРЕДУПРЕЖДЕНИЕ: Не удалось импортировать модели: {e}")
+    logger.warning(f"Не удалось импортировать модели: {e}")
@@ -3,8 +3,10 @@ from enum import Enum
 from typing import List, Optional
 from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Table, Enum as SQLEnum, Text
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Table, Enum as SQLEnum, Text, BigInteger
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Table, Enum as SQLEnum, Text, BigInteger, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 
 # ИСПРАВЛЕНО: Импортируем Base из db.py вместо создания нового
 from .db import Base
@@ -15,7 +17,10 @@ event_participants = Table(
     Base.metadata,
     Column("user_id", Integer, ForeignKey("users.id")),
     Column("event_id", Integer, ForeignKey("events.id")),
-    Column("registration_time", DateTime, default=func.now())
+    Column("registration_time", DateTime, default=func.now()),
+    # Проверка "уже зарегистрирован" и подсчет участников идут по этому индексу
+    Index("uq_event_participants_event_user", "event_id", "user_id", unique=True),
+    Index("ix_event_participants_user_id", "user_id")
 )
 
 # Перечисления для различных полей
@@ -40,6 +45,14 @@ class UserType(str, Enum):
     REGULAR = "regular"  # Обычный пользователь
     VIP = "vip"  # VIP-пользователь
 
+class City(Base):
+    __tablename__ = "cities"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64), unique=True, nullable=False)  # Каноническое название города
+    aliases = Column(ARRAY(String), nullable=False, default=list)  # Сокращения и разговорные названия
+    created_at = Column(DateTime, default=func.now())
+
 class User(Base):
     __tablename__ = "users"
     
@@ -48,37 +61,54 @@ class User(Base):
     username = Column(String, nullable=True)
     first_name = Column(String)
     last_name = Column(String, nullable=True)
-    city = Column(String)
+    city_id = Column(Integer, ForeignKey("cities.id"), index=True)
     display_name = Column(String)  # Имя, которое показывается в профиле
     age = Column(Integer)
     gender = Column(SQLEnum(Gender))
     about = Column(Text, nullable=True)
     rating = Column(Integer, default=100)  # Рейтинг пользователя, по умолчанию 100
+    reputation = Column(Integer, default=100, server_default="100", nullable=False)  # Репутация по всему графу оценок (пересчитывается фоновой задачей)
     tokens = Column(Integer, default=0)  # Количество токенов
     user_type = Column(SQLEnum(UserType), default=UserType.REGULAR)
     vip_until = Column(DateTime, nullable=True)  # Срок действия VIP-статуса
+    is_blocked_bot = Column(Boolean, default=False, nullable=False)  # Пользователь заблокировал бота (рассылки его пропускают)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
-    # Отношения
-    created_events = relationship("Event", back_populates="creator")
+    __table_args__ = (
+        # Поиск истекших VIP: индексируются только VIP-пользователи
+        Index("ix_users_vip_until", "vip_until", postgresql_where=user_type == UserType.VIP),
+    )
+    
+    # Отношения. Неявная ленивая загрузка в AsyncSession невозможна (MissingGreenlet),
+    # поэтому она запрещена: нужные связи загружаются явно через selectinload/joinedload
+    city = relationship("City", lazy="joined")
+    created_events = relationship("Event", back_populates="creator", lazy="raise")
     participated_events = relationship(
         "Event", 
         secondary=event_participants, 
-        back_populates="participants"
+        back_populates="participants",
+        lazy="raise"
     )
-    given_ratings = relationship("Rating", foreign_keys="[Rating.rater_id]", back_populates="rater")
-    received_ratings = relationship("Rating", foreign_keys="[Rating.rated_id]", back_populates="rated")
-    transactions = relationship("Transaction", back_populates="user")
+    given_ratings = relationship("Rating", foreign_keys="[Rating.rater_id]", back_populates="rater", lazy="raise")
+    received_ratings = relationship("Rating", foreign_keys="[Rating.rated_id]", back_populates="rated", lazy="raise")
+    transactions = relationship("Transaction", back_populates="user", lazy="raise")
 
-    @property
+    @hybrid_property
     def is_vip(self):
+        # До ближайшего запуска expire_vip_statuses истекший VIP еще может храниться
+        # с user_type=VIP, поэтому в Python дополнительно проверяем срок
         if self.user_type != UserType.VIP:
             return False
         if not self.vip_until:
             return False
         return self.vip_until > datetime.now()
     
+    @is_vip.expression
+    def is_vip(cls):
+        # Истекшие VIP понижаются периодической задачей, в запросах достаточно user_type
+        return cls.user_type == UserType.VIP
+    
     def activate_vip(self, duration_days=30):
         """Активировать VIP-статус"""
         self.user_type = UserType.VIP
@@ -105,7 +135,7 @@ class Event(Base):
     id = Column(Integer, primary_key=True)
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
-    city = Column(String, nullable=False)
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=False)
     purpose = Column(SQLEnum(EventPurpose), nullable=False)
     target_audience = Column(SQLEnum(EventTargetAudience), nullable=False)
     min_age = Column(Integer, nullable=True)  # Минимальный возраст участников
@@ -117,18 +147,25 @@ class Event(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    __table_args__ = (
+        # Поиск мероприятий: город + предстоящие даты
+        Index("ix_events_city_id_event_date", "city_id", "event_date"),
+    )
+    
     # Отношения
-    creator = relationship("User", back_populates="created_events")
+    city = relationship("City", lazy="joined")
+    creator = relationship("User", back_populates="created_events", lazy="raise")
     participants = relationship(
         "User", 
         secondary=event_participants, 
-        back_populates="participated_events"
+        back_populates="participated_events",
+        lazy="raise"
     )
-    ratings = relationship("Rating", back_populates="event")
+    ratings = relationship("Rating", back_populates="event", lazy="raise")
     
     @property
     def is_full(self):
-        """Проверка, заполнено ли мероприятие"""
+        """Проверка, заполнено ли мероприятие (participants должны быть загружены через selectinload)"""
         if not self.max_participants:
             return False
         return len(self.participants) >= self.max_participants
@@ -171,19 +208,70 @@ class Rating(Base):
     comment = Column(Text, nullable=True)
     created_at = Column(DateTime, default=func.now())
     
+    __table_args__ = (
+        # Одна оценка участника от одного пользователя в рамках мероприятия (для upsert в rate_user)
+        UniqueConstraint("event_id", "rater_id", "rated_id", name="uq_ratings_event_rater_rated"),
+    )
+    
     # Отношения
-    event = relationship("Event", back_populates="ratings")
-    rater = relationship("User", foreign_keys=[rater_id], back_populates="given_ratings")
-    rated = relationship("User", foreign_keys=[rated_id], back_populates="received_ratings")
+    event = relationship("Event", back_populates="ratings", lazy="raise")
+    rater = relationship("User", foreign_keys=[rater_id], back_populates="given_ratings", lazy="raise")
+    rated = relationship("User", foreign_keys=[rated_id], back_populates="received_ratings", lazy="raise")
 
 class Transaction(Base):
+    """Запись журнала токенов: строки только добавляются и не изменяются"""
     __tablename__ = "transactions"
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     amount = Column(Integer, nullable=False)  # Сумма транзакции (может быть положительной или отрицательной)
     description = Column(String, nullable=False)
+    idempotency_key = Column(String(128), unique=True, nullable=True)  # Защита от повторного применения операции
+    balance_after = Column(Integer, nullable=True)  # Баланс пользователя после операции
     created_at = Column(DateTime, default=func.now())
     
+    __table_args__ = (
+        # История и сумма операций пользователя после снимка баланса
+        Index("ix_transactions_user_id_id", "user_id", "id"),
+    )
+    
     # ИСПРАВЛЕНО: Добавлен back_populates
-    user = relationship("User", back_populates="transactions")
+    user = relationship("User", back_populates="transactions", lazy="raise")
+
+class BalanceSnapshot(Base):
+    """Снимок баланса: сумма журнала токенов пользователя до транзакции last_transaction_id включительно"""
+    __tablename__ = "balance_snapshots"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    balance = Column(Integer, nullable=False)
+    last_transaction_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        # Последний снимок пользователя
+        Index("ix_balance_snapshots_user_id_last_transaction_id", "user_id", "last_transaction_id"),
+    )
+
+class Broadcast(Base):
+    """Рассылка сообщения пользователям с контрольной точкой для продолжения после сбоя"""
+    __tablename__ = "broadcasts"
+    
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    target = Column(String(16), nullable=False)  # Кому: all, vip или city
+    city_id = Column(Integer, ForeignKey("cities.id"), nullable=True)  # Город для target=city
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, done или cancelled
+    created_by = Column(BigInteger, nullable=False)  # Telegram ID администратора
+    last_user_id = Column(Integer, nullable=False, default=0)  # Контрольная точка: ID последнего обработанного пользователя
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())  # Обновляется на каждой контрольной точке
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Поиск незавершенных рассылок при старте
+        Index("ix_broadcasts_status_running", "updated_at", postgresql_where=status == "running"),
+    )
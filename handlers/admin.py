@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import time
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, FSInputFile
+
+from config import ADMIN_IDS, BROADCAST_SETTINGS, EXPORT_SETTINGS, LOOP_MONITOR_SETTINGS
+from database.db import AsyncSessionContext
+from services.export_service import export_table, split_file, EXPORT_TABLES, EXPORT_FORMATS
+from services.broadcast_service import (
+    create_broadcast, cancel_broadcast, get_recent_broadcasts,
+    TARGET_ALL, TARGET_VIP, TARGET_CITY
+)
+from services.city_service import find_city, get_city_name
+from utils.loop_monitor import loop_monitor
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+# Все команды роутера доступны только администраторам
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+# Ссылки на выполняющиеся выгрузки и профилирования, чтобы задачи не были удалены сборщиком мусора
+_background_tasks = set()
+
+async def run_export(bot: Bot, chat_id: int, table_name: str, fmt: str):
+    """Выполняет выгрузку в фоне и отправляет файл в чат администратора"""
+    started = time.monotonic()
+    paths = []
+    try:
+        async with AsyncSessionContext() as session:
+            path = await export_table(session, table_name, fmt)
+        paths = [path]
+        
+        filename = f"{table_name}.{fmt}.gz"
+        if os.path.getsize(path) <= EXPORT_SETTINGS["max_document_size"]:
+            await bot.send_document(
+                chat_id,
+                FSInputFile(path, filename=filename),
+                caption=f"Выгрузка {table_name} ({fmt}), {time.monotonic() - started:.1f} с"
+            )
+            return
+        
+        # Больше лимита Telegram для ботов: отправляем частями
+        paths = await asyncio.to_thread(split_file, path, EXPORT_SETTINGS["max_document_size"])
+        for number, part_path in enumerate(paths, start=1):
+            await bot.send_document(
+                chat_id,
+                FSInputFile(part_path, filename=f"{filename}.part{number:03d}"),
+                caption=f"Выгрузка {table_name} ({fmt}), часть {number} из {len(paths)}"
+            )
+        await bot.send_message(chat_id, f"Соберите файл из частей: cat {filename}.part* > {filename}")
+    except Exception as e:
+        logger.error(f"Ошибка выгрузки {table_name}: {e}")
+        try:
+            await bot.send_message(chat_id, f"Не удалось выгрузить {table_name}: {e}")
+        except TelegramAPIError as notify_error:
+            logger.warning(f"Не удалось сообщить об ошибке выгрузки {table_name}: {notify_error}")
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+# Обработка команды /export
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject, bot: Bot):
+    """Обработчик команды /export <таблица> [csv|ndjson]"""
+    args = (command.args or "").split()
+    tables = ", ".join(EXPORT_TABLES)
+    
+    if not args or args[0] not in EXPORT_TABLES:
+        await message.answer(
+            "Использование: /export <таблица> [csv|ndjson]\n"
+            f"Таблицы: {tables}"
+        )
+        return
+    
+    table_name = args[0]
+    fmt = args[1] if len(args) > 1 else "csv"
+    if fmt not in EXPORT_FORMATS:
+        await message.answer(f"Неизвестный формат {fmt}. Доступны: {', '.join(EXPORT_FORMATS)}")
+        return
+    
+    # Выгрузка может занять время: отвечаем сразу, файл придет отдельным сообщением
+    task = asyncio.create_task(run_export(bot, message.chat.id, table_name, fmt))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    
+    await message.answer(f"Выгрузка {table_name} ({fmt}) запущена, файл придет в этот чат.")
+
+async def run_profile(bot: Bot, chat_id: int, seconds: int):
+    """Профилирует цикл событий в фоне и отправляет профиль в чат администратора"""
+    try:
+        path = await loop_monitor.profile(seconds)
+        await bot.send_document(
+            chat_id,
+            FSInputFile(path),
+            caption=(
+                f"Профиль цикла событий за {seconds} с, задержка: {loop_monitor.stats()}.\n"
+                "Формат collapsed stacks: flamegraph.pl, speedscope.app"
+            )
+        )
+    except Exception as e:
+        logger.error(f"Ошибка профилирования: {e}")
+        await bot.send_message(chat_id, f"Не удалось снять профиль: {e}")
+
+# Обработка команды /profile_loop
+@router.message(Command("profile_loop"))
+async def cmd_profile_loop(message: Message, command: CommandObject, bot: Bot):
+    """Обработчик команды /profile_loop [секунды]"""
+    max_seconds = LOOP_MONITOR_SETTINGS["max_profile_seconds"]
+    arg = (command.args or "").strip()
+    if arg and not (arg.isdigit() and 1 <= int(arg) <= max_seconds):
+        await message.answer(f"Использование: /profile_loop [секунды], от 1 до {max_seconds}")
+        return
+    seconds = int(arg) if arg else LOOP_MONITOR_SETTINGS["profile_seconds"]
+    
+    task = asyncio.create_task(run_profile(bot, message.chat.id, seconds))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    
+    await message.answer(f"Профилирование цикла событий на {seconds} с запущено, файл придет в этот чат.")
+
+# Обработка команды /broadcast
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, command: CommandObject, bot: Bot):
+    """
+    Обработчик команды /broadcast.
+    
+    Первая строка - получатели (all, vip или название города), со второй строки - текст:
+    /broadcast vip
+    Текст рассылки
+    """
+    target_line, _, text = (command.args or "").partition("\n")
+    target_line, text = target_line.strip(), text.strip()
+    
+    if not target_line or not text:
+        await message.answer(
+            "Использование:\n/broadcast <all|vip|город>\n<текст рассылки>\n\n"
+            "Текст начинается со второй строки."
+        )
+        return
+    
+    city_id = None
+    if target_line.lower() in (TARGET_ALL, TARGET_VIP):
+        target = target_line.lower()
+        audience = "всем пользователям" if target == TARGET_ALL else "VIP-пользователям"
+    else:
+        city = find_city(target_line)
+        if city is None:
+            await message.answer(f"Город «{target_line}» не найден.")
+            return
+        target, city_id = TARGET_CITY, city.id
+        audience = f"пользователям из города {city.name}"
+    
+    async with AsyncSessionContext() as session:
+        broadcast_id = await create_broadcast(session, text, target, message.from_user.id, city_id)
+    
+    # Отправку начнет процесс фоновых задач: темп рассылок общий для всего бота
+    await message.answer(
+        f"Рассылка #{broadcast_id} {audience} поставлена в очередь и начнется "
+        f"в течение {BROADCAST_SETTINGS['resume_interval']} с. Отчет придет после завершения.\n"
+        f"Остановить: /broadcast_cancel {broadcast_id}"
+    )
+
+# Обработка команды /broadcasts
+@router.message(Command("broadcasts"))
+async def cmd_broadcasts(message: Message):
+    """Обработчик команды /broadcasts - состояние последних рассылок"""
+    async with AsyncSessionContext() as session:
+        broadcasts = await get_recent_broadcasts(session)
+    
+    if not broadcasts:
+        await message.answer("Рассылок еще не было.")
+        return
+    
+    lines = []
+    for broadcast in broadcasts:
+        audience = get_city_name(broadcast.city_id) if broadcast.target == TARGET_CITY else broadcast.target
+        lines.append(
+            f"#{broadcast.id} [{broadcast.status}] {audience}: доставлено {broadcast.sent}, "
+            f"ошибок {broadcast.failed}, заблокировали {broadcast.blocked}"
+        )
+    await message.answer("\n".join(lines))
+
+# Обработка команды /broadcast_cancel
+@router.message(Command("broadcast_cancel"))
+async def cmd_broadcast_cancel(message: Message, command: CommandObject):
+    """Обработчик команды /broadcast_cancel <номер рассылки>"""
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Использование: /broadcast_cancel <номер рассылки>")
+        return
+    
+    broadcast_id = int(command.args.strip())
+    async with AsyncSessionContext() as session:
+        cancelled = await cancel_broadcast(session, broadcast_id)
+    
+    if cancelled:
+        await message.answer(f"Рассылка #{broadcast_id} остановлена.")
+    else:
+        await message.answer(f"Рассылка #{broadcast_id} не выполняется.")
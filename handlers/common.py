@@ -1,11 +1,12 @@
 import os
-from aiogram import Router, F
+from aiogram import Router, F, flags
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.context import FSMContext
 
 from config import STATIC_DIR
 from keyboards.main_menu import get_main_menu_keyboard, get_knowledge_keyboard, get_start_keyboard
+from utils.callbacks import callback_dispatcher, KnowledgeCallback
 from utils.states import MainState
 
 router = Router()
@@ -41,6 +42,7 @@ async def process_start_button(callback: CallbackQuery, state: FSMContext):
 
 # Обработка команды /help
 @router.message(Command("help"))
+@flags.throttling(priority="low")
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
     help_text = (
@@ -66,6 +68,7 @@ async def cmd_help(message: Message):
 
 # Обработка команды /knowledge
 @router.message(Command("knowledge"))
+@flags.throttling(priority="low")
 async def cmd_knowledge(message: Message):
     """Обработчик команды /knowledge"""
     await message.answer(
@@ -75,10 +78,11 @@ async def cmd_knowledge(message: Message):
     )
 
 # Обработка нажатия на кнопки базы знаний
-@router.callback_query(F.data.startswith("knowledge_"))
-async def process_knowledge_buttons(callback: CallbackQuery):
+@callback_dispatcher.handler(KnowledgeCallback)
+@flags.throttling(priority="low")
+async def process_knowledge_buttons(callback: CallbackQuery, callback_data: KnowledgeCallback):
     """Обработчик кнопок базы знаний"""
-    knowledge_type = callback.data.split("_")[1]
+    knowledge_type = callback_data.topic
     
     if knowledge_type == "creation":
         # Правила создания мероприятий
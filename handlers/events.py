@@ -1,22 +1,37 @@
 from datetime import datetime
-from aiogram import Router, F
+from aiogram import Router, F, flags
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from config import POPULAR_CITIES
-from database.db import get_async_session
-from database.models import User, Event, EventPurpose, EventTargetAudience, Gender
+from database.db import AsyncSessionContext
+from database.models import User, Event, Gender
 from keyboards.event_creation import (
     get_event_creation_rules_keyboard,
     get_event_purpose_keyboard,
     get_event_target_audience_keyboard,
     get_event_age_keyboard,
-    get_confirmation_keyboard
+    get_confirmation_keyboard,
+    get_events_page_keyboard
 )
 from keyboards.main_menu import get_main_menu_keyboard, get_city_keyboard
-from services.event_service import create_event, get_events_by_city, register_for_event, unregister_from_event
+from services.city_service import get_city, get_city_name, get_popular_cities
+from config import SECURITY_SETTINGS, RANKING_SETTINGS
+from services.event_service import create_event, register_for_event, unregister_from_event
+from services.ranking_service import get_ranked_events, invalidate_user_feed
+from services.quota_service import quota_limiter, QUOTA_EVENTS
 from services.user_service import get_user_by_telegram_id
+from utils.event_cards import event_cards, format_age_limits, PURPOSE_LABELS, AUDIENCE_LABELS
+from utils.callbacks import (
+    callback_dispatcher,
+    CityCallback,
+    EventRegisterCallback,
+    EventUnregisterCallback,
+    EventRegisterDeniedCallback,
+    EventPageCallback,
+    EventPurposeCallback,
+    EventAudienceCallback
+)
 from utils.states import EventCreationState, EventViewState
 
 router = Router()
@@ -26,7 +41,7 @@ router = Router()
 async def cmd_create_event(message: Message, state: FSMContext):
     """Обработчик команды /create"""
     # Проверяем, зарегистрирован ли пользователь
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, message.from_user.id)
         
         if not user:
@@ -92,17 +107,17 @@ async def process_agree_rules(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_reply_markup(reply_markup=None)
     
     # Получаем информацию о пользователе
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
         # Сохраняем город пользователя как значение по умолчанию
-        await state.update_data(city=user.city)
+        await state.update_data(city_id=user.city_id)
     
     # Предлагаем выбрать город из списка или оставить текущий
     await callback.message.answer(
         f"Шаг 1 из 5: Выберите город проведения мероприятия.\n"
-        f"По умолчанию будет использован ваш город: {user.city}",
-        reply_markup=get_city_keyboard(POPULAR_CITIES, include_current=True, current_city=user.city)
+        f"По умолчанию будет использован ваш город: {user.city.name}",
+        reply_markup=get_city_keyboard(get_popular_cities(), include_current=True, current_city=get_city(user.city_id))
     )
     
     # Переходим к следующему шагу - выбор города
@@ -110,13 +125,13 @@ async def process_agree_rules(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 # Обработка выбора города для мероприятия
-@router.callback_query(F.data.startswith("city_"), EventCreationState.waiting_for_city)
-async def process_event_city_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(CityCallback, EventCreationState.waiting_for_city)
+async def process_event_city_selection(callback: CallbackQuery, callback_data: CityCallback, state: FSMContext):
     """Обработчик выбора города для мероприятия"""
-    city = callback.data.split("_")[1]
+    city_id = callback_data.city_id
     
-    # Сохраняем город в контексте
-    await state.update_data(city=city)
+    # Сохраняем ID города в контексте
+    await state.update_data(city_id=city_id)
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -129,27 +144,11 @@ async def process_event_city_selection(callback: CallbackQuery, state: FSMContex
     await callback.answer()
 
 # Обработка выбора цели мероприятия
-@router.callback_query(F.data.startswith("purpose_"), EventCreationState.waiting_for_purpose)
-async def process_event_purpose_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(EventPurposeCallback, EventCreationState.waiting_for_purpose)
+async def process_event_purpose_selection(callback: CallbackQuery, callback_data: EventPurposeCallback, state: FSMContext):
     """Обработчик выбора цели мероприятия"""
-    purpose_map = {
-        "walk": EventPurpose.WALK,
-        "meet": EventPurpose.MEET,
-        "travel": EventPurpose.TRAVEL,
-        "help": EventPurpose.HELP,
-        "party": EventPurpose.PARTY
-    }
-    
-    purpose_code = callback.data.split("_")[1]
-    purpose = purpose_map.get(purpose_code)
-    
-    if not purpose:
-        await callback.message.answer("Произошла ошибка. Выберите цель мероприятия еще раз.")
-        await callback.answer()
-        return
-    
     # Сохраняем цель в контексте
-    await state.update_data(purpose=purpose)
+    await state.update_data(purpose=callback_data.purpose)
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -162,25 +161,11 @@ async def process_event_purpose_selection(callback: CallbackQuery, state: FSMCon
     await callback.answer()
 
 # Обработка выбора целевой аудитории
-@router.callback_query(F.data.startswith("audience_"), EventCreationState.waiting_for_target_audience)
-async def process_target_audience_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(EventAudienceCallback, EventCreationState.waiting_for_target_audience)
+async def process_target_audience_selection(callback: CallbackQuery, callback_data: EventAudienceCallback, state: FSMContext):
     """Обработчик выбора целевой аудитории"""
-    audience_map = {
-        "male": EventTargetAudience.MALE,
-        "female": EventTargetAudience.FEMALE,
-        "all": EventTargetAudience.ALL
-    }
-    
-    audience_code = callback.data.split("_")[1]
-    target_audience = audience_map.get(audience_code)
-    
-    if not target_audience:
-        await callback.message.answer("Произошла ошибка. Выберите целевую аудиторию еще раз.")
-        await callback.answer()
-        return
-    
     # Сохраняем целевую аудиторию в контексте
-    await state.update_data(target_audience=target_audience)
+    await state.update_data(target_audience=callback_data.audience)
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -381,23 +366,7 @@ async def process_max_participants_input(message: Message, state: FSMContext):
         event_data = await state.get_data()
         
         # Формируем превью мероприятия для подтверждения
-        purpose_names = {
-            EventPurpose.WALK: "Пошли гулять",
-            EventPurpose.MEET: "Давайте знакомиться",
-            EventPurpose.TRAVEL: "Совместные поездки/путешествия",
-            EventPurpose.HELP: "Друзья мне нужна помощь",
-            EventPurpose.PARTY: "Пойдем тусить"
-        }
-        
-        audience_names = {
-            EventTargetAudience.MALE: "Только для мужчин",
-            EventTargetAudience.FEMALE: "Только для женщин",
-            EventTargetAudience.ALL: "Для всех"
-        }
-        
-        age_limits = "Без ограничений"
-        if event_data.get("min_age") and event_data.get("max_age"):
-            age_limits = f"От {event_data['min_age']} до {event_data['max_age']} лет"
+        age_limits = format_age_limits(event_data.get("min_age"), event_data.get("max_age"))
         
         max_participants_str = "Без ограничений"
         if event_data.get("max_participants"):
@@ -405,9 +374,9 @@ async def process_max_participants_input(message: Message, state: FSMContext):
         
         preview = (
             f"<b>{event_data['title']}</b>\n\n"
-            f"<b>Город:</b> {event_data['city']}\n"
-            f"<b>Цель:</b> {purpose_names[event_data['purpose']]}\n"
-            f"<b>Для кого:</b> {audience_names[event_data['target_audience']]}\n"
+            f"<b>Город:</b> {get_city_name(event_data['city_id'])}\n"
+            f"<b>Цель:</b> {PURPOSE_LABELS[event_data['purpose']]}\n"
+            f"<b>Для кого:</b> {AUDIENCE_LABELS[event_data['target_audience']]}\n"
             f"<b>Возраст участников:</b> {age_limits}\n"
             f"<b>Дата и время:</b> {event_data['event_datetime'].strftime('%d.%m.%Y %H:%M')}\n"
             f"<b>Максимальное количество участников:</b> {max_participants_str}\n\n"
@@ -425,13 +394,15 @@ async def process_max_participants_input(message: Message, state: FSMContext):
 
 # Обработка подтверждения создания мероприятия
 @router.callback_query(F.data == "confirm_event", EventCreationState.confirming_event)
+@flags.throttling(cost=3)
+@flags.query_budget(8)
 async def confirm_event_creation(callback: CallbackQuery, state: FSMContext):
     """Обработчик подтверждения создания мероприятия"""
     # Получаем все собранные данные
     event_data = await state.get_data()
     
     # Получаем информацию о пользователе
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
         if not user:
@@ -439,20 +410,37 @@ async def confirm_event_creation(callback: CallbackQuery, state: FSMContext):
             await callback.answer()
             return
         
+        # Проверяем дневной лимит создания мероприятий
+        ticket = await quota_limiter.acquire(session, QUOTA_EVENTS, user.id)
+        if ticket is None:
+            await callback.message.edit_reply_markup(reply_markup=None)
+            await callback.message.answer(
+                f"Можно создать не более {SECURITY_SETTINGS['max_events_per_day']} мероприятий в сутки. "
+                "Попробуйте позже."
+            )
+            await callback.answer()
+            await state.clear()
+            return
+        
         # Создаем мероприятие в базе данных
-        event = await create_event(
-            session,
-            creator_id=user.id,
-            title=event_data["title"],
-            city=event_data["city"],
-            purpose=event_data["purpose"],
-            target_audience=event_data["target_audience"],
-            min_age=event_data.get("min_age"),
-            max_age=event_data.get("max_age"),
-            description=event_data["description"],
-            event_date=event_data["event_datetime"],
-            max_participants=event_data.get("max_participants")
-        )
+        try:
+            event = await create_event(
+                session,
+                creator_id=user.id,
+                title=event_data["title"],
+                city_id=event_data["city_id"],
+                purpose=event_data["purpose"],
+                target_audience=event_data["target_audience"],
+                min_age=event_data.get("min_age"),
+                max_age=event_data.get("max_age"),
+                description=event_data["description"],
+                event_date=event_data["event_datetime"],
+                max_participants=event_data.get("max_participants")
+            )
+            await session.commit()
+        except Exception:
+            await quota_limiter.release(QUOTA_EVENTS, user.id, ticket)
+            raise
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -466,10 +454,11 @@ async def confirm_event_creation(callback: CallbackQuery, state: FSMContext):
 
 # Обработка команды /events - просмотр мероприятий
 @router.message(Command("events"))
+@flags.throttling(cost=2)
 async def cmd_events(message: Message, state: FSMContext):
     """Обработчик команды /events"""
     # Проверяем, зарегистрирован ли пользователь
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, message.from_user.id)
         
         if not user:
@@ -488,34 +477,44 @@ async def cmd_events(message: Message, state: FSMContext):
             return
         
         # Сохраняем город пользователя в контексте для дальнейшего использования
-        await state.update_data(city=user.city)
+        await state.update_data(city_id=user.city_id)
         
         await message.answer(
             f"Выберите город для просмотра мероприятий.\n"
-            f"По умолчанию будут показаны мероприятия в вашем городе: {user.city}",
-            reply_markup=get_city_keyboard(POPULAR_CITIES, include_current=True, current_city=user.city)
+            f"По умолчанию будут показаны мероприятия в вашем городе: {user.city.name}",
+            reply_markup=get_city_keyboard(get_popular_cities(), include_current=True, current_city=get_city(user.city_id))
         )
         
         # Устанавливаем состояние для выбора города
         await state.set_state(EventViewState.selecting_city)
 
 # Обработка выбора города для просмотра мероприятий
-@router.callback_query(F.data.startswith("city_"), EventViewState.selecting_city)
-async def process_view_city_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(CityCallback, EventViewState.selecting_city)
+@flags.throttling(cost=5)
+@flags.query_budget(5)
+async def process_view_city_selection(callback: CallbackQuery, callback_data: CityCallback, state: FSMContext):
     """Обработчик выбора города для просмотра мероприятий"""
-    city = callback.data.split("_")[1]
+    city_id = callback_data.city_id
+    city = get_city_name(city_id)
     
     # Сохраняем выбранный город в контексте
-    await state.update_data(selected_city=city)
+    await state.update_data(selected_city_id=city_id)
     
-    # Получаем мероприятия в выбранном городе
-    async for session in get_async_session():
-        events = await get_events_by_city(session, city)
+    # Получаем мероприятия в выбранном городе, на которые пользователь может зарегистрироваться
+    async with AsyncSessionContext() as session:
+        user = await get_user_by_telegram_id(session, callback.from_user.id)
+        if not user:
+            await callback.answer("Пожалуйста, сначала зарегистрируйтесь с помощью команды /start", show_alert=True)
+            await state.clear()
+            return
+        
+        # Самые подходящие пользователю мероприятия - первыми; читаем ленту на один экран
+        events, has_more = await get_ranked_events(session, user, city_id, RANKING_SETTINGS["page_size"])
         
         if not events:
             await callback.message.edit_reply_markup(reply_markup=None)
             await callback.message.answer(
-                f"В городе {city} пока нет активных мероприятий. "
+                f"В городе {city} пока нет подходящих вам мероприятий. "
                 f"Вы можете создать первое мероприятие с помощью команды /create!"
             )
             await callback.answer()
@@ -524,63 +523,78 @@ async def process_view_city_selection(callback: CallbackQuery, state: FSMContext
         
         # Показываем найденные мероприятия
         await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.message.answer(f"Найдено {len(events)} мероприятий в городе {city}:")
-        
-        # Отправляем информацию о каждом мероприятии
-        for event in events:
-            # Формируем информацию о мероприятии
-            purpose_names = {
-                EventPurpose.WALK: "Пошли гулять",
-                EventPurpose.MEET: "Давайте знакомиться",
-                EventPurpose.TRAVEL: "Совместные поездки/путешествия",
-                EventPurpose.HELP: "Друзья мне нужна помощь",
-                EventPurpose.PARTY: "Пойдем тусить"
-            }
-            
-            audience_names = {
-                EventTargetAudience.MALE: "Только для мужчин",
-                EventTargetAudience.FEMALE: "Только для женщин",
-                EventTargetAudience.ALL: "Для всех"
-            }
-            
-            age_limits = "Без ограничений"
-            if event.min_age and event.max_age:
-                age_limits = f"От {event.min_age} до {event.max_age} лет"
-            
-            participants_count = len(event.participants)
-            max_participants_str = f"{participants_count}/{event.max_participants}" if event.max_participants else f"{participants_count}"
-            
-            event_info = (
-                f"<b>{event.title}</b>\n\n"
-                f"<b>Организатор:</b> {event.creator.display_name}\n"
-                f"<b>Цель:</b> {purpose_names[event.purpose]}\n"
-                f"<b>Для кого:</b> {audience_names[event.target_audience]}\n"
-                f"<b>Возраст участников:</b> {age_limits}\n"
-                f"<b>Дата и время:</b> {event.event_date.strftime('%d.%m.%Y %H:%M')}\n"
-                f"<b>Участники:</b> {max_participants_str}\n\n"
-                f"<b>Описание:</b>\n{event.description}"
-            )
-            
-            # Проверяем, может ли пользователь зарегистрироваться на мероприятие
-            user = await get_user_by_telegram_id(session, callback.from_user.id)
-            can_register = event.can_register(user)
-            
-            # Создаем клавиатуру с кнопкой регистрации, если пользователь может зарегистрироваться
-            from keyboards.event_creation import get_event_registration_keyboard
-            keyboard = get_event_registration_keyboard(event.id, can_register)
-            
-            await callback.message.answer(event_info, parse_mode="HTML", reply_markup=keyboard)
+        found = f"более {len(events)}" if has_more else f"{len(events)}"
+        await callback.message.answer(f"Найдено {found} мероприятий в городе {city}:")
+        await send_events_page(callback.message, events, has_more, city_id, 0)
         
         await callback.answer()
         await state.clear()
 
+async def send_events_page(message: Message, events: list, has_more: bool, city_id: int, page: int):
+    """
+    Отправляет карточки одной страницы ленты и кнопку следующей страницы.
+    
+    Args:
+        message: Сообщение, в чат которого отправляются карточки
+        events: Прочитанная часть ленты (мероприятие, количество участников) из get_ranked_events
+        has_more: Лента прочитана не до конца (get_ranked_events)
+        city_id: ID города ленты
+        page: Номер страницы, начиная с 0
+    """
+    page_size = RANKING_SETTINGS["page_size"]
+    start = page * page_size
+    
+    # Отправляем карточку каждого мероприятия; в выборку попадают только
+    # мероприятия, доступные для регистрации
+    for event, participants_count in events[start:start + page_size]:
+        card = event_cards.get(event, participants_count, can_register=True)
+        await message.answer(card.text, parse_mode="HTML", reply_markup=card.reply_markup)
+    
+    shown = min(start + page_size, len(events))
+    if has_more or shown < len(events):
+        # Пока лента дочитана не до конца, общее количество мероприятий неизвестно
+        total = "" if has_more else f" из {len(events)}"
+        await message.answer(
+            f"Показано {shown}{total} мероприятий.",
+            reply_markup=get_events_page_keyboard(city_id, page + 1)
+        )
+
+# Обработка кнопки "Показать еще" в ленте мероприятий
+@callback_dispatcher.handler(EventPageCallback)
+@flags.throttling(cost=3)
+@flags.query_budget(5)
+async def process_events_page(callback: CallbackQuery, callback_data: EventPageCallback):
+    """Обработчик перехода к следующей странице ленты мероприятий"""
+    async with AsyncSessionContext() as session:
+        user = await get_user_by_telegram_id(session, callback.from_user.id)
+        if not user:
+            await callback.answer("Пожалуйста, сначала зарегистрируйтесь с помощью команды /start", show_alert=True)
+            return
+        
+        # Лента берется из кэша и дочитывается до конца запрошенной страницы;
+        # если она устарела, страница строится по новой ленте
+        page_size = RANKING_SETTINGS["page_size"]
+        events, has_more = await get_ranked_events(
+            session, user, callback_data.city_id, (callback_data.page + 1) * page_size
+        )
+    
+    await callback.message.edit_reply_markup(reply_markup=None)
+    if callback_data.page * page_size >= len(events):
+        await callback.answer("Больше мероприятий нет")
+        return
+    
+    await send_events_page(callback.message, events, has_more, callback_data.city_id, callback_data.page)
+    await callback.answer()
+
 # Обработка регистрации на мероприятие
-@router.callback_query(F.data.startswith("register_"))
-async def register_for_event_handler(callback: CallbackQuery):
+@callback_dispatcher.handler(EventRegisterCallback)
+@flags.throttling(cost=2)
+@flags.query_budget(10)
+async def register_for_event_handler(callback: CallbackQuery, callback_data: EventRegisterCallback):
     """Обработчик регистрации на мероприятие"""
-    event_id = int(callback.data.split("_")[1])
+    event_id = callback_data.event_id
     
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         # Получаем пользователя и мероприятие
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
@@ -588,6 +602,8 @@ async def register_for_event_handler(callback: CallbackQuery):
         success, message = await register_for_event(session, user.id, event_id)
         
         if success:
+            invalidate_user_feed(user.id)
+            event_cards.invalidate(event_id)
             await callback.message.answer("Вы успешно зарегистрировались на мероприятие!")
         else:
             await callback.message.answer(f"Не удалось зарегистрироваться: {message}")
@@ -595,12 +611,14 @@ async def register_for_event_handler(callback: CallbackQuery):
         await callback.answer()
 
 # Обработка отмены регистрации на мероприятие
-@router.callback_query(F.data.startswith("unregister_"))
-async def unregister_from_event_handler(callback: CallbackQuery):
+@callback_dispatcher.handler(EventUnregisterCallback)
+@flags.throttling(cost=2)
+@flags.query_budget(6)
+async def unregister_from_event_handler(callback: CallbackQuery, callback_data: EventUnregisterCallback):
     """Обработчик отмены регистрации на мероприятие"""
-    event_id = int(callback.data.split("_")[1])
+    event_id = callback_data.event_id
     
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         # Получаем пользователя
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
@@ -608,8 +626,19 @@ async def unregister_from_event_handler(callback: CallbackQuery):
         success, message = await unregister_from_event(session, user.id, event_id)
         
         if success:
+            invalidate_user_feed(user.id)
+            event_cards.invalidate(event_id)
             await callback.message.answer("Вы успешно отменили регистрацию на мероприятие.")
         else:
             await callback.message.answer(f"Не удалось отменить регистрацию: {message}")
         
-        await callback.answer()
\ No newline at end of file
+        await callback.answer()
+
+# Обработка нажатия на кнопку мероприятия, на которое нельзя зарегистрироваться
+@callback_dispatcher.handler(EventRegisterDeniedCallback)
+async def register_denied_handler(callback: CallbackQuery):
+    """Обработчик кнопки недоступной регистрации"""
+    await callback.answer(
+        "Регистрация недоступна: мероприятие заполнено или не подходит вам по условиям участия.",
+        show_alert=True
+    )
\ No newline at end of file
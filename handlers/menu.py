@@ -10,7 +10,6 @@ from keyboards.menu_kb import (
     get_main_menu_keyboard, get_start_keyboard, get_event_rules_keyboard, 
     get_rules_detail_keyboard, get_back_button
 )
-from database.db import get_async_session
 from database.models import User
 
 # Создаем роутер для обработчиков меню
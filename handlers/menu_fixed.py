@@ -1,12 +1,14 @@
 import logging
 import os
 from handlers.registration import start_registration, check_user_exists
-from aiogram import Router, F
+from aiogram import Router, F, flags
 from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from database.db import AsyncSessionContext
+from services.broadcast_service import unmark_blocked
 from keyboards.main_menu import (
     get_main_menu_keyboard, get_start_keyboard
 )
@@ -38,6 +40,8 @@ def get_back_button():
 from utils.states import MainState
 
 router = Router()
+# Обработчики "всего остального" подключаются последними, после всех остальных роутеров
+fallback_router = Router()
 logger = logging.getLogger(__name__)
 
 # Определяем состояния для меню
@@ -47,6 +51,7 @@ class MenuStates(StatesGroup):
 
 # Обработчик команды /start
 @router.message(CommandStart())
+@flags.throttling(cost=2)
 async def cmd_start(message: Message, state: FSMContext):
     """Обработчик команды /start"""
     try:
@@ -54,6 +59,10 @@ async def cmd_start(message: Message, state: FSMContext):
         user_exists = await check_user_exists(message.from_user.id)
         
         if user_exists:
+            # Пользователь мог заблокировать бота и вернуться - снова включаем его в рассылки
+            async with AsyncSessionContext() as session:
+                await unmark_blocked(session, message.from_user.id)
+            
             # Если зарегистрирован - показываем главное меню
             welcome_text = (
                 f"👋 Добро пожаловать обратно, {message.from_user.first_name}!\n\n"
@@ -100,6 +109,7 @@ async def cmd_start(message: Message, state: FSMContext):
 
 # Обработчик команды /help
 @router.message(Command("help"))
+@flags.throttling(priority="low")
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
     help_text = (
@@ -173,12 +183,14 @@ async def cmd_events(message: Message):
     await view_events(message)
 
 @router.message(Command("knowledge"))
+@flags.throttling(priority="low")
 async def cmd_knowledge(message: Message):
     """Обработчик команды /knowledge"""
     await knowledge_base(message)
 
 # Обработчики для кнопок главного меню с ReplyKeyboard
 @router.message(F.text == "Мой профиль")
+@flags.throttling(cost=2)
 async def show_profile(message: Message, state: FSMContext):
     """Обработчик кнопки 'Мой профиль'"""
     logger.info(f"Пользователь {message.from_user.id} нажал 'Мой профиль'")
@@ -267,6 +279,7 @@ async def view_events(message: Message):
     await message.answer(events_text, parse_mode="HTML")
 
 @router.message(F.text == "База знаний")
+@flags.throttling(priority="low")
 async def knowledge_base(message: Message):
     """Обработчик кнопки 'База знаний'"""
     logger.info(f"Пользователь {message.from_user.id} нажал 'База знаний'")
@@ -307,6 +320,7 @@ async def show_rules_menu(callback: CallbackQuery, state: FSMContext):
     await state.set_state(MenuStates.showing_rules)
 
 @router.callback_query(F.data == "event_creation_rules")
+@flags.throttling(priority="low")
 async def show_creation_rules(callback: CallbackQuery):
     await callback.answer()
     rules_text = """📋 <b>Правила создания мероприятий</b>
@@ -339,6 +353,7 @@ async def show_creation_rules(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data == "event_registration_rules")
+@flags.throttling(priority="low")
 async def show_registration_rules(callback: CallbackQuery):
     await callback.answer()
     rules_text = """📋 <b>Правила регистрации на мероприятие</b>
@@ -465,16 +480,19 @@ async def back_to_main(callback: CallbackQuery, state: FSMContext):
 
 # Обработчики для разделов базы знаний
 @router.callback_query(F.data == "knowledge_creation_rules")
+@flags.throttling(priority="low")
 async def show_knowledge_creation_rules(callback: CallbackQuery):
     await callback.answer()
     await show_creation_rules(callback)
 
 @router.callback_query(F.data == "knowledge_participation_rules")
+@flags.throttling(priority="low")
 async def show_knowledge_participation_rules(callback: CallbackQuery):
     await callback.answer()
     await show_registration_rules(callback)
 
 @router.callback_query(F.data == "knowledge_rating_system")
+@flags.throttling(priority="low")
 async def show_knowledge_rating_system(callback: CallbackQuery):
     await callback.answer()
     rating_text = """⭐ <b>Система рейтинга</b>
@@ -514,6 +532,7 @@ async def show_knowledge_rating_system(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data == "knowledge_vip_status")
+@flags.throttling(priority="low")
 async def show_knowledge_vip_status(callback: CallbackQuery):
     await callback.answer()
     vip_text = """👑 <b>VIP-статус</b>
@@ -550,6 +569,7 @@ async def show_knowledge_vip_status(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data == "knowledge_about_project")
+@flags.throttling(priority="low")
 async def show_knowledge_about_project(callback: CallbackQuery):
     await callback.answer()
     about_text = """ℹ️ <b>О проекте "Я с Вами"</b>
@@ -586,6 +606,7 @@ async def show_knowledge_about_project(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data == "knowledge_faq")
+@flags.throttling(priority="low")
 async def show_knowledge_faq(callback: CallbackQuery):
     await callback.answer()
     faq_text = """❓ <b>Часто задаваемые вопросы</b>
@@ -622,12 +643,14 @@ async def show_knowledge_faq(callback: CallbackQuery):
     )
 
 @router.callback_query(F.data == "back_to_knowledge")
+@flags.throttling(priority="low")
 async def back_to_knowledge_menu(callback: CallbackQuery):
     await callback.answer()
     await knowledge_base(callback.message)
 
 # Обработка неизвестных сообщений
-@router.message()
+@fallback_router.message()
+@flags.throttling(priority="low")
 async def process_other_messages(message: Message):
     if message.text and message.text.startswith('/'):
         logger.info(f"Получена неизвестная команда от пользователя {message.from_user.id}: {message.text}")
@@ -640,11 +663,12 @@ async def process_other_messages(message: Message):
         logger.info(f"Получено неизвестное сообщение от пользователя {message.from_user.id}: {message.text}")
         await message.answer(
             "Я не понял вашу команду. Воспользуйтесь меню ниже или отправьте /help для получения справки.",
-            reply_markup=get_main_menu_keyboard # <-- Убедитесь, что здесь нет запятой
-        ) # <-- Убедитесь, что эта скобка закрыта и отступ правильный
+            reply_markup=get_main_menu_keyboard()
+        )
 
 # Обработчики для кнопок главного меню (Inline клавиатура)
 @router.callback_query(F.data == "profile")
+@flags.throttling(cost=2)
 async def handle_profile_callback(callback: CallbackQuery, state: FSMContext):
     """Обработчик для кнопки Мой профиль из главного меню"""
     await callback.answer()
@@ -675,6 +699,7 @@ async def handle_view_events_callback(callback: CallbackQuery):
     await view_events(callback.message)
 
 @router.callback_query(F.data == "knowledge")
+@flags.throttling(priority="low")
 async def handle_knowledge_callback(callback: CallbackQuery):
     """Обработчик для кнопки База знаний из главного меню"""
     await callback.answer()
@@ -686,7 +711,8 @@ async def handle_knowledge_callback(callback: CallbackQuery):
 
 
 # Обработка необработанных callback_query
-@router.callback_query()
+@fallback_router.callback_query()
+@flags.throttling(priority="low")
 async def process_unknown_callback(callback: CallbackQuery):
     logger.warning(f"Получен необработанный callback_query от пользователя {callback.from_user.id}: {callback.data}")
     await callback.answer("🔧 Эта функция находится в разработке", show_alert=True)
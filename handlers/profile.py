@@ -1,24 +1,38 @@
 from datetime import datetime, timedelta
-from aiogram import Router, F
+from aiogram import Router, F, flags
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from config import POPULAR_CITIES
-from database.db import get_async_session
+from database.db import AsyncSessionContext
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import VIP_COST
 from database.models import User, Gender, UserType
-from keyboards.main_menu import get_main_menu_keyboard, get_profile_keyboard, get_gender_keyboard, get_city_keyboard
+from keyboards.main_menu import (
+    get_main_menu_keyboard,
+    get_profile_keyboard,
+    get_gender_keyboard,
+    get_city_keyboard,
+    get_payment_methods_keyboard
+)
+from services.city_service import get_popular_cities, get_or_create_city
+from services.ledger_service import apply_transaction
 from services.user_service import get_user_by_telegram_id, create_user, update_user
+from utils.callbacks import callback_dispatcher, CityCallback, GenderCallback
 from utils.states import ProfileState
+from utils.validators import validate_city
 
 router = Router()
 
 # Обработка команды /profile
 @router.message(Command("profile"))
+@flags.throttling(cost=2)
+@flags.query_budget(3)
 async def cmd_profile(message: Message):
     """Обработчик команды /profile"""
     # Получаем сессию БД
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         # Проверяем, зарегистрирован ли пользователь
         user = await get_user_by_telegram_id(session, message.from_user.id)
         
@@ -30,7 +44,7 @@ async def cmd_profile(message: Message):
             profile_text = (
                 f"<b>Ваш профиль</b>\n\n"
                 f"<b>Имя:</b> {user.display_name}\n"
-                f"<b>Город:</b> {user.city}\n"
+                f"<b>Город:</b> {user.city.name if user.city else '—'}\n"
                 f"<b>Возраст:</b> {user.age}\n"
                 f"<b>Пол:</b> {'Мужской' if user.gender == Gender.MALE else 'Женский'}\n"
                 f"<b>О себе:</b> {user.about or '—'}\n\n"
@@ -46,20 +60,20 @@ async def cmd_profile(message: Message):
             await message.answer(
                 "Для использования функций бота необходимо заполнить профиль.\n"
                 "Давайте знакомиться! Расскажите немного о себе.",
-                reply_markup=get_city_keyboard(POPULAR_CITIES)
+                reply_markup=get_city_keyboard(get_popular_cities())
             )
             
             # Устанавливаем состояние для начала регистрации
             await state.set_state(ProfileState.waiting_for_city)
 
 # Обработка выбора города из списка
-@router.callback_query(F.data.startswith("city_"), ProfileState.waiting_for_city)
-async def process_city_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(CityCallback, ProfileState.waiting_for_city)
+async def process_city_selection(callback: CallbackQuery, callback_data: CityCallback, state: FSMContext):
     """Обработчик выбора города"""
-    city = callback.data.split("_")[1]
+    city_id = callback_data.city_id
     
-    # Сохраняем город в контексте
-    await state.update_data(city=city)
+    # Сохраняем ID города в контексте
+    await state.update_data(city_id=city_id)
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer("Отлично! Теперь введите ваше имя:")
@@ -83,10 +97,17 @@ async def process_other_city(callback: CallbackQuery, state: FSMContext):
 @router.message(ProfileState.entering_city)
 async def process_city_input(message: Message, state: FSMContext):
     """Обработчик ручного ввода города"""
-    city = message.text.strip().capitalize()
+    is_valid, city, error = validate_city(message.text)
+    
+    if not is_valid:
+        await message.answer(error)
+        return
     
-    # Сохраняем город в контексте
-    await state.update_data(city=city)
+    # Сохраняем ID города в контексте (новый город добавляется в справочник)
+    async with AsyncSessionContext() as session:
+        city_ref = await get_or_create_city(session, city)
+        await session.commit()
+    await state.update_data(city_id=city_ref.id)
     
     await message.answer("Отлично! Теперь введите ваше имя:")
     
@@ -137,13 +158,11 @@ async def process_age_input(message: Message, state: FSMContext):
         await message.answer("Пожалуйста, введите корректный возраст (число):")
 
 # Обработка выбора пола
-@router.callback_query(F.data.startswith("gender_"), ProfileState.waiting_for_gender)
-async def process_gender_selection(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(GenderCallback, ProfileState.waiting_for_gender)
+async def process_gender_selection(callback: CallbackQuery, callback_data: GenderCallback, state: FSMContext):
     """Обработчик выбора пола"""
-    gender = Gender.MALE if callback.data == "gender_male" else Gender.FEMALE
-    
     # Сохраняем пол в контексте
-    await state.update_data(gender=gender)
+    await state.update_data(gender=callback_data.gender)
     
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer(
@@ -168,19 +187,20 @@ async def process_about_input(message: Message, state: FSMContext):
     user_data = await state.get_data()
     
     # Создаем пользователя в базе данных
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         await create_user(
             session,
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
             last_name=message.from_user.last_name,
-            city=user_data["city"],
+            city_id=user_data["city_id"],
             display_name=user_data["display_name"],
             age=user_data["age"],
             gender=user_data["gender"],
             about=user_data.get("about", "")
         )
+        await session.commit()
     
     # Отправляем сообщение о успешной регистрации
     await message.answer(
@@ -205,10 +225,12 @@ async def edit_profile(callback: CallbackQuery, state: FSMContext):
 
 # Обработка покупки VIP-статуса
 @router.callback_query(F.data == "buy_vip")
+@flags.throttling(cost=3)
+@flags.query_budget(8)
 async def buy_vip(callback: CallbackQuery):
     """Обработчик покупки VIP-статуса"""
     # Получаем информацию о пользователе
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
         if not user:
@@ -218,18 +240,32 @@ async def buy_vip(callback: CallbackQuery):
             await callback.answer()
             return
         
-        # Проверяем, достаточно ли токенов
-        if user.tokens < 1500:
+        # Ключ привязан к сообщению с кнопкой: повторное нажатие той же кнопки
+        # не спишет токены дважды, для продления нужна новая кнопка покупки
+        result = await apply_transaction(
+            session,
+            user.id,
+            -VIP_COST,
+            "Покупка VIP-статуса",
+            idempotency_key=f"vip:{user.id}:{callback.message.chat.id}:{callback.message.message_id}"
+        )
+        
+        if result.duplicate:
+            await callback.answer("Покупка VIP-статуса уже обработана")
+            return
+        
+        # Списание выполняется условным UPDATE, баланс не уйдет в минус
+        if not result.applied:
             await callback.message.answer(
                 "Недостаточно токенов для покупки VIP-статуса.\n"
-                "Необходимо: 1500 токенов, у вас: {user.tokens} токенов.\n"
+                f"Необходимо: {VIP_COST} токенов, у вас: {user.tokens or 0} токенов.\n"
                 "Пополните баланс и повторите попытку."
             )
             await callback.answer()
             return
         
-        # Списываем токены и активируем VIP-статус
-        user.tokens -= 1500
+        # Активируем VIP-статус в той же транзакции, что и списание
+        set_committed_value(user, "tokens", result.balance)
         user.activate_vip()
         await session.commit()
         
@@ -1,24 +1,26 @@
-from aiogram import Router, F
+from aiogram import Router, flags
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
 from config import RATING_IMPACT
-from database.db import get_async_session
+from database.db import AsyncSessionContext
 from database.models import User, Event, Rating
 from keyboards.main_menu import get_rating_keyboard, get_stars_keyboard
 from services.rating_service import rate_user, update_user_rating
 from services.user_service import get_user_by_telegram_id
+from utils.callbacks import callback_dispatcher, RateEventCallback, RateScoreCallback
 from utils.states import RatingState
 
 router = Router()
 
 # Обработка команды для оценки участников мероприятия
 @router.message(Command("rate"))
+@flags.throttling(cost=2)
 async def cmd_rate(message: Message, state: FSMContext):
     """Обработчик команды /rate"""
     # Проверяем, зарегистрирован ли пользователь
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         user = await get_user_by_telegram_id(session, message.from_user.id)
         
         if not user:
@@ -49,15 +51,16 @@ async def cmd_rate(message: Message, state: FSMContext):
         await state.set_state(RatingState.selecting_event)
 
 # Обработка выбора мероприятия для оценки
-@router.callback_query(F.data.startswith("rate_event_"), RatingState.selecting_event)
-async def select_event_to_rate(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(RateEventCallback, RatingState.selecting_event)
+@flags.throttling(cost=2)
+async def select_event_to_rate(callback: CallbackQuery, callback_data: RateEventCallback, state: FSMContext):
     """Обработчик выбора мероприятия для оценки"""
-    event_id = int(callback.data.split("_")[2])
+    event_id = callback_data.event_id
     
     # Сохраняем ID мероприятия в контексте
     await state.update_data(event_id=event_id)
     
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         # Получаем мероприятие и его участников
         from services.event_service import get_event_by_id
         event = await get_event_by_id(session, event_id)
@@ -103,25 +106,25 @@ async def select_event_to_rate(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 # Обработка выбора оценки
-@router.callback_query(F.data.startswith("rate_"), RatingState.selecting_rating)
-async def select_rating(callback: CallbackQuery, state: FSMContext):
+@callback_dispatcher.handler(RateScoreCallback, RatingState.selecting_rating)
+@flags.query_budget(5)
+async def select_rating(callback: CallbackQuery, callback_data: RateScoreCallback, state: FSMContext):
     """Обработчик выбора оценки"""
-    rating = int(callback.data.split("_")[1])
+    rating = callback_data.score
     
     # Получаем данные из контекста
     data = await state.get_data()
     event_id = data["event_id"]
     user_to_rate_id = data["user_to_rate_id"]
     
-    async for session in get_async_session():
+    async with AsyncSessionContext() as session:
         # Получаем пользователя
         user = await get_user_by_telegram_id(session, callback.from_user.id)
         
-        # Сохраняем оценку в базе данных
+        # Оценка и рейтинг сохраняются в одной транзакции
         await rate_user(session, event_id, user.id, user_to_rate_id, rating)
-        
-        # Обновляем рейтинг пользователя
         await update_user_rating(session, user_to_rate_id, RATING_IMPACT[rating])
+        await session.commit()
         
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer(f"Спасибо за оценку! Вы поставили {rating} звезд.")
@@ -6,15 +6,22 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ParseMode
 
-from keyboards.main_menu import get_main_menu_keyboard
-from database.db import get_async_session
+from keyboards.main_menu import get_main_menu_keyboard, get_city_suggestions_keyboard
+from database.db import AsyncSessionContext
 from database.models import User, Gender, UserType
+from services.city_service import get_or_create_city
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from utils.callbacks import callback_dispatcher, CitySuggestionCallback
+from utils.city_matcher import city_matcher, prettify_city_name
+from utils.validators import MAX_CITY_NAME_LENGTH
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Ответ на кнопку из прежнего списка подсказок городов
+OUTDATED_SUGGESTIONS_TEXT = "⚠️ Этот список городов устарел. Пожалуйста, введите название города еще раз:"
+
 # Состояния для регистрации
 class RegistrationStates(StatesGroup):
     waiting_for_city = State()
@@ -26,22 +33,16 @@ class RegistrationStates(StatesGroup):
 async def check_user_exists(user_id: int) -> bool:
     """
     Проверяет, существует ли пользователь в базе данных по telegram_id.
-    Корректно использует асинхронную сессию.
     """
-    session = None
     try:
-        session = get_async_session()
-        result = await session.execute(
-            select(User).where(User.telegram_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        return user is not None
+        async with AsyncSessionContext() as session:
+            result = await session.execute(
+                select(User.id).where(User.telegram_id == user_id)
+            )
+            return result.scalar_one_or_none() is not None
     except Exception as e:
         logger.error(f"Ошибка при проверке пользователя {user_id}: {e}")
         return False
-    finally:
-        if session:
-            await session.close()
 
 async def start_registration(message: Message, state: FSMContext):
     """
@@ -84,8 +85,74 @@ async def process_city(message: Message, state: FSMContext):
         )
         return
     
-    city = message.text.strip().title()
+    city_input = " ".join(message.text.split())
+    
+    if len(city_input) < 2:
+        await message.answer("❌ Название города слишком короткое. Введите корректное название:")
+        return
+    
+    if len(city_input) > MAX_CITY_NAME_LENGTH:
+        await message.answer(f"❌ Название города слишком длинное (не более {MAX_CITY_NAME_LENGTH} символов). Введите корректное название:")
+        return
+    
+    match = city_matcher.resolve(city_input)
+    
+    if match.is_ambiguous:
+        # Не уверены, какой город имелся в виду - предлагаем варианты
+        suggestions_message = await message.answer(
+            "🤔 Возможно, вы имели в виду один из этих городов?",
+            reply_markup=get_city_suggestions_keyboard(list(match.suggestions))
+        )
+        # Запоминаем сообщение с подсказками: кнопки старых подсказок не подходят к новому списку
+        await state.update_data(
+            city_input=prettify_city_name(city_input),
+            city_suggestions=list(match.suggestions),
+            city_suggestions_message_id=suggestions_message.message_id
+        )
+        return
+    
+    # Новый город попадет в справочник (и в подсказки другим пользователям)
+    # только после сохранения профиля - в get_or_create_city()
+    city = match.city or prettify_city_name(city_input)
+    await confirm_city(message, state, city)
+
+# Обработчик выбора города из подсказок
+@callback_dispatcher.handler(CitySuggestionCallback, RegistrationStates.waiting_for_city)
+async def process_city_suggestion(callback: CallbackQuery, callback_data: CitySuggestionCallback, state: FSMContext):
+    """Обработчик выбора города из списка подсказок"""
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    
+    data = await state.get_data()
+    suggestions = data.get("city_suggestions", [])
+    if not _is_current_suggestions(callback, data) or not 0 <= callback_data.index < len(suggestions):
+        await callback.message.answer(OUTDATED_SUGGESTIONS_TEXT)
+        return
+    
+    city = suggestions[callback_data.index]
+    await confirm_city(callback.message, state, city, callback.from_user.id)
+
+# Обработчик сохранения города в том виде, в котором его ввел пользователь
+@router.callback_query(F.data == "keep_city_input", RegistrationStates.waiting_for_city)
+async def process_keep_city_input(callback: CallbackQuery, state: FSMContext):
+    """Обработчик отказа от подсказок: город сохраняется как новый"""
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    
+    data = await state.get_data()
+    if not _is_current_suggestions(callback, data) or "city_input" not in data:
+        await callback.message.answer(OUTDATED_SUGGESTIONS_TEXT)
+        return
     
+    city = data["city_input"]
+    await confirm_city(callback.message, state, city, callback.from_user.id)
+
+def _is_current_suggestions(callback: CallbackQuery, data: dict) -> bool:
+    """Кнопка нажата в последнем сообщении с подсказками городов"""
+    return callback.message is not None and data.get("city_suggestions_message_id") == callback.message.message_id
+
+async def confirm_city(message: Message, state: FSMContext, city: str, user_id: int = None):
+    """Сохраняет выбранный город и переходит к следующему шагу регистрации"""
     await state.update_data(city=city)
     
     await message.answer(
@@ -96,7 +163,7 @@ async def process_city(message: Message, state: FSMContext):
     )
     
     await state.set_state(RegistrationStates.waiting_for_name)
-    logger.info(f"Пользователь {message.from_user.id} ввел город: {city}")
+    logger.info(f"Пользователь {user_id or message.from_user.id} ввел город: {city}")
 
 @router.message(RegistrationStates.waiting_for_name)
 async def process_name(message: Message, state: FSMContext):
@@ -240,42 +307,35 @@ async def process_about(message: Message, state: FSMContext):
 async def save_user_to_db(telegram_id: int, username: str | None, user_data: dict) -> bool:
     """
     Сохраняет нового пользователя в базу данных.
-    Корректно использует асинхронную сессию и маппинг полей модели.
+    Транзакция откатывается при ошибке (AsyncSessionContext).
     """
-    session = None
     try:
-        session = get_async_session()
-        new_user = User(
-            telegram_id=telegram_id,
-            username=username,
-            first_name=user_data['full_name'],
-            display_name=user_data['full_name'],
-            city=user_data['city'],
-            age=user_data['age'],
-            gender=Gender(user_data['gender']),
-            about=user_data['about_me'],
-            rating=100,
-            tokens=0,
-            user_type=UserType.REGULAR
-        )
-        
-        session.add(new_user)
-        await session.commit()
-        return True
-        
+        async with AsyncSessionContext() as session:
+            city = await get_or_create_city(session, user_data['city'])
+            new_user = User(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=user_data['full_name'],
+                display_name=user_data['full_name'],
+                city_id=city.id,
+                age=user_data['age'],
+                gender=Gender(user_data['gender']),
+                about=user_data['about_me'],
+                rating=100,
+                tokens=0,
+                user_type=UserType.REGULAR
+            )
+
+            session.add(new_user)
+            await session.commit()
+            return True
+
     except IntegrityError as e:
         logger.error(f"Ошибка уникальности при сохранении пользователя {telegram_id}: {e}")
-        if session:
-            await session.rollback()
         return False
     except Exception as e:
         logger.error(f"Ошибка при сохранении пользователя {telegram_id}: {e}")
-        if session:
-            await session.rollback()
         return False
-    finally:
-        if session:
-            await session.close()
 
 # Обработчик для кнопки "СТАРТ" в приветственном сообщении
 @router.callback_query(F.data == "start_button")
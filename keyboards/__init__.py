@@ -5,6 +5,7 @@ from .main_menu import (
     get_start_keyboard,
     get_main_menu_keyboard, 
     get_city_keyboard,
+    get_city_suggestions_keyboard,
     get_gender_keyboard,
     get_profile_keyboard,
     get_edit_profile_keyboard,
@@ -21,7 +22,8 @@ from .event_creation import (
     get_event_purpose_keyboard,
     get_event_target_audience_keyboard,
     get_event_age_keyboard,
-    get_event_registration_keyboard
+    get_event_registration_keyboard,
+    get_events_page_keyboard
 )
 
 __all__ = [
@@ -29,6 +31,7 @@ __all__ = [
     'get_start_keyboard',
     'get_main_menu_keyboard',
     'get_city_keyboard', 
+    'get_city_suggestions_keyboard',
     'get_gender_keyboard',
     'get_profile_keyboard',
     'get_edit_profile_keyboard',
@@ -43,5 +46,6 @@ __all__ = [
     'get_event_purpose_keyboard',
     'get_event_target_audience_keyboard',
     'get_event_age_keyboard',
-    'get_event_registration_keyboard'
+    'get_event_registration_keyboard',
+    'get_events_page_keyboard'
 ]
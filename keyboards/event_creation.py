@@ -1,5 +1,17 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from keyboards.registry import keyboard_registry
 
+from database.models import EventPurpose, EventTargetAudience
+from utils.callbacks import (
+    EventRegisterCallback,
+    EventUnregisterCallback,
+    EventRegisterDeniedCallback,
+    EventPageCallback,
+    EventPurposeCallback,
+    EventAudienceCallback
+)
+
+@keyboard_registry.static
 def get_event_creation_rules_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для правил создания мероприятий"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -9,6 +21,7 @@ def get_event_creation_rules_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.cached
 def get_confirmation_keyboard(confirm_type: str) -> InlineKeyboardMarkup:
     """Клавиатура для подтверждения (правил или создания мероприятия)"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -17,28 +30,31 @@ def get_confirmation_keyboard(confirm_type: str) -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_event_purpose_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора цели мероприятия"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Пошли гулять", callback_data="purpose_walk")],
-        [InlineKeyboardButton(text="Давайте знакомиться", callback_data="purpose_meet")],
-        [InlineKeyboardButton(text="Совместные поездки/путешествия", callback_data="purpose_travel")],
-        [InlineKeyboardButton(text="Друзья мне нужна помощь", callback_data="purpose_help")],
-        [InlineKeyboardButton(text="Пойдем тусить", callback_data="purpose_party")],
+        [InlineKeyboardButton(text="Пошли гулять", callback_data=EventPurposeCallback(purpose=EventPurpose.WALK).pack())],
+        [InlineKeyboardButton(text="Давайте знакомиться", callback_data=EventPurposeCallback(purpose=EventPurpose.MEET).pack())],
+        [InlineKeyboardButton(text="Совместные поездки/путешествия", callback_data=EventPurposeCallback(purpose=EventPurpose.TRAVEL).pack())],
+        [InlineKeyboardButton(text="Друзья мне нужна помощь", callback_data=EventPurposeCallback(purpose=EventPurpose.HELP).pack())],
+        [InlineKeyboardButton(text="Пойдем тусить", callback_data=EventPurposeCallback(purpose=EventPurpose.PARTY).pack())],
         [InlineKeyboardButton(text="Назад", callback_data="back_to_main")]
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_event_target_audience_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора целевой аудитории мероприятия"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👨 Только для мужчин", callback_data="audience_male")],
-        [InlineKeyboardButton(text="👩 Только для женщин", callback_data="audience_female")],
-        [InlineKeyboardButton(text="👨‍👩‍👧 Для всех", callback_data="audience_all")],
+        [InlineKeyboardButton(text="👨 Только для мужчин", callback_data=EventAudienceCallback(audience=EventTargetAudience.MALE).pack())],
+        [InlineKeyboardButton(text="👩 Только для женщин", callback_data=EventAudienceCallback(audience=EventTargetAudience.FEMALE).pack())],
+        [InlineKeyboardButton(text="👨‍👩‍👧 Для всех", callback_data=EventAudienceCallback(audience=EventTargetAudience.ALL).pack())],
         [InlineKeyboardButton(text="Назад", callback_data="back_to_main")]
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_event_age_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора возрастных ограничений"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -48,15 +64,23 @@ def get_event_age_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.cached
 def get_event_registration_keyboard(event_id: int, can_register: bool = True) -> InlineKeyboardMarkup:
     """Клавиатура для регистрации на мероприятие"""
     buttons = []
     
     if can_register:
-        buttons.append([InlineKeyboardButton(text="Я пойду!", callback_data=f"register_{event_id}")])
+        buttons.append([InlineKeyboardButton(text="Я пойду!", callback_data=EventRegisterCallback(event_id=event_id).pack())])
     else:
-        buttons.append([InlineKeyboardButton(text="Нельзя зарегистрироваться", callback_data=f"cant_register_{event_id}")])
+        buttons.append([InlineKeyboardButton(text="Нельзя зарегистрироваться", callback_data=EventRegisterDeniedCallback(event_id=event_id).pack())])
     
-    buttons.append([InlineKeyboardButton(text="Отменить регистрацию", callback_data=f"unregister_{event_id}")])
+    buttons.append([InlineKeyboardButton(text="Отменить регистрацию", callback_data=EventUnregisterCallback(event_id=event_id).pack())])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@keyboard_registry.cached
+def get_events_page_keyboard(city_id: int, page: int) -> InlineKeyboardMarkup:
+    """Клавиатура для перехода к следующей странице ленты мероприятий"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Показать еще", callback_data=EventPageCallback(city_id=city_id, page=page).pack())]
+    ])
@@ -1,8 +1,18 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from typing import List, Optional
 
-from database.models import Event
+from database.models import Event, Gender
+from keyboards.registry import keyboard_registry
+from utils.callbacks import (
+    CityCallback,
+    CitySuggestionCallback,
+    GenderCallback,
+    KnowledgeCallback,
+    RateEventCallback,
+    RateScoreCallback
+)
 
+@keyboard_registry.static
 def get_start_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для первого приветственного сообщения"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -10,6 +20,7 @@ def get_start_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_main_menu_keyboard() -> InlineKeyboardMarkup:
     """Основная клавиатура главного меню"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -20,18 +31,25 @@ def get_main_menu_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
-def get_city_keyboard(cities: list, include_current: bool = False, current_city: str = None) -> InlineKeyboardMarkup:
-    """Клавиатура для выбора города"""
+@keyboard_registry.cached
+def get_city_keyboard(cities: list, include_current: bool = False, current_city=None) -> InlineKeyboardMarkup:
+    """
+    Клавиатура для выбора города.
+
+    cities и current_city - записи справочника городов (CityRef) с полями id и name;
+    в callback_data передается только короткий ID города. CityRef хэшируемы,
+    поэтому готовая клавиатура берется из кэша реестра клавиатур.
+    """
     buttons = []
     
     # Если нужно, добавляем кнопку с текущим городом
     if include_current and current_city:
-        buttons.append([InlineKeyboardButton(text=f"Оставить: {current_city}", callback_data=f"city_{current_city}")])
+        buttons.append([InlineKeyboardButton(text=f"Оставить: {current_city.name}", callback_data=CityCallback(city_id=current_city.id).pack())])
     
     # Добавляем кнопки с городами
     city_buttons = []
     for i, city in enumerate(cities):
-        city_buttons.append(InlineKeyboardButton(text=city, callback_data=f"city_{city}"))
+        city_buttons.append(InlineKeyboardButton(text=city.name, callback_data=CityCallback(city_id=city.id).pack()))
         
         # По 2 города в ряд
         if (i + 1) % 2 == 0 or i == len(cities) - 1:
@@ -46,14 +64,30 @@ def get_city_keyboard(cities: list, include_current: bool = False, current_city:
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@keyboard_registry.cached
+def get_city_suggestions_keyboard(suggestions: List[str]) -> InlineKeyboardMarkup:
+    """Клавиатура с вариантами города, когда введенное название неоднозначно"""
+    # Передаем номер подсказки: сами варианты хранятся в состоянии FSM
+    buttons = [
+        [InlineKeyboardButton(text=city, callback_data=CitySuggestionCallback(index=i).pack())]
+        for i, city in enumerate(suggestions)
+    ]
+
+    # Кнопка для сохранения города в том виде, в котором его ввел пользователь
+    buttons.append([InlineKeyboardButton(text="Оставить как ввел", callback_data="keep_city_input")])
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@keyboard_registry.static
 def get_gender_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора пола"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Мужской", callback_data="gender_male")],
-        [InlineKeyboardButton(text="Женский", callback_data="gender_female")]
+        [InlineKeyboardButton(text="Мужской", callback_data=GenderCallback(gender=Gender.MALE).pack())],
+        [InlineKeyboardButton(text="Женский", callback_data=GenderCallback(gender=Gender.FEMALE).pack())]
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_profile_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для профиля пользователя"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -65,6 +99,7 @@ def get_profile_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_edit_profile_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для редактирования профиля"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -76,6 +111,7 @@ def get_edit_profile_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_payment_methods_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора способа оплаты"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -86,14 +122,15 @@ def get_payment_methods_keyboard() -> InlineKeyboardMarkup:
     ])
     return keyboard
 
+@keyboard_registry.static
 def get_knowledge_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для базы знаний"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Правила создания мероприятий", callback_data="knowledge_creation")],
-        [InlineKeyboardButton(text="Правила регистрации на мероприятие", callback_data="knowledge_registration")],
-        [InlineKeyboardButton(text="О системе рейтинга", callback_data="knowledge_rating")],
-        [InlineKeyboardButton(text="О VIP-статусе", callback_data="knowledge_vip")],
-        [InlineKeyboardButton(text="О проекте", callback_data="knowledge_about")],
+        [InlineKeyboardButton(text="Правила создания мероприятий", callback_data=KnowledgeCallback(topic="creation").pack())],
+        [InlineKeyboardButton(text="Правила регистрации на мероприятие", callback_data=KnowledgeCallback(topic="registration").pack())],
+        [InlineKeyboardButton(text="О системе рейтинга", callback_data=KnowledgeCallback(topic="rating").pack())],
+        [InlineKeyboardButton(text="О VIP-статусе", callback_data=KnowledgeCallback(topic="vip").pack())],
+        [InlineKeyboardButton(text="О проекте", callback_data=KnowledgeCallback(topic="about").pack())],
         [InlineKeyboardButton(text="Назад", callback_data="back_to_main")]
     ])
     return keyboard
@@ -110,7 +147,7 @@ def get_rating_keyboard(events: List[Event]) -> InlineKeyboardMarkup:
         buttons.append([
             InlineKeyboardButton(
                 text=f"{event_name} ({event_date})",
-                callback_data=f"rate_event_{event.id}"
+                callback_data=RateEventCallback(event_id=event.id).pack()
             )
         ])
     
@@ -118,15 +155,13 @@ def get_rating_keyboard(events: List[Event]) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@keyboard_registry.static
 def get_stars_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора оценки (звезд)"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="⭐", callback_data="rate_1"),
-            InlineKeyboardButton(text="⭐⭐", callback_data="rate_2"),
-            InlineKeyboardButton(text="⭐⭐⭐", callback_data="rate_3"),
-            InlineKeyboardButton(text="⭐⭐⭐⭐", callback_data="rate_4"),
-            InlineKeyboardButton(text="⭐⭐⭐⭐⭐", callback_data="rate_5")
+            InlineKeyboardButton(text="⭐" * score, callback_data=RateScoreCallback(score=score).pack())
+            for score in range(1, 6)
         ]
     ])
     return keyboard
\ No newline at end of file
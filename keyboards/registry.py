@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from functools import wraps
+from inspect import signature
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+# Сколько параметризованных клавиатур (город по умолчанию, регистрация на
+# конкретное мероприятие и т.п.) держим в памяти одновременно
+DEFAULT_LRU_SIZE = 1024
+
+
+def _freeze(value: Any) -> Hashable:
+    # Списки в аргументах (например, список городов) превращаем в кортежи для ключа кэша
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class KeyboardRegistry:
+    """
+    Реестр неизменяемых клавиатур.
+
+    Статические клавиатуры строятся один раз (при старте через warm_up()),
+    параметризованные - кэшируются в LRU по аргументам. Вместе с клавиатурой
+    хранится ее JSON, который BotSession отправляет в Telegram без повторной
+    сериализации. Клавиатуры aiogram - frozen-модели, поэтому одна и та же
+    клавиатура безопасно переиспользуется во всех сообщениях.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_LRU_SIZE):
+        self.maxsize = maxsize
+        self._static_builders: List[Callable[[], InlineKeyboardMarkup]] = []
+        self._lru: "OrderedDict[Tuple, InlineKeyboardMarkup]" = OrderedDict()
+        # id(клавиатуры) -> (клавиатура, JSON); ссылка на клавиатуру не дает переиспользовать id
+        self._serialized: Dict[int, Tuple[InlineKeyboardMarkup, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def static(self, builder: Callable[[], InlineKeyboardMarkup]) -> Callable[[], InlineKeyboardMarkup]:
+        """Декоратор для клавиатур без параметров: клавиатура строится один раз"""
+        markup: Optional[InlineKeyboardMarkup] = None
+
+        @wraps(builder)
+        def wrapper() -> InlineKeyboardMarkup:
+            nonlocal markup
+            if markup is None:
+                self.misses += 1
+                markup = builder()
+                self._remember(markup)
+            else:
+                self.hits += 1
+            return markup
+
+        self._static_builders.append(wrapper)
+        return wrapper
+
+    def cached(self, builder: Callable[..., InlineKeyboardMarkup]) -> Callable[..., InlineKeyboardMarkup]:
+        """Декоратор для параметризованных клавиатур: результат кэшируется в общем LRU"""
+        builder_signature = signature(builder)
+
+        @wraps(builder)
+        def wrapper(*args: Any, **kwargs: Any) -> InlineKeyboardMarkup:
+            # Приводим позиционные и именованные аргументы к одному ключу
+            bound = builder_signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (builder.__qualname__, _freeze(tuple(bound.arguments.values())))
+            markup = self._lru.get(key)
+            if markup is not None:
+                self.hits += 1
+                self._lru.move_to_end(key)
+                return markup
+
+            self.misses += 1
+            markup = builder(*args, **kwargs)
+            self._lru[key] = markup
+            self._remember(markup)
+
+            if len(self._lru) > self.maxsize:
+                _, evicted = self._lru.popitem(last=False)
+                self._serialized.pop(id(evicted), None)
+            return markup
+
+        return wrapper
+
+    def warm_up(self) -> int:
+        """
+        Строит все статические клавиатуры заранее.
+
+        Returns:
+            Количество построенных клавиатур
+        """
+        for builder in self._static_builders:
+            builder()
+        return len(self._static_builders)
+
+    def get_json(self, markup: Any) -> Optional[str]:
+        """Возвращает заранее сериализованный JSON клавиатуры, если она есть в реестре"""
+        entry = self._serialized.get(id(markup))
+        if entry is not None and entry[0] is markup:
+            return entry[1]
+        return None
+
+    def _remember(self, markup: InlineKeyboardMarkup) -> None:
+        self._serialized[id(markup)] = (markup, markup.model_dump_json(exclude_none=True))
+
+
+# Общий реестр клавиатур приложения
+keyboard_registry = KeyboardRegistry()
@@ -1,21 +1,49 @@
-import os
+import time
+# Время запуска считаем с импорта модулей
+_started_at = time.perf_counter()
+
 import asyncio
 import logging
+from typing import List
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 
-from config import BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT
-from database.db import init_db
-from handlers import common, profile, events, ratings, menu_fixed as menu, registration
+from config import BOT_TOKEN, CLUSTER_SETTINGS, STARTUP_SETTINGS, LEDGER_SETTINGS, VIP_SETTINGS, QUOTA_SETTINGS, THROTTLING_SETTINGS, REPUTATION_SETTINGS, BROADCAST_SETTINGS, SESSION_SETTINGS
+from database import db
+from database.db import init_db, warm_up_pool, AsyncSessionContext, check_sessions, session_stats
+from services.city_service import seed_cities, load_cities
+from services.ledger_service import take_balance_snapshots
+from services.vip_service import expire_vip_statuses, send_renewal_notices
+from services.quota_service import quota_limiter
+from services.broadcast_service import resume_broadcasts
+from keyboards.registry import keyboard_registry
+from middlewares.update_executor import update_executor
+from middlewares.log_context import log_context_middleware
+from middlewares.throttling import throttling_middleware
+from middlewares.query_budget import query_budget_middleware, install_query_counter
+from utils.bot_session import BotSession
+from utils.callbacks import callback_dispatcher
+from utils.event_cards import event_cards
+from utils.invalidation import invalidation_bus
+from services.event_service import city_listings
+from utils.periodic import run_periodic
+from utils.logging_setup import setup_logging, logging_stats
+from utils.loop_monitor import loop_monitor
+from utils.startup import StartupTimer
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+# Настройка логирования: запись в stdout выполняет отдельный поток
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Типы обновлений, которые получает бот
+ALLOWED_UPDATES = [
+    "message", 
+    "callback_query", 
+    "inline_query", 
+    "chosen_inline_result"
+]
+
 # Команды бота
 async def set_commands(bot: Bot):
     """Устанавливает команды бота в меню Telegram"""
@@ -30,33 +58,136 @@ async def set_commands(bot: Bot):
     await bot.set_my_commands(commands)
     logger.info("Команды бота установлены")
 
-async def main():
-    """Основная функция запуска бота"""
-    
-    # 1. Проверка токена
-    if not BOT_TOKEN:
-        logger.error("КРИТИЧЕСКАЯ ОШИБКА: BOT_TOKEN не определен!")
-        logger.error("Проверьте переменные окружения в Railway")
-        return
+async def load_city_directory(seed: bool) -> None:
+    """Загружает справочник городов в память (и заполняет его, если seed)"""
+    # Справочник городов держим в памяти: клавиатуры и callback_data работают с ID городов
+    async with AsyncSessionContext() as session:
+        if seed:
+            await seed_cities(session)
+        await load_cities(session)
+    logger.info("Справочник городов загружен")
+
+async def prepare_database(seed: bool = True, warm_up: bool = True) -> bool:
+    """
+    Подключается к базе данных и загружает справочник городов в память.
     
-    logger.info("BOT_TOKEN найден, начинаем инициализацию...")
+    Args:
+        seed: Создавать таблицы (если включено STARTUP_SETTINGS["create_tables"])
+            и заполнять справочник городов. Воркеры кластера передают False:
+            базу готовит процесс-приемщик до их запуска.
+        warm_up: Заранее открыть STARTUP_SETTINGS["warm_connections"] соединений пула
     
-    # 2. Инициализация базы данных
+    Returns:
+        True, если база данных готова к работе
+    """
     try:
         logger.info("Инициализация базы данных...")
-        await init_db()
+        await init_db(create_tables=seed and STARTUP_SETTINGS["create_tables"])
+        install_query_counter(db.engine)
         logger.info("База данных успешно инициализирована")
+        
+        if warm_up:
+            # Соединения открываются параллельно с загрузкой справочника
+            _, opened = await asyncio.gather(load_city_directory(seed), warm_up_pool(STARTUP_SETTINGS["warm_connections"]))
+            logger.info(f"Открыто соединений с базой данных: {opened}")
+        else:
+            await load_city_directory(seed)
+        return True
     except Exception as e:
         logger.error(f"КРИТИЧЕСКАЯ ОШИБКА при инициализации базы данных: {e}")
-        return
+        return False
+
+# Пул соединений был занят полностью при последней проверке (пишем в лог только смену состояния)
+_pool_exhausted = False
+
+async def snapshot_balances() -> None:
+    """Фоновая задача: снимки балансов для быстрой сверки журнала токенов"""
+    async with AsyncSessionContext() as session:
+        created = await take_balance_snapshots(session)
+    logger.info(f"Снимков балансов создано: {created}")
+
+async def expire_vips(bot: Bot) -> None:
+    """Фоновая задача: понижение истекших VIP и уведомления о продлении"""
+    async with AsyncSessionContext() as session:
+        telegram_ids = await expire_vip_statuses(session)
+    if telegram_ids:
+        delivered = await send_renewal_notices(bot, telegram_ids)
+        logger.info(f"VIP-статус истек у {len(telegram_ids)} пользователей, уведомлено: {delivered}")
+
+async def recompute_ratings() -> None:
+    """Фоновая задача: пересчет репутации по всему графу оценок"""
+    # scipy нужен только этой задаче процесса-приемщика
+    from services.reputation_service import recompute_reputation
+    
+    async with AsyncSessionContext() as session:
+        await recompute_reputation(session)
+
+async def watch_sessions() -> None:
+    """Фоновая задача: предупреждения о долгих сессиях базы данных и занятом пуле соединений"""
+    global _pool_exhausted
+    check_sessions(SESSION_SETTINGS["warn_after"])
+    
+    # Все постоянные соединения пула заняты: новые сессии ждут или открывают сверх пула
+    stats = session_stats()
+    pool_size = stats.get("pool_size")
+    exhausted = bool(pool_size) and (stats["open"] >= pool_size or stats["pool_checked_out"] >= pool_size)
+    if exhausted and not _pool_exhausted:
+        logger.warning(f"Пул соединений базы данных занят полностью: {stats}")
+    elif _pool_exhausted and not exhausted:
+        logger.info(f"Пул соединений базы данных освободился: {stats}")
+    _pool_exhausted = exhausted
+
+def start_background_jobs(bot: Bot) -> List[asyncio.Task]:
+    """
+    Запускает периодические фоновые задачи.
+    
+    В многопроцессном режиме задачи запускает только процесс-приемщик.
+    
+    Args:
+        bot: Экземпляр бота для отправки уведомлений
+    
+    Returns:
+        Список задач для отмены при остановке бота
+    """
+    return [
+        asyncio.create_task(run_periodic(snapshot_balances, LEDGER_SETTINGS["snapshot_interval"], "снимки балансов")),
+        asyncio.create_task(run_periodic(lambda: expire_vips(bot), VIP_SETTINGS["expiry_check_interval"], "окончание VIP")),
+        asyncio.create_task(run_periodic(recompute_ratings, REPUTATION_SETTINGS["interval"], "пересчет рейтингов")),
+        asyncio.create_task(run_periodic(lambda: resume_broadcasts(bot), BROADCAST_SETTINGS["resume_interval"], "запуск рассылок")),
+    ]
+
+def start_worker_jobs() -> List[asyncio.Task]:
+    """
+    Запускает фоновые задачи, которые работают с памятью процесса.
+    
+    В многопроцессном режиме запускаются в каждом воркере.
+    
+    Returns:
+        Список задач для отмены при остановке бота
+    """
+    # kill -USR1 <pid> снимает профиль цикла событий этого процесса
+    loop_monitor.install_signal_handler()
+    return [
+        asyncio.create_task(run_periodic(quota_limiter.purge, QUOTA_SETTINGS["purge_interval"], "очистка квот")),
+        asyncio.create_task(run_periodic(throttling_middleware.purge, THROTTLING_SETTINGS["purge_interval"], "очистка ограничений")),
+        # Утекшие и долгие сессии держат соединения пула - сообщаем о них сразу
+        asyncio.create_task(run_periodic(watch_sessions, SESSION_SETTINGS["check_interval"], "контроль сессий")),
+        # Сброс локальных кэшей по изменениям из других процессов
+        asyncio.create_task(invalidation_bus.run()),
+        # Задержки и остановки цикла событий из-за синхронного кода
+        asyncio.create_task(loop_monitor.run()),
+    ]
+
+def build_dispatcher() -> Dispatcher:
+    """Создает диспетчер со всеми обработчиками и middleware"""
+    # Модули обработчиков импортируются здесь: приемщику кластера они не нужны
+    from handlers import admin, common, profile, events, ratings, menu_fixed as menu, registration
     
-    # 3. Создание бота и диспетчера
-    logger.info("Создание экземпляра бота...")
-    bot = Bot(token=BOT_TOKEN)
     storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    # Исполнитель обновлений - блокировка чата для FSM: состояние читается уже под ней
+    dp = Dispatcher(storage=storage, events_isolation=update_executor)
     
-    # 4. Регистрация обработчиков (ПОРЯДОК ВАЖЕН!)
+    # Регистрация обработчиков (ПОРЯДОК ВАЖЕН!)
     logger.info("Регистрация обработчиков...")
     
     # Сначала регистрация (самые специфичные обработчики)
@@ -72,57 +203,111 @@ async def main():
     dp.include_router(profile.router)
     dp.include_router(events.router)
     dp.include_router(ratings.router)
+    dp.include_router(admin.router)
+    
+    # Обработчики неизвестных сообщений и callback_query - строго последними
+    dp.include_router(menu.fallback_router)
+    
+    # Контекст логов (update_id, user_id) и время обработки (ожидание очереди чата не входит:
+    # блокировку чата берет FSMContextMiddleware aiogram раньше)
+    dp.update.outer_middleware(log_context_middleware)
+    
+    # Общий лимит для обновлений без чата; обновления чатов ограничивает events_isolation
+    dp.update.outer_middleware(update_executor)
+    
+    # Типизированные callback_data маршрутизируются по префиксу до обхода роутеров
+    dp.callback_query.outer_middleware(callback_dispatcher)
+    
+    # Защита от флуда: inner middleware видят флаги выбранного обработчика
+    dp.message.middleware(throttling_middleware)
+    dp.callback_query.middleware(throttling_middleware)
+    callback_dispatcher.middleware(throttling_middleware)
+    
+    # Имя выбранного обработчика в контексте логов
+    dp.message.middleware(log_context_middleware)
+    dp.callback_query.middleware(log_context_middleware)
+    callback_dispatcher.middleware(log_context_middleware)
+    
+    # Бюджет SQL-запросов обработчика (QUERY_BUDGET_MODE), после защиты от флуда
+    dp.message.middleware(query_budget_middleware)
+    dp.callback_query.middleware(query_budget_middleware)
+    callback_dispatcher.middleware(query_budget_middleware)
     logger.info("✓ Все обработчики зарегистрированы")
     
-    # 5. Установка команд бота
-    try:
-        await set_commands(bot)
-    except Exception as e:
-        logger.warning(f"Не удалось установить команды бота: {e}")
+    # Статические клавиатуры строим один раз, до первого обновления
+    built = keyboard_registry.warm_up()
+    logger.info(f"✓ Подготовлено клавиатур: {built}")
     
-    # 6. КРИТИЧЕСКАЯ ОЧИСТКА для решения конфликта
-    logger.info("Очистка webhook и pending updates...")
-    try:
-        # Принудительное удаление webhook
-        await bot.delete_webhook(drop_pending_updates=True)
-        logger.info("✓ Webhook удален")
-        
-        # Небольшая пауза для гарантированной очистки
-        await asyncio.sleep(1)
-        
-        # Дополнительная очистка pending updates
-        try:
-            updates = await bot.get_updates(timeout=1, limit=100)
-            if updates:
-                logger.info(f"Очищено {len(updates)} накопившихся обновлений")
-        except Exception:
-            pass  # Игнорируем ошибки при очистке
-            
-    except Exception as e:
-        logger.warning(f"Ошибка при очистке webhook: {e}")
+    return dp
+
+async def main():
+    """Основная функция запуска бота"""
+    
+    # 1. Проверка токена
+    if not BOT_TOKEN:
+        logger.error("КРИТИЧЕСКАЯ ОШИБКА: BOT_TOKEN не определен!")
+        logger.error("Проверьте переменные окружения в Railway")
+        return
+    
+    logger.info("BOT_TOKEN найден, начинаем инициализацию...")
+    timer = StartupTimer(_started_at)
+    timer.mark("импорт модулей")
+    
+    # 2. Регистрация обработчиков (без сетевых запросов)
+    with timer.phase("обработчики"):
+        dp = build_dispatcher()
+    
+    # 3. База данных и Telegram параллельно: подключение к базе, справочник городов,
+    # HTTP-сессия бота (get_me), команды и удаление webhook вместе с накопившимися обновлениями
+    bot = Bot(token=BOT_TOKEN, session=BotSession())
+    with timer.phase("подключения"):
+        database_ready, me, commands, webhook = await asyncio.gather(
+            timer.measure("база данных", prepare_database()),
+            timer.measure("get_me", bot.me()),
+            timer.measure("команды", set_commands(bot)),
+            timer.measure("webhook", bot.delete_webhook(drop_pending_updates=True)),
+            return_exceptions=True
+        )
+    
+    if database_ready is not True:
+        await bot.session.close()
+        return
+    if isinstance(me, Exception):
+        logger.error(f"КРИТИЧЕСКАЯ ОШИБКА: не удалось подключиться к Telegram: {me}")
+        await bot.session.close()
+        return
+    if isinstance(commands, Exception):
+        logger.warning(f"Не удалось установить команды бота: {commands}")
+    if isinstance(webhook, Exception):
+        logger.warning(f"Ошибка при удалении webhook: {webhook}")
     
-    # 7. Запуск polling с обработкой ошибок
-    logger.info("🚀 Запуск бота в режиме long polling...")
+    # 4. Запуск polling с обработкой ошибок
+    logger.info(f"🚀 Запуск бота @{me.username} в режиме long polling...")
+    background_jobs = start_background_jobs(bot) + start_worker_jobs()
+    timer.report()
     
     try:
         # Указываем конкретные типы обновлений для обработки
-        allowed_updates = [
-            "message", 
-            "callback_query", 
-            "inline_query", 
-            "chosen_inline_result"
-        ]
-        
         await dp.start_polling(
             bot, 
-            allowed_updates=allowed_updates,
-            skip_updates=True,  # Пропускаем старые обновления
+            allowed_updates=ALLOWED_UPDATES,
             handle_signals=False  # Отключаем обработку сигналов для Railway
         )
         
     except Exception as e:
         logger.error(f"Ошибка при запуске polling: {e}")
     finally:
+        for job in background_jobs:
+            job.cancel()
+        logger.info(f"Статистика исполнителя обновлений: {update_executor.stats()}")
+        logger.info(f"Статистика карточек мероприятий: {event_cards.stats()}")
+        logger.info(f"Статистика шины инвалидации: {invalidation_bus.stats()}")
+        logger.info(f"Статистика списков мероприятий: {city_listings.stats()}")
+        logger.info(f"Статистика сессий базы данных: {session_stats()}")
+        logger.info(f"Статистика логирования: {logging_stats()}")
+        logger.info(f"Статистика цикла событий: {loop_monitor.stats()}")
+        logger.info(f"Статистика запросов к Bot API: {bot.session.stats()}")
+        
         # Гарантированное закрытие сессии бота
         await bot.session.close()
         logger.info("Сессия бота закрыта")
@@ -130,7 +315,12 @@ async def main():
 if __name__ == "__main__":
     try:
         # Запуск с обработкой исключений
-        asyncio.run(main())
+        if CLUSTER_SETTINGS["workers"] > 1:
+            # Несколько процессов-воркеров, обновления распределяются по пользователям
+            from cluster import run_cluster
+            run_cluster()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
@@ -3,7 +3,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Message, CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.db import get_async_session
+from database.db import AsyncSessionContext
 from services.user_service import get_user_by_telegram_id
 
 class AuthMiddleware(BaseMiddleware):
@@ -28,7 +28,7 @@ class AuthMiddleware(BaseMiddleware):
         
         if user_id:
             # Получаем сессию БД
-            async for session in get_async_session():
+            async with AsyncSessionContext() as session:
                 # Получаем пользователя из БД
                 user = await get_user_by_telegram_id(session, user_id)
                 
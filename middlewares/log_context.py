@@ -0,0 +1,55 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import LOGGING_SETTINGS
+from utils.logging_setup import log_context
+
+logger = logging.getLogger(__name__)
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Контекст обновления для логов и время его обработки.
+
+    Как outer middleware dp.update заполняет update_id и user_id и после
+    обработки пишет запись с длительностью (медленные - предупреждением).
+    Как inner middleware message/callback_query добавляет имя выбранного
+    обработчика: его видно только после фильтров.
+    """
+
+    def __init__(self, slow_update: float = LOGGING_SETTINGS["slow_update"]):
+        self.slow_update = slow_update
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            context = log_context.get()
+            handler_object = data.get("handler")
+            if context is not None and handler_object is not None:
+                context["handler"] = handler_object.callback.__qualname__
+            return await handler(event, data)
+
+        user = data.get("event_from_user")
+        context = {"update_id": event.update_id, "user_id": user.id if user else None}
+        token = log_context.set(context)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            duration = time.perf_counter() - started
+            level = logging.WARNING if duration >= self.slow_update else logging.INFO
+            logger.log(level, f"Обновление обработано за {duration * 1000:.0f} мс",
+                       extra={"duration_ms": round(duration * 1000, 1)})
+            log_context.reset(token)
+
+
+# Общий middleware контекста логов приложения
+log_context_middleware = LogContextMiddleware()
@@ -0,0 +1,110 @@
+"""
+Контроль количества SQL-запросов на одно обновление.
+
+Обработчик объявляет бюджет флагом @flags.query_budget(N); без флага
+действует QUERY_BUDGET_SETTINGS["default"]. Запросы считаются слушателем
+before_cursor_execute движка, счетчик текущего обновления хранится
+в contextvar. В режиме "raise" (тесты и разработка) превышение бюджета
+завершает обработку ошибкой QueryBudgetExceeded, в режиме "warn" -
+пишется в лог, в режиме "off" счетчик не устанавливается.
+"""
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import QUERY_BUDGET_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = "off"
+MODE_WARN = "warn"
+MODE_RAISE = "raise"
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Обработчик выполнил больше SQL-запросов, чем объявил"""
+
+
+class QueryCounter:
+    """Счетчик запросов одного обновления"""
+
+    __slots__ = ("count", "statements")
+
+    def __init__(self):
+        self.count = 0
+        # Первые запросы сохраняем, чтобы по сообщению об ошибке было видно, что повторяется
+        self.statements: List[str] = []
+
+    def add(self, statement: str) -> None:
+        self.count += 1
+        if len(self.statements) < QUERY_BUDGET_SETTINGS["keep_statements"]:
+            self.statements.append(" ".join(statement.split())[:200])
+
+
+_current: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    counter = _current.get()
+    if counter is not None:
+        counter.add(statement)
+
+
+def install_query_counter(engine: AsyncEngine) -> None:
+    """Подключает подсчет запросов к движку (вызывается после init_db)"""
+    if QUERY_BUDGET_SETTINGS["mode"] == MODE_OFF:
+        return
+    if not event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Inner middleware: считает SQL-запросы обработчика и сравнивает с бюджетом.
+
+    Подключается так же, как ThrottlingMiddleware, чтобы видеть флаги обработчика.
+    """
+
+    def __init__(self, mode: str = QUERY_BUDGET_SETTINGS["mode"]):
+        self.mode = mode
+        self.exceeded = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.mode == MODE_OFF:
+            return await handler(event, data)
+
+        counter = QueryCounter()
+        token = _current.set(counter)
+        try:
+            result = await handler(event, data)
+        finally:
+            _current.reset(token)
+
+        budget = get_flag(data, "query_budget", default=QUERY_BUDGET_SETTINGS["default"])
+        if counter.count > budget:
+            self.exceeded += 1
+            handler_object = data.get("handler")
+            name = handler_object.callback.__qualname__ if handler_object else type(event).__name__
+            message = (
+                f"{name}: {counter.count} SQL-запросов при бюджете {budget}. "
+                f"Первые запросы: {counter.statements}"
+            )
+            if self.mode == MODE_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return result
+
+
+# Общий контроль бюджета запросов приложения
+query_budget_middleware = QueryBudgetMiddleware()
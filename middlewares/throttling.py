@@ -0,0 +1,106 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject, User
+
+from config import THROTTLING_SETTINGS
+from middlewares.update_executor import update_executor
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты обработчиков (флаг throttling, поле priority)
+PRIORITY_LOW = "low"  # Справочные страницы и неизвестные команды: отбрасываются первыми при перегрузке
+PRIORITY_NORMAL = "normal"
+
+# Готовые ответы: при отказе не формируем текст заново
+SLOW_DOWN_TEXT = "Слишком много запросов. Подождите немного и повторите."
+OVERLOAD_TEXT = "Бот сейчас сильно загружен. Попробуйте через минуту."
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита от флуда: ведро токенов на пользователя и отбрасывание обновлений при перегрузке.
+
+    Стоимость и приоритет обработчика задаются флагом:
+        @router.callback_query(...)
+        @flags.throttling(cost=5, priority="low")
+        async def handler(...): ...
+
+    По умолчанию стоимость 1, приоритет normal. Перегрузкой считается очередь
+    UpdateExecutor длиннее THROTTLING_SETTINGS["overload_waiting"]: в этом случае
+    обновления с приоритетом low не обрабатываются.
+
+    Регистрируется как inner middleware на dp.message и dp.callback_query
+    (чтобы видеть флаги выбранного обработчика) и в callback_dispatcher.
+    """
+
+    def __init__(self, rate: float = THROTTLING_SETTINGS["rate"], burst: float = THROTTLING_SETTINGS["burst"]):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[int, TokenBucket] = {}
+        # Когда пользователю последний раз отправили сообщение об ограничении
+        self._notified_at: Dict[int, float] = {}
+        self.throttled = 0
+        self.shed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        throttling = get_flag(data, "throttling") or {}
+        cost = throttling.get("cost", 1)
+        priority = throttling.get("priority", PRIORITY_NORMAL)
+
+        if priority == PRIORITY_LOW and update_executor.waiting >= THROTTLING_SETTINGS["overload_waiting"]:
+            self.shed += 1
+            await self._reject(event, user.id, OVERLOAD_TEXT)
+            return None
+
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            bucket = self._buckets[user.id] = TokenBucket(self.rate, self.burst)
+
+        if not bucket.consume(cost):
+            self.throttled += 1
+            await self._reject(event, user.id, SLOW_DOWN_TEXT)
+            return None
+
+        return await handler(event, data)
+
+    async def _reject(self, event: TelegramObject, user_id: int, text: str) -> None:
+        # На callback_query отвечаем всегда: иначе у пользователя "крутятся часики".
+        # Сообщения отправляем не чаще notice_interval, чтобы флуд не превращался в рассылку
+        if isinstance(event, CallbackQuery):
+            await event.answer(text)
+            return
+
+        now = time.monotonic()
+        if now - self._notified_at.get(user_id, 0) < THROTTLING_SETTINGS["notice_interval"]:
+            return
+        self._notified_at[user_id] = now
+        if isinstance(event, Message):
+            await event.answer(text)
+
+    async def purge(self) -> None:
+        """Удаляет ведра пользователей, которые давно ничего не присылали"""
+        now = time.monotonic()
+        idle = [user_id for user_id, bucket in self._buckets.items() if bucket.is_full(now)]
+        for user_id in idle:
+            del self._buckets[user_id]
+            self._notified_at.pop(user_id, None)
+        if self.throttled or self.shed:
+            logger.info(f"Ограничено обновлений: {self.throttled}, отброшено при перегрузке: {self.shed}")
+
+
+# Общий ограничитель приложения
+throttling_middleware = ThrottlingMiddleware()
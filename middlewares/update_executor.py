@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import TelegramObject
+
+from config import EXECUTOR_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _KeyQueue:
+    lock: asyncio.Lock
+    depth: int = 0  # обновления этого чата: выполняется + ожидают очереди
+
+
+class UpdateExecutor(BaseMiddleware, BaseEventIsolation):
+    """
+    Исполнитель обновлений: последовательно внутри чата, параллельно между чатами.
+
+    Передается в Dispatcher(events_isolation=...): FSMContextMiddleware aiogram
+    берет блокировку чата до чтения состояния, поэтому второе быстрое нажатие
+    ждет первое и проходит фильтры состояний уже с новым состоянием.
+    Блокировка - общая asyncio.Lock чата (или пользователя, если чата нет),
+    которая пропускает ожидающих строго в порядке очереди. Разные чаты
+    выполняются параллельно, но не более max_concurrency одновременно, чтобы
+    не исчерпывать пул соединений с базой данных.
+
+    Подключается и как outer middleware к dp.update: обновления без чата
+    и пользователя (для них нет состояния и блокировки) ограничиваются
+    только общим лимитом.
+
+    Порядок сохраняется, пока polling создает задачи в порядке получения
+    обновлений (handle_as_tasks=True в aiogram) - до блокировки задача
+    не уступает управление.
+    """
+
+    def __init__(self, max_concurrency: int = EXECUTOR_SETTINGS["max_concurrency"],
+                 queue_warning_depth: int = EXECUTOR_SETTINGS["queue_warning_depth"]):
+        self.max_concurrency = max_concurrency
+        self.queue_warning_depth = queue_warning_depth
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues: Dict[int, _KeyQueue] = {}
+        # Метрики
+        self.active = 0
+        self.waiting = 0
+        self.processed = 0
+        self.max_depth = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # state заполняет FSMContextMiddleware aiogram - тогда обновление
+        # уже выполняется под блокировкой lock()
+        if "state" in data:
+            return await handler(event, data)
+        self.waiting += 1
+        async with self._slot():
+            return await handler(event, data)
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        """Очередь чата и слот общего лимита (вызывает FSMContextMiddleware aiogram)"""
+        # Для личных чатов и групп chat_id есть всегда (без чата aiogram подставляет user_id)
+        chat_id = key.chat_id
+        self.waiting += 1
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = _KeyQueue(asyncio.Lock())
+        queue.depth += 1
+
+        if queue.depth > self.max_depth:
+            self.max_depth = queue.depth
+        if queue.depth == self.queue_warning_depth:
+            logger.warning(f"Очередь обновлений чата {chat_id} достигла {queue.depth}")
+
+        try:
+            # Слот общего лимита занимаем только после своей очереди чата,
+            # чтобы ожидающие обновления одного чата не блокировали остальные
+            async with queue.lock, self._slot():
+                yield
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                del self._queues[chat_id]
+
+    async def close(self) -> None:
+        self._queues.clear()
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        async with self._semaphore:
+            self.waiting -= 1
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Возвращает метрики очередей.
+
+        Returns:
+            Словарь: выполняется сейчас, ожидают, чатов с очередью,
+            максимальная глубина очереди чата, всего обработано
+        """
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "chats": len(self._queues),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+        }
+
+
+# Общий исполнитель обновлений приложения
+update_executor = UpdateExecutor()
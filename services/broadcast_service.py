@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, and_, or_
+
+from config import BROADCAST_SETTINGS
+from database.db import AsyncSessionContext
+from database.models import User, Broadcast
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Получатели рассылки
+TARGET_ALL = "all"
+TARGET_VIP = "vip"
+TARGET_CITY = "city"
+BROADCAST_TARGETS = (TARGET_ALL, TARGET_VIP, TARGET_CITY)
+
+# Состояния рассылки
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+
+# Результаты отправки одному получателю
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+# Рассылки, которые выполняет этот процесс: ID рассылки -> задача
+_broadcast_tasks: Dict[int, asyncio.Task] = {}
+
+@dataclass
+class BroadcastReport:
+    """Итог выполнения рассылки этим процессом"""
+    broadcast_id: int
+    status: str
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Сообщений в секунду"""
+        return (self.sent + self.failed + self.blocked) / self.elapsed if self.elapsed else 0.0
+
+@dataclass
+class _Sender:
+    """
+    Отправка сообщений с общим для процесса темпом BROADCAST_SETTINGS["rate"].
+
+    Лимит Telegram общий для бота, а темп - только для процесса, поэтому все
+    рассылки выполняет один процесс: тот, что запускает фоновые задачи
+    (в многопроцессном режиме - приемщик), через resume_broadcasts().
+
+    При TelegramRetryAfter приостанавливается вся отправка, а не только
+    одно сообщение: Telegram ограничивает бота целиком.
+    """
+    bucket: TokenBucket = field(default_factory=lambda: TokenBucket(BROADCAST_SETTINGS["rate"], BROADCAST_SETTINGS["rate"]))
+    paused_until: float = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            elif self.bucket.consume():
+                return
+            else:
+                await asyncio.sleep(self.bucket.delay())
+
+    async def deliver(self, bot: Bot, telegram_id: int, text: str) -> str:
+        while True:
+            try:
+                await bot.send_message(telegram_id, text)
+                return SENT
+            except TelegramRetryAfter as e:
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                await self.acquire()
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота или удалил аккаунт
+                return BLOCKED
+            except TelegramAPIError as e:
+                logger.info(f"Не удалось отправить рассылку {telegram_id}: {e}")
+                return FAILED
+
+_sender = _Sender()
+
+async def create_broadcast(session: AsyncSession, text: str, target: str, created_by: int,
+                           city_id: Optional[int] = None) -> int:
+    """
+    Ставит рассылку в очередь. Отправку начнет resume_broadcasts() процесса фоновых задач.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        text: Текст сообщения
+        target: Получатели: TARGET_ALL, TARGET_VIP или TARGET_CITY
+        created_by: Telegram ID администратора (ему придет отчет)
+        city_id: ID города для TARGET_CITY
+
+    Returns:
+        ID рассылки
+    """
+    if target not in BROADCAST_TARGETS:
+        raise ValueError(f"Неизвестные получатели рассылки: {target}")
+    if target == TARGET_CITY and city_id is None:
+        raise ValueError("Для рассылки по городу нужен city_id")
+
+    broadcast = Broadcast(text=text, target=target, city_id=city_id, created_by=created_by, status=STATUS_QUEUED)
+    session.add(broadcast)
+    await session.commit()
+    return broadcast.id
+
+def _recipients_query(broadcast: Broadcast, after_user_id: int):
+    # Keyset-пагинация по первичному ключу: каждая пачка - быстрый проход по индексу
+    query = select(User.id, User.telegram_id).where(User.id > after_user_id, User.is_blocked_bot == False)
+    if broadcast.target == TARGET_VIP:
+        query = query.where(User.is_vip)
+    elif broadcast.target == TARGET_CITY:
+        query = query.where(User.city_id == broadcast.city_id)
+    return query.order_by(User.id).limit(BROADCAST_SETTINGS["batch_size"])
+
+async def _checkpoint(session: AsyncSession, broadcast_id: int, last_user_id: int,
+                      outcomes: List[str], blocked_user_ids: List[int]) -> bool:
+    """Сохраняет прогресс пачки. Возвращает False, если рассылку отменили"""
+    if blocked_user_ids:
+        await session.execute(update(User).where(User.id.in_(blocked_user_ids)).values(is_blocked_bot=True))
+
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == STATUS_RUNNING)
+        .values(
+            last_user_id=last_user_id,
+            sent=Broadcast.sent + outcomes.count(SENT),
+            failed=Broadcast.failed + outcomes.count(FAILED),
+            blocked=Broadcast.blocked + outcomes.count(BLOCKED),
+            updated_at=func.now()
+        )
+        .returning(Broadcast.id)
+    )
+    still_running = result.scalar() is not None
+    await session.commit()
+    return still_running
+
+async def run_broadcast(bot: Bot, broadcast_id: int) -> BroadcastReport:
+    """
+    Выполняет рассылку с контрольной точки до конца.
+
+    Получатели читаются пачками по BROADCAST_SETTINGS["batch_size"]; после каждой
+    пачки прогресс сохраняется в broadcasts.last_user_id, поэтому после сбоя
+    повторно получат сообщение не больше одной пачки пользователей.
+    Заблокировавшие бота пользователи помечаются и в следующие рассылки не попадают.
+
+    Args:
+        bot: Экземпляр бота
+        broadcast_id: ID рассылки
+
+    Returns:
+        Итог выполнения этим процессом
+    """
+    started = time.monotonic()
+    report = BroadcastReport(broadcast_id, STATUS_RUNNING)
+
+    async with AsyncSessionContext() as session:
+        broadcast = await session.get(Broadcast, broadcast_id)
+        if broadcast is None or broadcast.status != STATUS_RUNNING:
+            report.status = broadcast.status if broadcast else STATUS_CANCELLED
+            return report
+        last_user_id = broadcast.last_user_id
+
+    while report.status == STATUS_RUNNING:
+        async with AsyncSessionContext() as session:
+            recipients = (await session.execute(_recipients_query(broadcast, last_user_id))).all()
+
+        if not recipients:
+            report.status = STATUS_DONE
+            break
+
+        # Темп задает общий лимит, сами отправки идут параллельно
+        tasks = []
+        for _, telegram_id in recipients:
+            await _sender.acquire()
+            tasks.append(asyncio.create_task(_sender.deliver(bot, telegram_id, broadcast.text)))
+        outcomes = await asyncio.gather(*tasks)
+
+        last_user_id = recipients[-1].id
+        blocked_user_ids = [user_id for (user_id, _), outcome in zip(recipients, outcomes) if outcome == BLOCKED]
+        async with AsyncSessionContext() as session:
+            if not await _checkpoint(session, broadcast_id, last_user_id, outcomes, blocked_user_ids):
+                report.status = STATUS_CANCELLED
+
+        report.sent += outcomes.count(SENT)
+        report.failed += outcomes.count(FAILED)
+        report.blocked += len(blocked_user_ids)
+        report.elapsed = time.monotonic() - started
+        logger.info(
+            f"Рассылка {broadcast_id}: обработано {len(recipients)} получателей, "
+            f"всего доставлено {report.sent}, {report.throughput:.1f} сообщ./с"
+        )
+
+    if report.status == STATUS_DONE:
+        async with AsyncSessionContext() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id, Broadcast.status == STATUS_RUNNING)
+                .values(status=STATUS_DONE, finished_at=func.now())
+            )
+            await session.commit()
+
+    report.elapsed = time.monotonic() - started
+    logger.info(
+        f"Рассылка {broadcast_id} {report.status}: доставлено {report.sent}, ошибок {report.failed}, "
+        f"заблокировали бота {report.blocked}, {report.elapsed:.0f} с, {report.throughput:.1f} сообщ./с"
+    )
+    try:
+        await bot.send_message(
+            broadcast.created_by,
+            f"Рассылка #{broadcast_id}: {'завершена' if report.status == STATUS_DONE else 'остановлена'}.\n"
+            f"Доставлено: {report.sent}, ошибок: {report.failed}, заблокировали бота: {report.blocked}.\n"
+            f"Скорость: {report.throughput:.1f} сообщений в секунду."
+        )
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось отправить отчет о рассылке {broadcast_id}: {e}")
+    return report
+
+def start_broadcast(bot: Bot, broadcast_id: int) -> None:
+    """Запускает выполнение рассылки в фоне этого процесса"""
+    if broadcast_id in _broadcast_tasks:
+        return
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id))
+    _broadcast_tasks[broadcast_id] = task
+    task.add_done_callback(lambda finished: _forget(broadcast_id, finished))
+
+def _forget(broadcast_id: int, task: asyncio.Task) -> None:
+    _broadcast_tasks.pop(broadcast_id, None)
+    if not task.cancelled() and task.exception():
+        # Рассылка останется в статусе running и будет продолжена resume_broadcasts()
+        logger.error(f"Рассылка {broadcast_id} прервана ошибкой: {task.exception()}")
+
+async def resume_broadcasts(bot: Bot) -> int:
+    """
+    Запускает новые рассылки из очереди и продолжает прерванные сбоем или перезапуском.
+
+    Вызывается только фоновой задачей (в многопроцессном режиме - приемщиком),
+    поэтому все рассылки отправляет один процесс с общим темпом _sender.
+    Рассылка считается прерванной, если ее контрольная точка не обновлялась
+    дольше BROADCAST_SETTINGS["stale_timeout"]. Захват выполняется атомарным
+    UPDATE, поэтому одну рассылку запустит только один процесс.
+
+    Returns:
+        Количество запущенных рассылок
+    """
+    running = [
+        Broadcast.status == STATUS_RUNNING,
+        # updated_at пишется через now() базы данных - сравниваем с ее же часами
+        Broadcast.updated_at < func.now() - timedelta(seconds=BROADCAST_SETTINGS["stale_timeout"]),
+    ]
+    if _broadcast_tasks:
+        running.append(Broadcast.id.notin_(list(_broadcast_tasks)))
+    conditions = [or_(Broadcast.status == STATUS_QUEUED, and_(*running))]
+
+    async with AsyncSessionContext() as session:
+        result = await session.execute(
+            update(Broadcast)
+            .where(*conditions)
+            .values(status=STATUS_RUNNING, updated_at=func.now())
+            .returning(Broadcast.id)
+        )
+        broadcast_ids = list(result.scalars())
+        await session.commit()
+
+    for broadcast_id in broadcast_ids:
+        logger.info(f"Запуск рассылки {broadcast_id}")
+        start_broadcast(bot, broadcast_id)
+    return len(broadcast_ids)
+
+async def cancel_broadcast(session: AsyncSession, broadcast_id: int) -> bool:
+    """
+    Останавливает рассылку. Отправка прекратится после текущей пачки.
+
+    Returns:
+        True, если рассылка ждала запуска или выполнялась и была отменена
+    """
+    result = await session.execute(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status.in_([STATUS_QUEUED, STATUS_RUNNING]))
+        .values(status=STATUS_CANCELLED, finished_at=func.now())
+        .returning(Broadcast.id)
+    )
+    cancelled = result.scalar() is not None
+    await session.commit()
+    return cancelled
+
+async def get_recent_broadcasts(session: AsyncSession, limit: int = 5) -> List[Broadcast]:
+    """Возвращает последние рассылки, начиная с новых"""
+    result = await session.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(limit))
+    return list(result.scalars())
+
+async def unmark_blocked(session: AsyncSession, telegram_id: int) -> None:
+    """Возвращает пользователя в рассылки, когда он снова пишет боту"""
+    await session.execute(
+        update(User)
+        .where(User.telegram_id == telegram_id, User.is_blocked_bot == True)
+        .values(is_blocked_bot=False)
+    )
+    await session.commit()
@@ -0,0 +1,144 @@
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, event
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from config import POPULAR_CITIES, CITY_ALIASES
+from database.models import City
+from utils.city_matcher import city_matcher, normalize_city_key
+from utils.invalidation import invalidation_bus, city_key, KIND_CITY
+
+class CityRef(NamedTuple):
+    """Запись справочника городов, хранящаяся в памяти процесса"""
+    id: int
+    name: str
+
+# Справочник городов в памяти: заполняется при старте через load_cities()
+_cities_by_id: Dict[int, CityRef] = {}
+_cities_by_key: Dict[str, CityRef] = {}
+
+# Ключ session.info: города, добавленные в текущей транзакции сессии
+_NEW_CITIES = "new_cities"
+
+def _remember(city_id: int, name: str, aliases: List[str] = ()) -> CityRef:
+    ref = CityRef(city_id, name)
+    _cities_by_id[city_id] = ref
+    _cities_by_key[normalize_city_key(name)] = ref
+
+    city_matcher.learn(name)
+    for alias in aliases:
+        city_matcher.add_alias(alias, name)
+
+    return ref
+
+async def seed_cities(session: AsyncSession) -> None:
+    """
+    Добавляет в справочник популярные города и их сокращения, если их еще нет.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+    """
+    aliases: Dict[str, List[str]] = {}
+    for alias, city in CITY_ALIASES.items():
+        aliases.setdefault(city, []).append(alias)
+
+    # dict.fromkeys убирает повторы, сохраняя порядок
+    rows = [{"name": city, "aliases": aliases.get(city, [])} for city in dict.fromkeys(POPULAR_CITIES)]
+    await session.execute(insert(City).values(rows).on_conflict_do_nothing(index_elements=[City.name]))
+    await session.commit()
+
+async def load_cities(session: AsyncSession) -> None:
+    """
+    Загружает справочник городов в память и обучает на нем city_matcher.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+    """
+    result = await session.execute(select(City.id, City.name, City.aliases))
+    for city_id, name, aliases in result:
+        _remember(city_id, name, aliases or [])
+
+async def get_or_create_city(session: AsyncSession, name: str) -> CityRef:
+    """
+    Возвращает город по каноническому названию, добавляя его в справочник при необходимости.
+
+    Транзакцию фиксирует вызывающий код. Новый город попадает в справочник
+    в памяти (и в city_matcher) только после commit этой сессии.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        name: Каноническое название города (результат city_matcher или validate_city)
+
+    Returns:
+        Запись справочника городов
+    """
+    ref = _cities_by_key.get(normalize_city_key(name))
+    if ref:
+        return ref
+    if len(name) > City.name.type.length:
+        raise ValueError(f"Название города длиннее {City.name.type.length} символов")
+
+    result = await session.execute(
+        insert(City)
+        .values(name=name, aliases=[])
+        .on_conflict_do_nothing(index_elements=[City.name])
+        .returning(City.id)
+    )
+    city_id = result.scalar()
+
+    if city_id is None:
+        # Город уже добавлен другим процессом
+        result = await session.execute(select(City.id).where(City.name == name))
+        city_id = result.scalar_one()
+        return _remember(city_id, name)
+
+    # Остальные процессы добавят город в свой справочник после commit
+    await invalidation_bus.publish(session, city_key(city_id))
+    session.info.setdefault(_NEW_CITIES, []).append((city_id, name))
+    return CityRef(city_id, name)
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed_cities(session: Session) -> None:
+    for city_id, name in session.info.pop(_NEW_CITIES, ()):
+        _remember(city_id, name)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_cities(session: Session) -> None:
+    session.info.pop(_NEW_CITIES, None)
+
+async def _on_city_changed(city_id: Optional[int]) -> None:
+    # Город, добавленный другим процессом, загружаем в справочник в памяти
+    if city_id is not None and city_id in _cities_by_id:
+        return
+    from database.db import AsyncSessionContext
+
+    async with AsyncSessionContext() as session:
+        if city_id is None:
+            await load_cities(session)
+            return
+        result = await session.execute(select(City.name, City.aliases).where(City.id == city_id))
+        row = result.first()
+    if row:
+        _remember(city_id, row.name, row.aliases or [])
+
+invalidation_bus.subscribe(KIND_CITY, _on_city_changed)
+
+def find_city(text: str) -> Optional[CityRef]:
+    """Возвращает город по свободному вводу, если совпадение однозначное"""
+    match = city_matcher.resolve(text)
+    return _cities_by_key.get(normalize_city_key(match.city)) if match.city else None
+
+def get_city(city_id: int) -> Optional[CityRef]:
+    """Возвращает город из справочника в памяти по его ID"""
+    return _cities_by_id.get(city_id)
+
+def get_city_name(city_id: int) -> str:
+    """Возвращает название города по его ID (пустую строку для неизвестного ID)"""
+    ref = _cities_by_id.get(city_id)
+    return ref.name if ref else ""
+
+def get_popular_cities() -> List[CityRef]:
+    """Возвращает популярные города в порядке из config.POPULAR_CITIES"""
+    cities = (_cities_by_key.get(normalize_city_key(name)) for name in dict.fromkeys(POPULAR_CITIES))
+    return [city for city in cities if city]
@@ -1,22 +1,41 @@
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import List, NamedTuple, Tuple, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.orm import joinedload
 
-from database.models import User, Event, EventPurpose, EventTargetAudience, event_participants
+from config import SECURITY_SETTINGS, LISTING_CACHE_SETTINGS
+from database.db import AsyncSessionContext
+from database.models import User, Event, EventPurpose, EventTargetAudience, Gender, event_participants
+from services.quota_service import quota_limiter, QUOTA_REGISTRATIONS
+from utils.invalidation import invalidation_bus, event_key, user_key, city_key, KIND_CITY
+from utils.listing_cache import ListingCache
 
-async def create_event(session: AsyncSession, creator_id: int, title: str, city: str, 
+class ListingFilters(NamedTuple):
+    """Общие для группы пользователей фильтры списка мероприятий города"""
+    audiences: Tuple[EventTargetAudience, ...]
+    include_hidden: bool
+    age: Optional[int]
+
+# Списки мероприятий городов: (ID города, страница, фильтры) -> [(мероприятие, количество участников)]
+city_listings = ListingCache(
+    ttl=LISTING_CACHE_SETTINGS["ttl"],
+    stale_ttl=LISTING_CACHE_SETTINGS["stale_ttl"],
+    maxsize=LISTING_CACHE_SETTINGS["cache_size"]
+)
+
+async def create_event(session: AsyncSession, creator_id: int, title: str, city_id: int, 
                       purpose: EventPurpose, target_audience: EventTargetAudience, 
                       description: str, event_date: datetime, min_age: int = None, 
                       max_age: int = None, max_participants: int = None) -> Event:
     """
-    Создает новое мероприятие.
+    Создает новое мероприятие. Фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
         creator_id: ID создателя мероприятия
         title: Название мероприятия
-        city: Город проведения
+        city_id: ID города проведения из справочника городов
         purpose: Цель мероприятия (из перечисления EventPurpose)
         target_audience: Целевая аудитория (из перечисления EventTargetAudience)
         description: Описание мероприятия
@@ -31,7 +50,7 @@ async def create_event(session: AsyncSession, creator_id: int, title: str, city:
     event = Event(
         creator_id=creator_id,
         title=title,
-        city=city,
+        city_id=city_id,
         purpose=purpose,
         target_audience=target_audience,
         min_age=min_age,
@@ -43,18 +62,21 @@ async def create_event(session: AsyncSession, creator_id: int, title: str, city:
     )
     
     session.add(event)
-    await session.commit()
-    await session.refresh(event)
+    # INSERT ... RETURNING заполняет id и created_at без отдельного SELECT
+    await session.flush()
+    
+    # Новое мероприятие должно появиться в лентах города во всех процессах
+    await invalidation_bus.publish(session, city_key(city_id))
     
     return event
 
-async def get_events_by_city(session: AsyncSession, city: str) -> List[Event]:
+async def get_events_by_city(session: AsyncSession, city_id: int) -> List[Event]:
     """
     Получает список мероприятий в указанном городе.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
-        city: Название города
+        city_id: ID города из справочника городов
     
     Returns:
         Список объектов мероприятий
@@ -63,7 +85,7 @@ async def get_events_by_city(session: AsyncSession, city: str) -> List[Event]:
         select(Event)
         .where(
             and_(
-                Event.city == city,
+                Event.city_id == city_id,
                 Event.event_date > datetime.now(),
                 Event.is_hidden == False
             )
@@ -72,6 +94,135 @@ async def get_events_by_city(session: AsyncSession, city: str) -> List[Event]:
     )
     return result.scalars().all()
 
+def participants_count_subquery():
+    """Коррелированный подзапрос с количеством участников мероприятия"""
+    return (
+        select(func.count())
+        .select_from(event_participants)
+        .where(event_participants.c.event_id == Event.id)
+        .correlate(Event)
+        .scalar_subquery()
+    )
+
+def allowed_audiences(user: User) -> Tuple[EventTargetAudience, ...]:
+    """Аудитории мероприятий, которые подходят пользователю по полу"""
+    audiences = [EventTargetAudience.ALL]
+    if user.gender == Gender.MALE:
+        audiences.append(EventTargetAudience.MALE)
+    elif user.gender == Gender.FEMALE:
+        audiences.append(EventTargetAudience.FEMALE)
+    return tuple(audiences)
+
+def listing_filters(user: User) -> ListingFilters:
+    """Возвращает фильтры списка мероприятий, общие для пользователей того же пола, статуса и возраста"""
+    return ListingFilters(allowed_audiences(user), bool(user.is_vip), user.age)
+
+async def _load_city_listing(city_id: int, page: int, filters: ListingFilters) -> List[Tuple[Event, int]]:
+    page_size = LISTING_CACHE_SETTINGS["page_size"]
+    participants_count = participants_count_subquery()
+    conditions = [
+        Event.city_id == city_id,
+        Event.event_date > datetime.now(),
+        Event.target_audience.in_(filters.audiences),
+        or_(Event.max_participants.is_(None), participants_count < Event.max_participants),
+    ]
+    if not filters.include_hidden:
+        conditions.append(Event.is_hidden == False)
+    if filters.age is not None:
+        conditions.append(or_(Event.min_age.is_(None), Event.min_age <= filters.age))
+        conditions.append(or_(Event.max_age.is_(None), Event.max_age >= filters.age))
+    
+    # Собственная сессия: результат получат все запросы, ожидающие этот список
+    async with AsyncSessionContext() as session:
+        result = await session.execute(
+            select(Event, participants_count.label("participants_count"))
+            .options(joinedload(Event.creator))
+            .where(and_(*conditions))
+            .order_by(Event.event_date)
+            .limit(page_size)
+            .offset(page * page_size)
+        )
+        return [(event, count) for event, count in result.all()]
+
+async def get_city_listing(city_id: int, filters: ListingFilters, page: int = 0) -> List[Tuple[Event, int]]:
+    """
+    Получает страницу предстоящих мероприятий города со свободными местами.
+    
+    Список общий для всех пользователей с одинаковыми фильтрами и кэшируется
+    со stale-while-revalidate: при массовом просмотре одного города (например,
+    после рассылки) запрос к базе данных выполняется один раз.
+    
+    Args:
+        city_id: ID города из справочника городов
+        filters: Фильтры из listing_filters()
+        page: Номер страницы (по LISTING_CACHE_SETTINGS["page_size"] мероприятий)
+    
+    Returns:
+        Список пар (мероприятие с загруженным организатором, количество участников).
+        Список общий для нескольких пользователей - изменять его нельзя.
+    """
+    return await city_listings.get(
+        (city_id, page, filters),
+        lambda: _load_city_listing(city_id, page, filters)
+    )
+
+async def get_listing_for_user(session: AsyncSession, user: User, city_id: int,
+                               page: int = 0) -> Tuple[List[Tuple[Event, int]], bool]:
+    """
+    Получает страницу мероприятий города, на которые пользователь может зарегистрироваться.
+    
+    Использует общий список get_city_listing(): аудитория, скрытые мероприятия
+    и возраст проверяются в SQL и входят в ключ кэша. Персональные условия
+    (собственные мероприятия и текущие регистрации) отсекают лишь несколько
+    мероприятий страницы и проверяются для готового списка; регистрации - одним
+    запросом по индексу ix_event_participants_user_id.
+    
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        user: Пользователь, который просматривает мероприятия
+        city_id: ID города из справочника городов
+        page: Номер страницы общего списка (по LISTING_CACHE_SETTINGS["page_size"] мероприятий)
+    
+    Returns:
+        Список пар (мероприятие, количество участников) в порядке даты проведения
+        и признак того, что у списка есть следующая страница
+    """
+    listing = await get_city_listing(city_id, listing_filters(user), page)
+    has_more = len(listing) >= LISTING_CACHE_SETTINGS["page_size"]
+    
+    events = [(event, count) for event, count in listing if event.creator_id != user.id]
+    if not events:
+        return events, has_more
+    
+    result = await session.execute(
+        select(event_participants.c.event_id).where(
+            event_participants.c.user_id == user.id,
+            event_participants.c.event_id.in_([event.id for event, _ in events])
+        )
+    )
+    registered = set(result.scalars())
+    return [(event, count) for event, count in events if event.id not in registered], has_more
+
+async def get_upcoming_event_cities(session: AsyncSession, creator_ids: List[int]) -> List[int]:
+    """Города, в которых у организаторов creator_ids есть предстоящие мероприятия"""
+    if not creator_ids:
+        return []
+    result = await session.scalars(
+        select(Event.city_id)
+        .where(Event.creator_id.in_(creator_ids), Event.event_date > datetime.now())
+        .distinct()
+    )
+    return list(result)
+
+def invalidate_city_listings(city_id: Optional[int]) -> None:
+    """Помечает устаревшими списки мероприятий города; None - всех городов"""
+    if city_id is None:
+        city_listings.clear()
+    else:
+        city_listings.invalidate(lambda key: key[0] == city_id)
+
+invalidation_bus.subscribe(KIND_CITY, invalidate_city_listings)
+
 async def get_event_by_id(session: AsyncSession, event_id: int) -> Optional[Event]:
     """
     Получает мероприятие по его ID.
@@ -106,9 +257,13 @@ async def register_for_event(session: AsyncSession, user_id: int, event_id: int)
     if not event:
         return False, "Мероприятие не найдено"
     
-    # Проверяем, не заполнено ли мероприятие
-    if event.is_full:
-        return False, "Мероприятие уже заполнено"
+    # Проверяем, не заполнено ли мероприятие (считаем участников в базе, не загружая их)
+    if event.max_participants:
+        participants_count = await session.scalar(
+            select(func.count()).select_from(event_participants).where(event_participants.c.event_id == event_id)
+        )
+        if participants_count >= event.max_participants:
+            return False, "Мероприятие уже заполнено"
     
     # Получаем пользователя
     result = await session.execute(select(User).where(User.id == user_id))
@@ -142,10 +297,20 @@ async def register_for_event(session: AsyncSession, user_id: int, event_id: int)
     if result.first():
         return False, "Вы уже зарегистрированы на это мероприятие"
     
+    # Проверяем дневной лимит регистраций (без запроса к базе данных, если счетчик уже загружен)
+    ticket = await quota_limiter.acquire(session, QUOTA_REGISTRATIONS, user_id)
+    if ticket is None:
+        return False, f"Можно зарегистрироваться не более чем на {SECURITY_SETTINGS['max_registrations_per_day']} мероприятий в сутки"
+    
     # Регистрируем пользователя
-    stmt = event_participants.insert().values(user_id=user_id, event_id=event_id)
-    await session.execute(stmt)
-    await session.commit()
+    try:
+        stmt = event_participants.insert().values(user_id=user_id, event_id=event_id)
+        await session.execute(stmt)
+        await invalidation_bus.publish(session, event_key(event_id), user_key(user_id), city_key(event.city_id))
+        await session.commit()
+    except Exception:
+        await quota_limiter.release(QUOTA_REGISTRATIONS, user_id, ticket)
+        raise
     
     return True, "Вы успешно зарегистрировались на мероприятие"
 
@@ -175,6 +340,9 @@ async def unregister_from_event(session: AsyncSession, user_id: int, event_id: i
     if not result.first():
         return False, "Вы не зарегистрированы на это мероприятие"
     
+    # Город нужен, чтобы обновить списки мероприятий
+    city_id = await session.scalar(select(Event.city_id).where(Event.id == event_id))
+    
     # Отменяем регистрацию
     stmt = event_participants.delete().where(
         and_(
@@ -183,6 +351,7 @@ async def unregister_from_event(session: AsyncSession, user_id: int, event_id: i
         )
     )
     await session.execute(stmt)
+    await invalidation_bus.publish(session, event_key(event_id), user_key(user_id), city_key(city_id))
     await session.commit()
     
     return True, "Вы успешно отменили регистрацию на мероприятие"
@@ -0,0 +1,131 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, List, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, Table
+
+from config import EXPORT_SETTINGS
+from database.models import User, Event, Rating, Transaction, event_participants
+
+# Таблицы, доступные для выгрузки
+EXPORT_TABLES: Dict[str, Table] = {
+    "users": User.__table__,
+    "events": Event.__table__,
+    "participations": event_participants,
+    "ratings": Rating.__table__,
+    "transactions": Transaction.__table__,
+}
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+def _plain(value: Any) -> Any:
+    """Приводит значение из базы данных к типу, который понимают csv и json"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+class _GzipWriter:
+    """Построчная запись выгрузки в gzip-файл"""
+
+    def __init__(self, path: str, columns: List[str], fmt: str):
+        self.columns = columns
+        self.fmt = fmt
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        if fmt == "csv":
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(columns)
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        if self.fmt == "csv":
+            self._csv.writerows(
+                [json.dumps(value, ensure_ascii=False) if isinstance(value, list) else _plain(value) for value in row]
+                for row in rows
+            )
+        else:
+            self._file.writelines(
+                json.dumps(dict(zip(self.columns, map(_plain, row))), ensure_ascii=False) + "\n"
+                for row in rows
+            )
+
+    def close(self) -> None:
+        self._file.close()
+
+def split_file(path: str, part_size: int) -> List[str]:
+    """
+    Делит файл на части не больше part_size байт (path.part001, path.part002, ...).
+
+    Части собираются обратно простой склейкой: cat file.part* > file.
+    Исходный файл удаляется, вызывающий код удаляет части после отправки.
+    """
+    parts = []
+    try:
+        with open(path, "rb") as source:
+            while True:
+                chunk = source.read(part_size)
+                if not chunk:
+                    break
+                part_path = f"{path}.part{len(parts) + 1:03d}"
+                parts.append(part_path)
+                with open(part_path, "wb") as part:
+                    part.write(chunk)
+    except Exception:
+        for part_path in parts:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        raise
+    os.remove(path)
+    return parts
+
+async def export_table(session: AsyncSession, table_name: str, fmt: str = "csv") -> str:
+    """
+    Выгружает таблицу в сжатый gzip файл CSV или NDJSON.
+
+    Строки читаются серверным курсором пачками по EXPORT_SETTINGS["batch_size"],
+    поэтому расход памяти не зависит от размера таблицы. Сжатие и запись
+    пачки выполняются в отдельном потоке.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        table_name: Название выгрузки из EXPORT_TABLES
+        fmt: Формат: "csv" или "ndjson"
+
+    Returns:
+        Путь к временному файлу (вызывающий код удаляет его после отправки)
+    """
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица для выгрузки: {table_name}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    table = EXPORT_TABLES[table_name]
+    columns = [column.name for column in table.columns]
+    primary_key = list(table.primary_key.columns) or list(table.columns)[:1]
+
+    fd, path = tempfile.mkstemp(prefix=f"{table_name}_", suffix=f".{fmt}.gz")
+    os.close(fd)
+
+    writer = _GzipWriter(path, columns, fmt)
+    try:
+        result = await session.stream(
+            select(table)
+            .order_by(*primary_key)
+            .execution_options(yield_per=EXPORT_SETTINGS["batch_size"])
+        )
+        async for partition in result.partitions():
+            await asyncio.to_thread(writer.write_rows, partition)
+    except BaseException:
+        writer.close()
+        os.remove(path)
+        raise
+
+    await asyncio.to_thread(writer.close)
+    return path
@@ -0,0 +1,184 @@
+from datetime import timedelta
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+
+from config import LEDGER_SETTINGS
+from database.models import User, Transaction, BalanceSnapshot
+
+class LedgerResult(NamedTuple):
+    """Результат операции с токенами"""
+    applied: bool  # Операция записана в журнал и изменила баланс
+    duplicate: bool  # Операция с этим ключом идемпотентности уже была применена ранее
+    balance: Optional[int]  # Баланс после операции (None, если токенов недостаточно)
+
+async def apply_transaction(session: AsyncSession, user_id: int, amount: int, description: str,
+                            idempotency_key: Optional[str] = None) -> LedgerResult:
+    """
+    Записывает операцию в журнал токенов и атомарно меняет баланс пользователя.
+
+    Баланс меняется одним условным UPDATE (tokens + amount >= 0), поэтому
+    параллельные списания не уводят баланс в минус. Повторный вызов с тем же
+    idempotency_key не меняет баланс и возвращает результат первой операции.
+
+    Функция не фиксирует транзакцию: вызывающий код делает commit, чтобы
+    списание и связанные изменения (например, активация VIP) применились вместе.
+    При недостатке токенов откатывается только сама операция (SAVEPOINT).
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        user_id: ID пользователя
+        amount: Сумма операции (отрицательная для списания)
+        description: Описание операции
+        idempotency_key: Уникальный ключ операции
+
+    Returns:
+        Результат операции
+    """
+    savepoint = await session.begin_nested()
+
+    # Сначала запись журнала: повторный ключ отсекается уникальным индексом,
+    # а параллельная операция с тем же ключом ждет фиксации первой
+    result = await session.execute(
+        insert(Transaction)
+        .values(user_id=user_id, amount=amount, description=description, idempotency_key=idempotency_key)
+        .on_conflict_do_nothing(index_elements=[Transaction.idempotency_key])
+        .returning(Transaction.id)
+    )
+    transaction_id = result.scalar()
+
+    if transaction_id is None:
+        result = await session.execute(
+            select(Transaction.balance_after).where(Transaction.idempotency_key == idempotency_key)
+        )
+        balance_after = result.scalar()
+        await savepoint.commit()
+        return LedgerResult(applied=False, duplicate=True, balance=balance_after)
+
+    # Изменение баланса и запись баланса после операции - один запрос
+    balance = (
+        update(User)
+        .where(User.id == user_id, User.tokens + amount >= 0)
+        .values(tokens=User.tokens + amount)
+        .returning(User.tokens)
+        .cte("balance")
+    )
+    result = await session.execute(
+        update(Transaction)
+        .where(Transaction.id == transaction_id, balance.c.tokens.isnot(None))
+        .values(balance_after=balance.c.tokens)
+        .returning(Transaction.balance_after)
+    )
+    balance_after = result.scalar()
+
+    if balance_after is None:
+        # Недостаточно токенов: убираем запись журнала
+        await savepoint.rollback()
+        return LedgerResult(applied=False, duplicate=False, balance=None)
+
+    await savepoint.commit()
+    return LedgerResult(applied=True, duplicate=False, balance=balance_after)
+
+async def get_ledger_balance(session: AsyncSession, user_id: int) -> int:
+    """
+    Вычисляет баланс пользователя по журналу токенов.
+
+    Суммируются только операции после последнего снимка баланса,
+    поэтому запрос не замедляется с ростом истории.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        user_id: ID пользователя
+
+    Returns:
+        Баланс по журналу
+    """
+    result = await session.execute(
+        select(BalanceSnapshot.balance, BalanceSnapshot.last_transaction_id)
+        .where(BalanceSnapshot.user_id == user_id)
+        .order_by(BalanceSnapshot.last_transaction_id.desc())
+        .limit(1)
+    )
+    snapshot = result.first()
+    balance, last_transaction_id = snapshot if snapshot else (0, 0)
+
+    result = await session.execute(
+        select(func.coalesce(func.sum(Transaction.amount), 0))
+        .where(Transaction.user_id == user_id, Transaction.id > last_transaction_id)
+    )
+    return balance + result.scalar()
+
+def _latest_snapshots():
+    """Подзапрос с последним снимком баланса каждого пользователя"""
+    return (
+        select(BalanceSnapshot.user_id, BalanceSnapshot.balance, BalanceSnapshot.last_transaction_id)
+        .distinct(BalanceSnapshot.user_id)
+        .order_by(BalanceSnapshot.user_id, BalanceSnapshot.last_transaction_id.desc())
+        .subquery()
+    )
+
+async def take_balance_snapshots(session: AsyncSession) -> int:
+    """
+    Создает снимки баланса для пользователей с новыми операциями после прошлого снимка.
+
+    Самые свежие операции в снимок не попадают: ID выдается при вставке, и операция
+    с меньшим ID может быть зафиксирована позже операции с большим.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+
+    Returns:
+        Количество созданных снимков
+    """
+    latest = _latest_snapshots()
+    new_balances = (
+        select(
+            Transaction.user_id,
+            func.coalesce(latest.c.balance, 0) + func.sum(Transaction.amount),
+            func.max(Transaction.id),
+        )
+        .select_from(Transaction)
+        .outerjoin(latest, latest.c.user_id == Transaction.user_id)
+        .where(
+            Transaction.id > func.coalesce(latest.c.last_transaction_id, 0),
+            Transaction.created_at < func.now() - timedelta(seconds=LEDGER_SETTINGS["snapshot_lag"])
+        )
+        .group_by(Transaction.user_id, latest.c.balance)
+    )
+    result = await session.execute(
+        insert(BalanceSnapshot)
+        .from_select(["user_id", "balance", "last_transaction_id"], new_balances)
+        .returning(BalanceSnapshot.id)
+    )
+    created = len(result.all())
+    await session.commit()
+    return created
+
+async def find_balance_mismatches(session: AsyncSession) -> List[Tuple[int, int, int]]:
+    """
+    Сверяет баланс пользователей с журналом токенов (снимок + операции после него).
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+
+    Returns:
+        Список (ID пользователя, баланс в профиле, баланс по журналу) для расхождений
+    """
+    latest = _latest_snapshots()
+    tail = (
+        select(Transaction.user_id, func.sum(Transaction.amount).label("amount"))
+        .select_from(Transaction)
+        .outerjoin(latest, latest.c.user_id == Transaction.user_id)
+        .where(Transaction.id > func.coalesce(latest.c.last_transaction_id, 0))
+        .group_by(Transaction.user_id)
+        .subquery()
+    )
+    ledger_balance = func.coalesce(latest.c.balance, 0) + func.coalesce(tail.c.amount, 0)
+    result = await session.execute(
+        select(User.id, User.tokens, ledger_balance)
+        .outerjoin(latest, latest.c.user_id == User.id)
+        .outerjoin(tail, tail.c.user_id == User.id)
+        .where(func.coalesce(User.tokens, 0) != ledger_balance)
+    )
+    return [tuple(row) for row in result.all()]
@@ -0,0 +1,188 @@
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+
+from config import SECURITY_SETTINGS, QUOTA_SETTINGS
+from database.models import Event, event_participants
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Redis нужен только для нескольких экземпляров бота
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Виды квот и их лимиты за окно QUOTA_SETTINGS["window"]
+QUOTA_EVENTS = "events"
+QUOTA_REGISTRATIONS = "registrations"
+
+QUOTA_LIMITS = {
+    QUOTA_EVENTS: SECURITY_SETTINGS["max_events_per_day"],
+    QUOTA_REGISTRATIONS: SECURITY_SETTINGS["max_registrations_per_day"],
+}
+
+QuotaKey = Tuple[str, int]
+
+class MemoryQuotaBackend:
+    """
+    Скользящие окна в памяти процесса: очередь отметок времени на пользователя.
+
+    Подходит для одного процесса и для кластера из cluster.py: пользователь
+    всегда обрабатывается одним и тем же воркером.
+    """
+
+    def __init__(self):
+        self._windows: Dict[QuotaKey, Deque[float]] = {}
+
+    async def is_loaded(self, key: QuotaKey) -> bool:
+        return key in self._windows
+
+    async def load(self, key: QuotaKey, timestamps: List[float], window: float) -> None:
+        self._windows.setdefault(key, deque(sorted(timestamps)))
+
+    async def try_acquire(self, key: QuotaKey, now: float, window: float, limit: int) -> Optional[str]:
+        timestamps = self._windows.setdefault(key, deque())
+        while timestamps and timestamps[0] <= now - window:
+            timestamps.popleft()
+        if len(timestamps) >= limit:
+            return None
+        timestamps.append(now)
+        return repr(now)
+
+    async def release(self, key: QuotaKey, ticket: str) -> None:
+        timestamps = self._windows.get(key)
+        if timestamps is not None:
+            try:
+                timestamps.remove(float(ticket))
+            except ValueError:
+                pass
+
+    async def purge(self, now: float, window: float) -> int:
+        """Удаляет окна пользователей без действий за последнее окно"""
+        stale = [key for key, timestamps in self._windows.items() if not timestamps or timestamps[-1] <= now - window]
+        for key in stale:
+            del self._windows[key]
+        return len(stale)
+
+class RedisQuotaBackend:
+    """
+    Скользящие окна в Redis (или совместимом сервере): sorted set на пользователя.
+
+    Нужен, когда пользователя могут обслуживать несколько независимых экземпляров бота.
+    Проверка и резервирование выполняются атомарно одним Lua-скриптом.
+    """
+
+    ACQUIRE_SCRIPT = """
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1] - ARGV[2])
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("Для QUOTA_SETTINGS['redis_url'] нужен пакет redis")
+        self._redis = redis.from_url(url)
+        self._acquire = self._redis.register_script(self.ACQUIRE_SCRIPT)
+
+    @staticmethod
+    def _name(key: QuotaKey) -> str:
+        return f"quota:{key[0]}:{key[1]}"
+
+    async def is_loaded(self, key: QuotaKey) -> bool:
+        return bool(await self._redis.exists(f"{self._name(key)}:loaded"))
+
+    async def load(self, key: QuotaKey, timestamps: List[float], window: float) -> None:
+        name = self._name(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # Окно заполняется заново: в базе данных уже есть все состоявшиеся действия,
+            # и квитанции прошлых резервирований иначе посчитались бы второй раз
+            pipe.delete(name)
+            if timestamps:
+                pipe.zadd(name, {repr(ts): ts for ts in timestamps})
+                pipe.expire(name, int(window))
+            pipe.set(f"{name}:loaded", 1, ex=int(window))
+            await pipe.execute()
+
+    async def try_acquire(self, key: QuotaKey, now: float, window: float, limit: int) -> Optional[str]:
+        ticket = f"{now!r}:{uuid.uuid4().hex[:8]}"
+        acquired = await self._acquire(keys=[self._name(key)], args=[now, int(window), limit, ticket])
+        return ticket if acquired else None
+
+    async def release(self, key: QuotaKey, ticket: str) -> None:
+        await self._redis.zrem(self._name(key), ticket)
+
+    async def purge(self, now: float, window: float) -> int:
+        # Ключи Redis удаляются сами по EXPIRE
+        return 0
+
+class QuotaLimiter:
+    """
+    Ограничение количества действий пользователя за скользящее окно (по умолчанию сутки).
+
+    Счетчик пользователя загружается из базы данных при первом обращении,
+    дальше проверка выполняется без запросов к базе данных.
+    """
+
+    def __init__(self, backend=None, window: float = QUOTA_SETTINGS["window"]):
+        self.backend = backend or MemoryQuotaBackend()
+        self.window = window
+
+    async def _load(self, session: AsyncSession, kind: str, user_id: int) -> List[float]:
+        # Время действий записано часами базы данных (now()), поэтому окно и возраст
+        # действия тоже считаются в SQL; в отметки времени процесса переводится только возраст
+        column = Event.created_at if kind == QUOTA_EVENTS else event_participants.c.registration_time
+        owner = Event.creator_id if kind == QUOTA_EVENTS else event_participants.c.user_id
+        since = func.now() - timedelta(seconds=self.window)
+        result = await session.execute(
+            select(func.extract("epoch", func.now() - column)).where(owner == user_id, column > since)
+        )
+        now = time.time()
+        return [now - float(age) for age in result.scalars() if age is not None]
+
+    async def acquire(self, session: AsyncSession, kind: str, user_id: int) -> Optional[str]:
+        """
+        Резервирует одно действие пользователя в пределах квоты.
+
+        Args:
+            session: Асинхронная сессия SQLAlchemy (нужна только при первой загрузке счетчика)
+            kind: Вид квоты (QUOTA_EVENTS или QUOTA_REGISTRATIONS)
+            user_id: ID пользователя
+
+        Returns:
+            Квитанция для release() или None, если лимит исчерпан
+        """
+        key = (kind, user_id)
+        if not await self.backend.is_loaded(key):
+            await self.backend.load(key, await self._load(session, kind, user_id), self.window)
+
+        ticket = await self.backend.try_acquire(key, time.time(), self.window, QUOTA_LIMITS[kind])
+        if ticket is None:
+            logger.info(f"Пользователь {user_id} исчерпал квоту {kind}")
+        return ticket
+
+    async def release(self, kind: str, user_id: int, ticket: str) -> None:
+        """Возвращает зарезервированное действие, если оно не состоялось"""
+        await self.backend.release((kind, user_id), ticket)
+
+    async def purge(self) -> None:
+        """Освобождает память от счетчиков неактивных пользователей"""
+        removed = await self.backend.purge(time.time(), self.window)
+        if removed:
+            logger.info(f"Удалено неактивных счетчиков квот: {removed}")
+
+def _create_backend():
+    if QUOTA_SETTINGS["redis_url"]:
+        return RedisQuotaBackend(QUOTA_SETTINGS["redis_url"])
+    return MemoryQuotaBackend()
+
+# Общий ограничитель квот приложения
+quota_limiter = QuotaLimiter(_create_backend())
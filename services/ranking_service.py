@@ -0,0 +1,182 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+
+from config import DEFAULT_RATING, RANKING_SETTINGS
+from database.models import User, Event, EventPurpose, event_participants
+from services.event_service import get_listing_for_user
+from utils.invalidation import invalidation_bus, KIND_USER, KIND_CITY
+
+# Порядок целей в векторе предпочтений пользователя
+PURPOSES = list(EventPurpose)
+PURPOSE_INDEX = {purpose: i for i, purpose in enumerate(PURPOSES)}
+
+@dataclass
+class _Feed:
+    """Лента пользователя в городе, дочитанная до next_page страницы общего списка"""
+    expires_at: float
+    events: List[Tuple[Event, int]]
+    next_page: Optional[int] = 0  # None - страниц общего списка больше нет
+    affinity: Optional[np.ndarray] = None
+
+# Кэш ленты: (ID пользователя, ID города) -> лента
+_feed_cache: Dict[Tuple[int, int], _Feed] = {}
+
+async def get_purpose_affinity(session: AsyncSession, user_id: int) -> np.ndarray:
+    """
+    Вычисляет предпочтения пользователя по целям мероприятий на основе прошлых участий.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        user_id: ID пользователя
+
+    Returns:
+        Вектор долей по целям из PURPOSES (со сглаживанием, сумма равна 1)
+    """
+    result = await session.execute(
+        select(Event.purpose, func.count())
+        .join(event_participants, event_participants.c.event_id == Event.id)
+        .where(event_participants.c.user_id == user_id)
+        .group_by(Event.purpose)
+    )
+
+    # Сглаживание: у нового пользователя все цели равновероятны
+    counts = np.ones(len(PURPOSES))
+    for purpose, count in result:
+        counts[PURPOSE_INDEX[purpose]] += count
+    return counts / counts.sum()
+
+def score_events(user: User, affinity: np.ndarray, events: List[Tuple[Event, int]],
+                 now: datetime = None) -> np.ndarray:
+    """
+    Оценивает мероприятия для пользователя одним векторным расчетом.
+
+    Признаки (каждый в диапазоне 0..1): совпадение цели с предпочтениями,
+    рейтинг организатора, заполненность, близость по времени, попадание
+    возраста пользователя в середину возрастного диапазона.
+
+    Args:
+        user: Пользователь, для которого строится лента
+        affinity: Вектор предпочтений по целям (get_purpose_affinity)
+        events: Мероприятия с количеством участников
+        now: Текущее время (для расчета близости)
+
+    Returns:
+        Оценки мероприятий в порядке events
+    """
+    now = now or datetime.now()
+    weights = RANKING_SETTINGS["weights"]
+
+    purposes = np.fromiter((PURPOSE_INDEX[event.purpose] for event, _ in events), dtype=np.int64, count=len(events))
+    # Репутация устойчива к накруткам в отличие от рейтинга, который меняется после каждой оценки
+    creator_ratings = np.fromiter((event.creator.reputation for event, _ in events), dtype=np.float64, count=len(events))
+    participants = np.fromiter((count for _, count in events), dtype=np.float64, count=len(events))
+    capacity = np.fromiter((event.max_participants or 0 for event, _ in events), dtype=np.float64, count=len(events))
+    hours_left = np.fromiter(
+        ((event.event_date - now).total_seconds() / 3600 for event, _ in events), dtype=np.float64, count=len(events)
+    )
+    min_age = np.fromiter((event.min_age or 0 for event, _ in events), dtype=np.float64, count=len(events))
+    max_age = np.fromiter((event.max_age or 0 for event, _ in events), dtype=np.float64, count=len(events))
+
+    # Доля предпочтений относительно самой любимой цели
+    purpose_score = affinity[purposes] / affinity.max()
+
+    rating_score = np.clip(creator_ratings / (2 * DEFAULT_RATING), 0, 1)
+
+    # Для мероприятий без лимита участников - насыщение по количеству участников
+    fill_score = np.where(
+        capacity > 0,
+        participants / np.maximum(capacity, 1),
+        participants / (participants + RANKING_SETTINGS["fill_saturation"])
+    )
+
+    time_score = np.power(0.5, np.maximum(hours_left, 0) / RANKING_SETTINGS["time_half_life_hours"])
+
+    # Возраст в центре диапазона - 1, на границе - 0.5; без ограничений или без возраста - 0.5
+    has_range = (min_age > 0) & (max_age >= min_age)
+    if user.age:
+        middle = (min_age + max_age) / 2
+        half_width = np.maximum((max_age - min_age) / 2, 1)
+        age_fit = np.clip(1 - 0.5 * np.abs(user.age - middle) / half_width, 0, 1)
+        age_score = np.where(has_range, age_fit, 0.5)
+    else:
+        age_score = np.full(len(events), 0.5)
+
+    features = np.vstack([purpose_score, rating_score, fill_score, time_score, age_score])
+    return np.array([
+        weights["purpose"], weights["creator_rating"], weights["fill"], weights["time"], weights["age"]
+    ]) @ features
+
+async def get_ranked_events(session: AsyncSession, user: User, city_id: int,
+                            count: int) -> Tuple[List[Tuple[Event, int]], bool]:
+    """
+    Возвращает мероприятия города, отсортированные по релевантности для пользователя.
+
+    Кандидаты - мероприятия, на которые пользователь может зарегистрироваться
+    (get_listing_for_user). Лента дочитывается по страницам общего списка,
+    только пока в ней меньше count мероприятий: мероприятия ранжируются внутри
+    своей страницы, страницы идут по дате. Лента кэшируется на
+    RANKING_SETTINGS["cache_ttl"] секунд.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+        user: Пользователь, который просматривает мероприятия
+        city_id: ID города
+        count: Сколько мероприятий нужно показать (до конца текущего экрана)
+
+    Returns:
+        Прочитанная часть ленты (мероприятие, количество участников) - не меньше
+        count, если мероприятий хватает, - и признак того, что лента не закончилась
+    """
+    key = (user.id, city_id)
+    feed = _feed_cache.get(key)
+    if feed is None or feed.expires_at <= time.monotonic():
+        feed = _Feed(time.monotonic() + RANKING_SETTINGS["cache_ttl"], [])
+
+    while feed.next_page is not None and len(feed.events) < count:
+        events, has_more = await get_listing_for_user(session, user, city_id, feed.next_page)
+        if events:
+            if feed.affinity is None:
+                feed.affinity = await get_purpose_affinity(session, user.id)
+            scores = score_events(user, feed.affinity, events)
+            # При равной оценке раньше показываем более близкое мероприятие (кандидаты отсортированы по дате)
+            order = np.argsort(-scores, kind="stable")
+            feed.events.extend(events[i] for i in order)
+        feed.next_page = feed.next_page + 1 if has_more else None
+
+    _remember(key, feed)
+    return feed.events, feed.next_page is not None
+
+def _remember(key: Tuple[int, int], feed: _Feed) -> None:
+    now = time.monotonic()
+    if key not in _feed_cache and len(_feed_cache) >= RANKING_SETTINGS["cache_size"]:
+        for stale_key in [k for k, cached in _feed_cache.items() if cached.expires_at <= now]:
+            del _feed_cache[stale_key]
+        # Если устаревших нет, вытесняем самую старую запись
+        if len(_feed_cache) >= RANKING_SETTINGS["cache_size"]:
+            del _feed_cache[next(iter(_feed_cache))]
+    _feed_cache[key] = feed
+
+def invalidate_user_feed(user_id: Optional[int]) -> None:
+    """Сбрасывает кэш ленты пользователя (после регистрации, ее отмены, изменения профиля); None - все ленты"""
+    if user_id is None:
+        _feed_cache.clear()
+        return
+    for key in [key for key in _feed_cache if key[0] == user_id]:
+        del _feed_cache[key]
+
+def invalidate_city_feed(city_id: Optional[int]) -> None:
+    """Сбрасывает ленты города (после создания мероприятия); None - все ленты"""
+    if city_id is None:
+        _feed_cache.clear()
+        return
+    for key in [key for key in _feed_cache if key[1] == city_id]:
+        del _feed_cache[key]
+
+invalidation_bus.subscribe(KIND_USER, invalidate_user_feed)
+invalidation_bus.subscribe(KIND_CITY, invalidate_city_feed)
@@ -1,12 +1,15 @@
-from typing import List
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, not_
+from sqlalchemy import select, update, and_, not_, func
+from sqlalchemy.dialects.postgresql import insert
 
 from database.models import User, Event, Rating, event_participants
 
 async def rate_user(session: AsyncSession, event_id: int, rater_id: int, rated_id: int, score: int) -> Rating:
     """
-    Создает оценку пользователя.
+    Создает оценку пользователя или обновляет ее, если пользователь уже оценен
+    в этом мероприятии. Один INSERT ... ON CONFLICT DO UPDATE ... RETURNING;
+    фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
@@ -16,44 +19,24 @@ async def rate_user(session: AsyncSession, event_id: int, rater_id: int, rated_i
         score: Оценка (от 1 до 5)
     
     Returns:
-        Созданный объект оценки
+        Созданный или обновленный объект оценки
     """
-    # Проверяем, существует ли уже оценка
-    result = await session.execute(
-        select(Rating).where(
-            and_(
-                Rating.event_id == event_id,
-                Rating.rater_id == rater_id,
-                Rating.rated_id == rated_id
-            )
+    result = await session.scalars(
+        insert(Rating)
+        .values(event_id=event_id, rater_id=rater_id, rated_id=rated_id, score=score)
+        .on_conflict_do_update(
+            index_elements=[Rating.event_id, Rating.rater_id, Rating.rated_id],
+            set_={"score": score}
         )
+        .returning(Rating),
+        execution_options={"populate_existing": True}
     )
-    existing_rating = result.scalars().first()
-    
-    if existing_rating:
-        # Если оценка уже существует, обновляем её
-        existing_rating.score = score
-        await session.commit()
-        await session.refresh(existing_rating)
-        return existing_rating
-    
-    # Иначе создаем новую оценку
-    rating = Rating(
-        event_id=event_id,
-        rater_id=rater_id,
-        rated_id=rated_id,
-        score=score
-    )
-    
-    session.add(rating)
-    await session.commit()
-    await session.refresh(rating)
-    
-    return rating
+    return result.one()
 
-async def update_user_rating(session: AsyncSession, user_id: int, rating_change: int) -> User:
+async def update_user_rating(session: AsyncSession, user_id: int, rating_change: int) -> Optional[int]:
     """
-    Обновляет рейтинг пользователя.
+    Обновляет рейтинг пользователя одним UPDATE ... RETURNING.
+    Фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
@@ -61,26 +44,19 @@ async def update_user_rating(session: AsyncSession, user_id: int, rating_change:
         rating_change: Изменение рейтинга (положительное или отрицательное число)
     
     Returns:
-        Обновленный объект пользователя
+        Новый рейтинг пользователя или None, если пользователь не найден
     """
-    # Получаем пользователя
-    result = await session.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
-    
-    if not user:
-        return None
-    
-    # Обновляем рейтинг
-    user.rating += rating_change
-    
-    # Проверяем, не ушел ли рейтинг в отрицательные значения
-    if user.rating < 0:
-        user.rating = 0
-    
-    await session.commit()
-    await session.refresh(user)
-    
-    return user
+    # Рейтинг не уходит в отрицательные значения
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(rating=func.greatest(User.rating + rating_change, 0))
+        .returning(User.rating)
+        .execution_options(synchronize_session=False)
+    )
+    # Рейтинг не входит в кэшированные списки и ленты (их ранжирует репутация
+    # организатора, см. reputation_service), поэтому кэши не сбрасываем
+    return result.scalar()
 
 async def get_users_to_rate(session: AsyncSession, event_id: int, rater_id: int) -> List[User]:
     """
@@ -0,0 +1,167 @@
+"""
+Пересчет репутации пользователей по всему графу оценок.
+
+Рейтинг пользователя в профиле меняется на RATING_IMPACT после каждой оценки
+и зависит от порядка оценок, повторов и сговора. Эта задача периодически
+записывает рядом, в users.reputation, устойчивую оценку: средний балл, где
+голос каждого оценившего весит пропорционально его собственной репутации
+(неподвижная точка в духе PageRank). Повторные оценки одной и той же пары
+пользователей усредняются и учитываются один раз. Рейтинг при этом не
+меняется, репутацию использует ранжирование ленты.
+
+Ручной запуск: python -m services.reputation_service
+"""
+import asyncio
+import logging
+import time
+from typing import List, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, text, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from config import DEFAULT_RATING, REPUTATION_SETTINGS
+from database.models import Rating
+from services.event_service import get_upcoming_event_cities
+from utils.invalidation import invalidation_bus, city_key
+
+logger = logging.getLogger(__name__)
+
+NEUTRAL_SCORE = 3.0  # Средняя оценка по шкале от 1 до 5
+
+async def load_rating_graph(session: AsyncSession) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Загружает граф оценок в массивы NumPy потоково, без ORM-объектов.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+
+    Returns:
+        Массивы (ID оценившего, ID оцененного, средняя оценка пары)
+    """
+    result = await session.stream(
+        select(Rating.rater_id, Rating.rated_id, func.avg(Rating.score))
+        .where(Rating.rater_id != Rating.rated_id)
+        .group_by(Rating.rater_id, Rating.rated_id)
+        .execution_options(yield_per=REPUTATION_SETTINGS["load_batch_size"])
+    )
+
+    chunks = []
+    async for partition in result.partitions():
+        chunks.append(np.array(partition, dtype=np.float64))
+
+    if not chunks:
+        empty = np.empty(0)
+        return empty.astype(np.int64), empty.astype(np.int64), empty
+
+    edges = np.concatenate(chunks)
+    return edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64), edges[:, 2]
+
+def compute_reputation(raters: np.ndarray, rated: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Вычисляет репутацию как неподвижную точку взвешенного среднего балла.
+
+    q_j = (p * 3 + sum_i c_ij * w_i * s_ij) / (p + sum_i c_ij * w_i), где w_i = q_i / 5 -
+    вес оценившего, p - априорный вес нейтральной оценки (сглаживает
+    пользователей с малым числом оценок), c_ij - понижающий коэффициент
+    для взаимных оценок (против договоренностей "ты мне - я тебе").
+
+    Args:
+        raters: ID оценивших
+        rated: ID оцененных
+        scores: Оценки пар (1..5)
+
+    Returns:
+        Массивы (ID пользователей, средний балл 1..5)
+    """
+    user_ids, index = np.unique(np.concatenate([raters, rated]), return_inverse=True)
+    n = len(user_ids)
+    rater_index, rated_index = index[:len(raters)], index[len(raters):]
+
+    # Строки - оценившие, столбцы - оцененные
+    adjacency = sparse.csr_matrix((np.ones_like(scores), (rater_index, rated_index)), shape=(n, n))
+    reciprocal = np.asarray(adjacency.multiply(adjacency.T).tocsr()[rater_index, rated_index]).ravel()
+    edge_weights = np.where(reciprocal > 0, REPUTATION_SETTINGS["reciprocal_weight"], 1.0)
+
+    # Транспонированные матрицы: входящие оценки пользователя в его строке
+    score_t = sparse.csr_matrix((edge_weights * scores, (rated_index, rater_index)), shape=(n, n))
+    adjacency_t = sparse.csr_matrix((edge_weights, (rated_index, rater_index)), shape=(n, n))
+
+    prior = REPUTATION_SETTINGS["prior_weight"]
+    quality = np.full(n, NEUTRAL_SCORE)
+    for iteration in range(REPUTATION_SETTINGS["max_iterations"]):
+        weights = quality / 5
+        updated = (prior * NEUTRAL_SCORE + score_t @ weights) / (prior + adjacency_t @ weights)
+        delta = np.abs(updated - quality).max()
+        quality = updated
+        if delta < REPUTATION_SETTINGS["tolerance"]:
+            break
+
+    logger.info(f"Репутация: {n} пользователей, {len(scores)} пар оценок, итераций: {iteration + 1}")
+    return user_ids, quality
+
+def quality_to_rating(quality: np.ndarray) -> np.ndarray:
+    """Переводит средний балл 1..5 в шкалу рейтинга: 3 - DEFAULT_RATING, 1 - 0, 5 - 2 * DEFAULT_RATING"""
+    return np.rint(DEFAULT_RATING * (quality - 1) / 2).astype(np.int64)
+
+async def save_reputation(session: AsyncSession, user_ids: np.ndarray, reputation: np.ndarray) -> List[int]:
+    """
+    Записывает репутацию одним UPDATE через unnest массивов.
+    Фиксирует транзакцию вызывающий код.
+
+    Returns:
+        ID пользователей, у которых репутация изменилась
+    """
+    result = await session.scalars(
+        text(
+            "UPDATE users SET reputation = data.reputation "
+            "FROM unnest(:ids, :reputation) AS data(id, reputation) "
+            "WHERE users.id = data.id AND users.reputation IS DISTINCT FROM data.reputation "
+            "RETURNING users.id"
+        ).bindparams(
+            bindparam("ids", type_=ARRAY(Integer)),
+            bindparam("reputation", type_=ARRAY(Integer)),
+        ),
+        {"ids": user_ids.tolist(), "reputation": reputation.tolist()}
+    )
+    return list(result)
+
+async def recompute_reputation(session: AsyncSession) -> int:
+    """
+    Пересчитывает репутацию всех оцененных пользователей.
+
+    Расчет выполняется в отдельном потоке, чтобы не блокировать бота.
+
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+
+    Returns:
+        Количество обновленных пользователей
+    """
+    started = time.monotonic()
+    raters, rated, scores = await load_rating_graph(session)
+    if not len(scores):
+        return 0
+
+    user_ids, quality = await asyncio.to_thread(compute_reputation, raters, rated, scores)
+    updated = await save_reputation(session, user_ids, quality_to_rating(quality))
+    # Репутация организатора учитывается в лентах: сбрасываем ленты городов его мероприятий
+    cities = await get_upcoming_event_cities(session, updated)
+    await invalidation_bus.publish(session, *(city_key(city_id) for city_id in cities))
+    await session.commit()
+
+    logger.info(f"Репутация пересчитана за {time.monotonic() - started:.1f} с, изменено: {len(updated)}")
+    return len(updated)
+
+async def _main() -> None:
+    from database.db import init_db, AsyncSessionContext
+
+    await init_db(create_tables=False)
+    async with AsyncSessionContext() as session:
+        await recompute_reputation(session)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_main())
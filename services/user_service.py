@@ -1,7 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.orm.attributes import set_committed_value
 
 from database.models import User, Gender, UserType
+from services.ledger_service import apply_transaction
+from utils.invalidation import invalidation_bus, user_key
 
 async def get_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> User:
     """
@@ -18,10 +21,10 @@ async def get_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> Us
     return result.scalars().first()
 
 async def create_user(session: AsyncSession, telegram_id: int, username: str, first_name: str,
-                     last_name: str, city: str, display_name: str, age: int, gender: Gender,
+                     last_name: str, city_id: int, display_name: str, age: int, gender: Gender,
                      about: str = None) -> User:
     """
-    Создает нового пользователя.
+    Создает нового пользователя. Фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
@@ -29,7 +32,7 @@ async def create_user(session: AsyncSession, telegram_id: int, username: str, fi
         username: Username пользователя в Telegram
         first_name: Имя пользователя в Telegram
         last_name: Фамилия пользователя в Telegram
-        city: Город пользователя
+        city_id: ID города пользователя из справочника городов
         display_name: Отображаемое имя пользователя
         age: Возраст пользователя
         gender: Пол пользователя (MALE/FEMALE)
@@ -43,7 +46,7 @@ async def create_user(session: AsyncSession, telegram_id: int, username: str, fi
         username=username,
         first_name=first_name,
         last_name=last_name,
-        city=city,
+        city_id=city_id,
         display_name=display_name,
         age=age,
         gender=gender,
@@ -54,14 +57,14 @@ async def create_user(session: AsyncSession, telegram_id: int, username: str, fi
     )
     
     session.add(user)
-    await session.commit()
-    await session.refresh(user)
+    # INSERT ... RETURNING заполняет id и created_at без отдельного SELECT
+    await session.flush()
     
     return user
 
 async def update_user(session: AsyncSession, user: User, **kwargs) -> User:
     """
-    Обновляет данные пользователя.
+    Обновляет данные пользователя. Фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
@@ -71,29 +74,47 @@ async def update_user(session: AsyncSession, user: User, **kwargs) -> User:
     Returns:
         Обновленный объект пользователя
     """
-    for key, value in kwargs.items():
-        if hasattr(user, key):
-            setattr(user, key, value)
+    values = {key: value for key, value in kwargs.items() if key in User.__table__.columns}
+    if not values:
+        return user
     
-    await session.commit()
-    await session.refresh(user)
+    result = await session.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(**values)
+        .returning(User.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    
+    # Значения уже записаны в базу, обновляем только объект в памяти
+    values["updated_at"] = result.scalar_one()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    
+    # Возраст, пол и город влияют на ленту мероприятий пользователя
+    await invalidation_bus.publish(session, user_key(user.id))
     
     return user
 
-async def add_tokens(session: AsyncSession, user: User, amount: int) -> User:
+async def add_tokens(session: AsyncSession, user: User, amount: int,
+                     description: str = "Пополнение токенов", idempotency_key: str = None) -> User:
     """
-    Добавляет токены пользователю.
+    Добавляет токены пользователю через журнал токенов. Фиксирует транзакцию вызывающий код.
     
     Args:
         session: Асинхронная сессия SQLAlchemy
         user: Объект пользователя
         amount: Количество токенов для добавления
+        description: Описание операции в журнале
+        idempotency_key: Уникальный ключ операции (например, ID платежа)
     
     Returns:
         Обновленный объект пользователя
     """
-    user.tokens += amount
-    await session.commit()
-    await session.refresh(user)
+    result = await apply_transaction(session, user.id, amount, description, idempotency_key)
+    
+    if result.balance is not None:
+        # Баланс уже записан в базу, обновляем только объект в памяти
+        set_committed_value(user, "tokens", result.balance)
     
     return user
\ No newline at end of file
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
+
+from config import VIP_COST, VIP_SETTINGS
+from database.models import User, UserType
+
+logger = logging.getLogger(__name__)
+
+async def expire_vip_statuses(session: AsyncSession) -> List[int]:
+    """
+    Понижает до обычных всех пользователей с истекшим VIP-статусом.
+    
+    Один UPDATE по частичному индексу ix_users_vip_until.
+    
+    Args:
+        session: Асинхронная сессия SQLAlchemy
+    
+    Returns:
+        Telegram ID пользователей, у которых истек VIP-статус
+    """
+    result = await session.execute(
+        update(User)
+        # vip_until записывает User.activate_vip() по часам приложения - сравниваем с ними же
+        .where(User.user_type == UserType.VIP, User.vip_until <= datetime.now())
+        .values(user_type=UserType.REGULAR)
+        .returning(User.telegram_id)
+    )
+    telegram_ids = list(result.scalars())
+    await session.commit()
+    
+    return telegram_ids
+
+async def send_renewal_notices(bot: Bot, telegram_ids: List[int]) -> int:
+    """
+    Отправляет уведомления об окончании VIP-статуса пачками, не превышая лимиты Telegram.
+    
+    Args:
+        bot: Экземпляр бота
+        telegram_ids: Telegram ID получателей
+    
+    Returns:
+        Количество доставленных уведомлений
+    """
+    text = (
+        "Срок действия вашего VIP-статуса закончился.\n"
+        f"Продлить VIP на 30 дней можно за {VIP_COST} токенов в разделе «Мой профиль»."
+    )
+    batch_size = VIP_SETTINGS["notice_batch_size"]
+    delivered = 0
+    
+    for start in range(0, len(telegram_ids), batch_size):
+        if start:
+            await asyncio.sleep(VIP_SETTINGS["notice_batch_pause"])
+        
+        batch = telegram_ids[start:start + batch_size]
+        results = await asyncio.gather(
+            *(bot.send_message(telegram_id, text) for telegram_id in batch),
+            return_exceptions=True
+        )
+        
+        for telegram_id, result in zip(batch, results):
+            if isinstance(result, TelegramRetryAfter):
+                # Telegram просит подождать: ждем и повторяем отправку один раз
+                await asyncio.sleep(result.retry_after)
+                try:
+                    await bot.send_message(telegram_id, text)
+                    delivered += 1
+                except TelegramAPIError as e:
+                    logger.warning(f"Не удалось уведомить {telegram_id} об окончании VIP: {e}")
+            elif isinstance(result, Exception):
+                # Пользователь заблокировал бота или удалил аккаунт
+                logger.info(f"Не удалось уведомить {telegram_id} об окончании VIP: {result}")
+            else:
+                delivered += 1
+    
+    return delivered
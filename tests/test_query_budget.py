@@ -0,0 +1,83 @@
+"""
+Бюджет SQL-запросов обработчиков (@flags.query_budget) на настоящей базе данных.
+
+Нужен Postgres: DATABASE_URL=postgresql://... python -m pytest tests
+Без DATABASE_URL тесты пропускаются.
+"""
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+# config требует токен бота при импорте; счетчик запросов подключается только не в режиме off
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+
+from aiogram import flags
+from aiogram.dispatcher.event.handler import HandlerObject
+from sqlalchemy import delete, select
+
+from database import db
+from database.models import Gender, User
+from handlers.profile import cmd_profile
+from middlewares.query_budget import MODE_RAISE, QueryBudgetExceeded, QueryBudgetMiddleware, install_query_counter
+from services.city_service import get_or_create_city
+from services.user_service import create_user
+
+pytestmark = pytest.mark.skipif(not os.getenv("DATABASE_URL"), reason="нужен DATABASE_URL с Postgres")
+
+
+async def _call(middleware: QueryBudgetMiddleware, callback, event) -> None:
+    handler = HandlerObject(callback)
+    await middleware(lambda event, data: handler.call(event), event, {"handler": handler})
+
+
+async def _with_user(check) -> None:
+    await db.init_db()
+    install_query_counter(db.engine)
+    telegram_id = random.randint(10 ** 12, 2 * 10 ** 12)
+    try:
+        async with db.AsyncSessionContext() as session:
+            city = await get_or_create_city(session, "Москва")
+            await create_user(session, telegram_id, "budget", "Тест", None, city.id, "Тест", 30, Gender.MALE)
+            await session.commit()
+        await check(telegram_id)
+    finally:
+        async with db.AsyncSessionContext() as session:
+            await session.execute(delete(User).where(User.telegram_id == telegram_id))
+            await session.commit()
+        await db.engine.dispose()
+
+
+def test_profile_fits_budget():
+    async def check(telegram_id: int) -> None:
+        message = SimpleNamespace(from_user=SimpleNamespace(id=telegram_id), answer=AsyncMock())
+        middleware = QueryBudgetMiddleware(mode=MODE_RAISE)
+
+        await _call(middleware, cmd_profile, message)
+
+        message.answer.assert_awaited_once()
+        assert middleware.exceeded == 0
+
+    asyncio.run(_with_user(check))
+
+
+def test_exceeded_budget_raises():
+    @flags.query_budget(1)
+    async def chatty_handler(message) -> None:
+        async with db.AsyncSessionContext() as session:
+            for _ in range(2):
+                await session.execute(select(User.id).where(User.telegram_id == message.from_user.id))
+
+    async def check(telegram_id: int) -> None:
+        message = SimpleNamespace(from_user=SimpleNamespace(id=telegram_id))
+        middleware = QueryBudgetMiddleware(mode=MODE_RAISE)
+
+        with pytest.raises(QueryBudgetExceeded, match="chatty_handler: 2 SQL"):
+            await _call(middleware, chatty_handler, message)
+        assert middleware.exceeded == 1
+
+    asyncio.run(_with_user(check))
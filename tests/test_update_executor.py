@@ -0,0 +1,76 @@
+"""
+Очередь обновлений чата: второе быстрое нажатие видит состояние после первого.
+
+python -m pytest tests
+"""
+import asyncio
+import os
+from datetime import datetime
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Update
+
+from middlewares.update_executor import UpdateExecutor
+
+CHAT_ID = 42
+
+
+class ConfirmState(StatesGroup):
+    waiting_for_confirmation = State()
+
+
+def _callback_update(update_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "test",
+            "data": "confirm_event",
+            "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Тест"},
+            "message": {
+                "message_id": 1,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": CHAT_ID, "type": "private"},
+                "text": "Подтвердите создание мероприятия",
+            },
+        },
+    })
+
+
+def test_double_tap_runs_state_handler_once():
+    created = []
+    router = Router()
+
+    @router.callback_query(F.data == "confirm_event", ConfirmState.waiting_for_confirmation)
+    async def confirm_event(callback: CallbackQuery, state: FSMContext):
+        # Уступаем управление, как при запросе к базе данных
+        await asyncio.sleep(0.05)
+        created.append(callback.id)
+        await state.clear()
+
+    async def run() -> None:
+        executor = UpdateExecutor(max_concurrency=10)
+        dp = Dispatcher(storage=MemoryStorage(), events_isolation=executor)
+        dp.update.outer_middleware(executor)
+        dp.include_router(router)
+        bot = Bot("1:test")
+
+        state = dp.fsm.resolve_context(bot, chat_id=CHAT_ID, user_id=CHAT_ID)
+        await state.set_state(ConfirmState.waiting_for_confirmation)
+
+        await asyncio.gather(
+            dp.feed_update(bot, _callback_update(1)),
+            dp.feed_update(bot, _callback_update(2)),
+        )
+        await bot.session.close()
+
+        assert created == ["1"]
+        assert executor.stats()["processed"] == 2
+        assert executor.stats()["chats"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,114 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from aiohttp import FormData
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import InputFile
+
+from config import BOT_SESSION_SETTINGS
+from keyboards.registry import keyboard_registry
+
+
+@dataclass
+class _MethodStats:
+    calls: int = 0
+    errors: int = 0
+    network_errors: int = 0  # Таймауты и ошибки соединения
+    slow: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+
+class BotSession(AiohttpSession):
+    """
+    HTTP-сессия бота: пул соединений, таймауты по методам и метрики запросов.
+
+    - Соединения с api.telegram.org переиспользуются (keep-alive), размер пула
+      и время жизни простаивающего соединения задает BOT_SESSION_SETTINGS.
+    - Таймаут запроса зависит от метода: ответ на нажатие кнопки не должен
+      ждать столько же, сколько загрузка файла.
+    - По каждому методу считаются вызовы, ошибки и время ответа (stats()).
+    - Если reply_markup запроса взят из реестра клавиатур, в форму подставляется
+      готовый JSON вместо повторной сериализации клавиатуры на каждое сообщение.
+    """
+
+    def __init__(self, settings: Dict[str, Any] = BOT_SESSION_SETTINGS, **kwargs: Any):
+        super().__init__(timeout=settings["timeout"], **kwargs)
+        self.method_timeouts: Dict[str, float] = settings["method_timeouts"]
+        self.slow_call = settings["slow_call"]
+        self._connector_init.update(
+            limit=settings["connection_limit"],
+            keepalive_timeout=settings["keepalive_timeout"],
+            # 0 - без кэша, адрес api.telegram.org запрашивается при каждом новом соединении
+            use_dns_cache=settings["dns_cache_ttl"] > 0,
+            ttl_dns_cache=settings["dns_cache_ttl"] or None,
+        )
+        self._stats: Dict[str, _MethodStats] = {}
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[TelegramType],
+                           timeout: Optional[int] = None) -> TelegramType:
+        name = method.__api_method__
+        if timeout is None:
+            timeout = self.method_timeouts.get(name)
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = _MethodStats()
+
+        started = time.perf_counter()
+        try:
+            return await super().make_request(bot, method, timeout)
+        except TelegramNetworkError:
+            stats.errors += 1
+            stats.network_errors += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            if elapsed >= self.slow_call:
+                stats.slow += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Вызовы, доля ошибок и время ответа по методам Bot API"""
+        return {
+            name: {
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "network_errors": stats.network_errors,
+                "error_rate": round(stats.errors / stats.calls, 4) if stats.calls else 0.0,
+                "slow": stats.slow,
+                "avg_ms": round(stats.total_time / stats.calls * 1000, 1) if stats.calls else 0.0,
+                "max_ms": round(stats.max_time * 1000, 1),
+            }
+            for name, stats in self._stats.items()
+        }
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup_json = keyboard_registry.get_json(getattr(method, "reply_markup", None))
+        if markup_json is None:
+            return super().build_form_data(bot=bot, method=method)
+
+        form = FormData(quote_fields=False)
+        files: Dict[str, InputFile] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", markup_json)
+        for key, value in files.items():
+            form.add_field(
+                key,
+                value.read(bot),
+                filename=value.filename or key,
+            )
+        return form
@@ -0,0 +1,164 @@
+import logging
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Type
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+
+from database.models import EventPurpose, EventTargetAudience, Gender
+
+logger = logging.getLogger(__name__)
+
+# --- Типизированные callback_data ---
+# Префиксы короткие и состоят только из ASCII, чтобы callback_data
+# гарантированно укладывался в лимит Telegram в 64 байта.
+
+class CityCallback(CallbackData, prefix="c"):
+    """Выбор города из справочника"""
+    city_id: int
+
+class CitySuggestionCallback(CallbackData, prefix="cs"):
+    """Выбор одного из предложенных вариантов города"""
+    index: int
+
+class EventRegisterCallback(CallbackData, prefix="er"):
+    """Регистрация на мероприятие"""
+    event_id: int
+
+class EventUnregisterCallback(CallbackData, prefix="eu"):
+    """Отмена регистрации на мероприятие"""
+    event_id: int
+
+class EventRegisterDeniedCallback(CallbackData, prefix="ed"):
+    """Нажатие на кнопку мероприятия, на которое нельзя зарегистрироваться"""
+    event_id: int
+
+class EventPageCallback(CallbackData, prefix="ep"):
+    """Следующая страница ленты мероприятий города"""
+    city_id: int
+    page: int
+
+class EventPurposeCallback(CallbackData, prefix="pu"):
+    """Выбор цели мероприятия при создании"""
+    purpose: EventPurpose
+
+class EventAudienceCallback(CallbackData, prefix="au"):
+    """Выбор целевой аудитории мероприятия при создании"""
+    audience: EventTargetAudience
+
+class GenderCallback(CallbackData, prefix="g"):
+    """Выбор пола в анкете профиля"""
+    gender: Gender
+
+class KnowledgeCallback(CallbackData, prefix="k"):
+    """Раздел базы знаний"""
+    topic: str
+
+class RateEventCallback(CallbackData, prefix="re"):
+    """Выбор мероприятия для оценки участников"""
+    event_id: int
+
+class RateScoreCallback(CallbackData, prefix="rs"):
+    """Выбор оценки участника (количество звезд)"""
+    score: int
+
+
+@dataclass
+class _Route:
+    handler: HandlerObject  # хранит и флаги обработчика (@flags...)
+    states: Optional[FrozenSet[str]]  # None - обработчик работает в любом состоянии
+
+
+class CallbackDispatcher(BaseMiddleware):
+    """
+    Маршрутизатор callback_query по префиксу callback_data.
+
+    Подключается как outer middleware к dp.callback_query: обработчик находится
+    одним поиском в словаре по префиксу, без последовательной проверки фильтров
+    всех роутеров. callback_data без зарегистрированного префикса передаются
+    дальше в обычные роутеры aiogram.
+
+    Inner middleware роутеров aiogram для этих обработчиков не вызываются,
+    поэтому нужные middleware регистрируются и здесь через middleware().
+    """
+
+    def __init__(self):
+        self._codecs: Dict[str, Type[CallbackData]] = {}
+        self._routes: Dict[str, List[_Route]] = {}
+        self._middlewares: List[BaseMiddleware] = []
+
+    def middleware(self, middleware: BaseMiddleware) -> BaseMiddleware:
+        """Добавляет middleware, который выполняется перед найденным обработчиком"""
+        self._middlewares.append(middleware)
+        return middleware
+
+    def handler(self, codec: Type[CallbackData], *states: State):
+        """
+        Декоратор для регистрации обработчика типизированного callback_data.
+
+        Args:
+            codec: Класс CallbackData, который обрабатывает хэндлер
+            *states: Состояния FSM, в которых хэндлер активен (по умолчанию - в любом)
+        """
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            self.register(codec, func, *states)
+            return func
+        return decorator
+
+    def register(self, codec: Type[CallbackData], func: Callable[..., Awaitable[Any]], *states: State) -> None:
+        """
+        Регистрирует обработчик. Повторное использование префикса другим
+        классом CallbackData считается ошибкой и останавливает запуск бота.
+        """
+        prefix = codec.__prefix__
+        existing = self._codecs.get(prefix)
+        if existing is not None and existing is not codec:
+            raise ValueError(
+                f"Префикс callback_data {prefix!r} уже используется классом {existing.__name__}, "
+                f"его нельзя назначить классу {codec.__name__}"
+            )
+
+        self._codecs[prefix] = codec
+        state_names = frozenset(state.state for state in states) if states else None
+        self._routes.setdefault(prefix, []).append(_Route(HandlerObject(func), state_names))
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        prefix, separator, _ = (event.data or "").partition(":")
+        routes = self._routes.get(prefix) if separator else None
+
+        if routes:
+            raw_state = data.get("raw_state")
+            for route in routes:
+                if route.states is None or raw_state in route.states:
+                    try:
+                        callback_data = self._codecs[prefix].unpack(event.data)
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"Некорректный callback_data {event.data!r}: {e}")
+                        break
+                    data["handler"] = route.handler
+                    data["callback_data"] = callback_data
+                    return await self._wrap(route.handler)(event, data)
+
+        return await handler(event, data)
+
+    def _wrap(self, handler: HandlerObject) -> Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]]:
+        async def call(event: CallbackQuery, data: Dict[str, Any]) -> Any:
+            return await handler.call(event, **data)
+
+        # Как в aiogram: первый зарегистрированный middleware выполняется первым
+        for middleware in reversed(self._middlewares):
+            call = partial(middleware, call)
+        return call
+
+
+# Общий диспетчер callback_data приложения
+callback_dispatcher = CallbackDispatcher()
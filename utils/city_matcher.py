@@ -0,0 +1,162 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fuzzywuzzy import fuzz
+
+from config import POPULAR_CITIES, CITY_ALIASES
+
+# Пороги схожести (0-100) для нечеткого поиска
+CONFIDENT_SCORE = 88  # Совпадение, которое принимаем без уточнения
+CONFIDENT_GAP = 8  # Насколько лучший вариант должен опережать второй
+SUGGESTION_SCORE = 60  # Минимальная схожесть для подсказки пользователю
+MAX_SUGGESTIONS = 4
+MAX_CANDIDATES = 12  # Сколько кандидатов из триграммного индекса проверяем точно
+
+_SEPARATORS_RE = re.compile(r"[\s\-‐‑–—_.,]+")
+_LOWERCASE_PARTS = {"на", "над", "под", "де", "ла", "о"}
+
+
+def normalize_city_key(text: str) -> str:
+    """
+    Приводит название города к ключу для сравнения:
+    нижний регистр, ё -> е, дефисы и пробелы схлопываются в один пробел.
+    """
+    return _SEPARATORS_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def prettify_city_name(text: str) -> str:
+    """
+    Приводит введенное пользователем название к аккуратному виду
+    ("ростов-на-дону" -> "Ростов-на-Дону", "великий  новгород" -> "Великий Новгород").
+    """
+    words = []
+    for word in text.split():
+        parts = word.split("-")
+        parts = [
+            part.lower() if i > 0 and part.lower() in _LOWERCASE_PARTS else part.capitalize()
+            for i, part in enumerate(parts)
+        ]
+        words.append("-".join(parts))
+    return " ".join(words)
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class CityMatch:
+    """Результат сопоставления введенного текста со справочником городов"""
+    city: Optional[str]  # Каноническое название, если совпадение однозначное
+    score: int
+    suggestions: Tuple[str, ...] = ()
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return self.city is None and bool(self.suggestions)
+
+
+class CityMatcher:
+    """
+    Предвычисленный индекс городов для нормализации свободного ввода.
+
+    Точные совпадения и сокращения ("спб", "питер") разрешаются одним
+    поиском в словаре, опечатки - через триграммный индекс с последующей
+    проверкой лучших кандидатов по расстоянию Левенштейна.
+    """
+
+    def __init__(self, cities: Iterable[str] = (), aliases: Optional[Dict[str, str]] = None):
+        self._names: List[str] = []
+        self._keys: List[str] = []
+        self._exact: Dict[str, str] = {}
+        self._trigram_index: Dict[str, Set[int]] = defaultdict(set)
+
+        for city in cities:
+            self.learn(city)
+        for alias, city in (aliases or {}).items():
+            self.add_alias(alias, city)
+
+    def __contains__(self, city: str) -> bool:
+        return normalize_city_key(city) in self._exact
+
+    @property
+    def cities(self) -> List[str]:
+        return list(self._names)
+
+    def learn(self, city: str) -> str:
+        """
+        Добавляет город в индекс (например, новый город, подтвержденный пользователем).
+
+        Args:
+            city: Название города
+
+        Returns:
+            Каноническое название города
+        """
+        key = normalize_city_key(city)
+        if key in self._exact:
+            return self._exact[key]
+
+        name = " ".join(city.split())
+        index = len(self._names)
+        self._names.append(name)
+        self._keys.append(key)
+        self._exact[key] = name
+        for trigram in _trigrams(key):
+            self._trigram_index[trigram].add(index)
+        return name
+
+    def add_alias(self, alias: str, city: str) -> None:
+        """Добавляет сокращение или разговорное название для города"""
+        name = self.learn(city)
+        self._exact.setdefault(normalize_city_key(alias), name)
+
+    def resolve(self, text: str) -> CityMatch:
+        """
+        Сопоставляет свободный ввод с известным городом.
+
+        Args:
+            text: Введенное пользователем название
+
+        Returns:
+            CityMatch: город при однозначном совпадении, иначе список подсказок
+            (пустой, если похожих городов нет)
+        """
+        key = normalize_city_key(text)
+        if not key:
+            return CityMatch(city=None, score=0)
+
+        exact = self._exact.get(key)
+        if exact:
+            return CityMatch(city=exact, score=100)
+
+        scored = self._score_candidates(key)
+        if not scored:
+            return CityMatch(city=None, score=0)
+
+        best_score, best_name = scored[0]
+        second_score = scored[1][0] if len(scored) > 1 else 0
+        if best_score >= CONFIDENT_SCORE and best_score - second_score >= CONFIDENT_GAP:
+            return CityMatch(city=best_name, score=best_score)
+
+        suggestions = tuple(name for score, name in scored[:MAX_SUGGESTIONS] if score >= SUGGESTION_SCORE)
+        return CityMatch(city=None, score=best_score, suggestions=suggestions)
+
+    def _score_candidates(self, key: str) -> List[Tuple[int, str]]:
+        # Отбираем кандидатов по количеству общих триграмм
+        overlap: Dict[int, int] = defaultdict(int)
+        for trigram in _trigrams(key):
+            for index in self._trigram_index.get(trigram, ()):
+                overlap[index] += 1
+
+        candidates = sorted(overlap, key=overlap.get, reverse=True)[:MAX_CANDIDATES]
+        scored = [(fuzz.ratio(key, self._keys[index]), self._names[index]) for index in candidates]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+
+# Общий индекс городов приложения
+city_matcher = CityMatcher(POPULAR_CITIES, CITY_ALIASES)
@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from html import escape
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+
+from database.models import Event, EventPurpose, EventTargetAudience
+from keyboards.event_creation import get_event_registration_keyboard
+from utils.invalidation import invalidation_bus, KIND_EVENT
+
+# Названия целей и аудиторий мероприятий для пользователя
+PURPOSE_LABELS = {
+    EventPurpose.WALK: "Пошли гулять",
+    EventPurpose.MEET: "Давайте знакомиться",
+    EventPurpose.TRAVEL: "Совместные поездки/путешествия",
+    EventPurpose.HELP: "Друзья мне нужна помощь",
+    EventPurpose.PARTY: "Пойдем тусить"
+}
+
+AUDIENCE_LABELS = {
+    EventTargetAudience.MALE: "Только для мужчин",
+    EventTargetAudience.FEMALE: "Только для женщин",
+    EventTargetAudience.ALL: "Для всех"
+}
+
+# Сколько карточек мероприятий держим в памяти одновременно
+DEFAULT_CARD_CACHE_SIZE = 2048
+
+
+class EventCard(NamedTuple):
+    """Готовая к отправке карточка мероприятия (parse_mode="HTML")"""
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+def format_age_limits(min_age: Optional[int], max_age: Optional[int]) -> str:
+    """Возвращает текст возрастных ограничений мероприятия"""
+    if min_age and max_age:
+        return f"От {min_age} до {max_age} лет"
+    return "Без ограничений"
+
+
+def render_event_card(event: Event, participants_count: int, can_register: bool = True) -> EventCard:
+    """
+    Формирует карточку мероприятия без кэширования.
+
+    Args:
+        event: Мероприятие с загруженным организатором
+        participants_count: Количество участников
+        can_register: Показывать ли кнопку регистрации
+
+    Returns:
+        Текст карточки и клавиатура
+    """
+    participants = f"{participants_count}/{event.max_participants}" if event.max_participants else f"{participants_count}"
+
+    text = (
+        f"<b>{escape(event.title)}</b>\n\n"
+        f"<b>Организатор:</b> {escape(event.creator.display_name or '')}\n"
+        f"<b>Цель:</b> {PURPOSE_LABELS[event.purpose]}\n"
+        f"<b>Для кого:</b> {AUDIENCE_LABELS[event.target_audience]}\n"
+        f"<b>Возраст участников:</b> {format_age_limits(event.min_age, event.max_age)}\n"
+        f"<b>Дата и время:</b> {event.event_date.strftime('%d.%m.%Y %H:%M')}\n"
+        f"<b>Участники:</b> {participants}\n\n"
+        f"<b>Описание:</b>\n{escape(event.description)}"
+    )
+    return EventCard(text, get_event_registration_keyboard(event.id, can_register))
+
+
+class EventCardCache:
+    """
+    Кэш отрисованных карточек мероприятий.
+
+    На мероприятие хранится одна карточка вместе с версией, из которой она
+    построена: (updated_at, количество участников, имя организатора, can_register).
+    Изменение мероприятия или состава участников меняет версию, и карточка
+    перестраивается при следующем показе; invalidate() удаляет ее сразу.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CARD_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cards: "OrderedDict[int, Tuple[Tuple, EventCard]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.render_time = 0.0
+        self.max_render_time = 0.0
+
+    def get(self, event: Event, participants_count: int, can_register: bool = True) -> EventCard:
+        """Возвращает карточку мероприятия, перестраивая ее только при изменении версии"""
+        version: Tuple[Optional[datetime], int, Optional[str], bool] = (
+            event.updated_at, participants_count, event.creator.display_name, can_register
+        )
+        cached = self._cards.get(event.id)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            self._cards.move_to_end(event.id)
+            return cached[1]
+
+        self.misses += 1
+        started = time.perf_counter()
+        card = render_event_card(event, participants_count, can_register)
+        elapsed = time.perf_counter() - started
+        self.render_time += elapsed
+        self.max_render_time = max(self.max_render_time, elapsed)
+
+        self._cards[event.id] = (version, card)
+        self._cards.move_to_end(event.id)
+        if len(self._cards) > self.maxsize:
+            self._cards.popitem(last=False)
+        return card
+
+    def invalidate(self, event_id: Optional[int]) -> None:
+        """Удаляет карточку мероприятия (после изменения или регистрации); None - все карточки"""
+        if event_id is None:
+            self._cards.clear()
+        else:
+            self._cards.pop(event_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Попадания, промахи и время отрисовки карточек"""
+        return {
+            "cached": len(self._cards),
+            "hits": self.hits,
+            "misses": self.misses,
+            "avg_render_ms": round(self.render_time / self.misses * 1000, 3) if self.misses else 0.0,
+            "max_render_ms": round(self.max_render_time * 1000, 3),
+        }
+
+
+# Общий кэш карточек мероприятий приложения
+event_cards = EventCardCache()
+invalidation_bus.subscribe(KIND_EVENT, event_cards.invalidate)
@@ -0,0 +1,64 @@
+import hashlib
+from bisect import bisect
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+
+
+class HashRing:
+    """
+    Кольцо консистентного хэширования с виртуальными узлами.
+
+    Ключ (ID пользователя) всегда попадает на один и тот же узел, пока набор
+    узлов не меняется. При добавлении или удалении узла переезжает только
+    доля ключей этого узла, остальные пользователи остаются на своих воркерах
+    вместе с состоянием FSM и кэшами процесса.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 128):
+        self.virtual_nodes = virtual_nodes
+        self._ring: Dict[int, str] = {}
+        self._keys: List[int] = []
+        self._nodes: Set[str] = set()
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        # Встроенный hash() для строк рандомизируется в каждом процессе, поэтому md5
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def add_node(self, node: str) -> None:
+        """Добавляет узел в кольцо"""
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for i in range(self.virtual_nodes):
+            self._ring[self._hash(f"{node}#{i}")] = node
+        self._keys = sorted(self._ring)
+
+    def remove_node(self, node: str) -> None:
+        """Удаляет узел из кольца; его ключи переходят к соседним узлам"""
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        for i in range(self.virtual_nodes):
+            point = self._hash(f"{node}#{i}")
+            if self._ring.get(point) == node:
+                del self._ring[point]
+        self._keys = sorted(self._ring)
+
+    def get_node(self, key: Hashable) -> Optional[str]:
+        """Возвращает узел для ключа (None, если кольцо пустое)"""
+        if not self._keys:
+            return None
+        index = bisect(self._keys, self._hash(str(key))) % len(self._keys)
+        return self._ring[self._keys[index]]
+
+    @property
+    def nodes(self) -> Set[str]:
+        return set(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -0,0 +1,157 @@
+"""
+Шина инвалидации кэшей между процессами бота через Postgres LISTEN/NOTIFY.
+
+Сервисные функции публикуют короткие сообщения вида "e:42" (мероприятие),
+"u:7" (пользователь), "c:3" (город) в той же транзакции, что и изменение.
+Postgres доставляет NOTIFY только после COMMIT, поэтому другие процессы
+узнают об изменении не раньше, чем смогут его прочитать, а откаченные
+изменения не рассылаются вовсе. Каждый процесс слушает канал отдельным
+соединением asyncpg и вызывает подписчиков своих кэшей.
+"""
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+
+from config import INVALIDATION_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Виды сообщений
+KIND_EVENT = "e"
+KIND_USER = "u"
+KIND_CITY = "c"
+
+# Postgres ограничивает payload NOTIFY 8000 байтами
+MAX_PAYLOAD = 7900
+
+# Подписчик получает ID объекта или None, если нужно сбросить весь кэш
+# (например, после переподключения, когда часть сообщений могла потеряться)
+Subscriber = Callable[[Optional[int]], Any]
+
+
+def event_key(event_id: int) -> str:
+    return f"{KIND_EVENT}:{event_id}"
+
+
+def user_key(user_id: int) -> str:
+    return f"{KIND_USER}:{user_id}"
+
+
+def city_key(city_id: int) -> str:
+    return f"{KIND_CITY}:{city_id}"
+
+
+class InvalidationBus:
+    """Публикация и получение сообщений об изменениях для локальных кэшей"""
+
+    def __init__(self, channel: str = INVALIDATION_SETTINGS["channel"]):
+        self.channel = channel
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        # Ссылки на асинхронные обработчики, чтобы задачи не удалил сборщик мусора
+        self._tasks = set()
+        self.published = 0
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(self, kind: str, subscriber: Subscriber) -> None:
+        """Подписывает обработчик (обычную или async функцию) на сообщения одного вида"""
+        self._subscribers.setdefault(kind, []).append(subscriber)
+
+    async def publish(self, session: AsyncSession, *keys: str) -> None:
+        """
+        Добавляет сообщения об изменениях в текущую транзакцию сессии.
+
+        Сообщения уйдут подписчикам после session.commit(); при откате они не отправляются.
+
+        Args:
+            session: Сессия, в которой выполняется изменение
+            keys: Ключи из event_key(), user_key(), city_key()
+        """
+        payload = ""
+        for key in dict.fromkeys(keys):
+            if payload and len(payload) + len(key) >= MAX_PAYLOAD:
+                await self._notify(session, payload)
+                payload = ""
+            payload = f"{payload},{key}" if payload else key
+        if payload:
+            await self._notify(session, payload)
+
+    async def _notify(self, session: AsyncSession, payload: str) -> None:
+        await session.execute(select(func.pg_notify(self.channel, payload)))
+        self.published += 1
+
+    def _dispatch(self, kind: str, object_id: Optional[int]) -> None:
+        for subscriber in self._subscribers.get(kind, ()):
+            try:
+                result = subscriber(object_id)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика инвалидации {kind}:{object_id}: {e}")
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        self.received += 1
+        for item in payload.split(","):
+            kind, _, object_id = item.partition(":")
+            if object_id.isdigit():
+                self._dispatch(kind, int(object_id))
+
+    def evict_all(self) -> None:
+        """Сбрасывает все подписанные кэши процесса"""
+        for kind in self._subscribers:
+            self._dispatch(kind, None)
+
+    async def run(self) -> None:
+        """
+        Слушает канал, пока задачу не отменят, и переподключается при разрыве соединения.
+
+        Вызывается после init_db(): адрес базы данных берется из движка SQLAlchemy.
+        """
+        from database import db
+
+        dsn = db.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Шина инвалидации: не удалось подключиться к базе данных: {e}")
+                await asyncio.sleep(INVALIDATION_SETTINGS["reconnect_delay"])
+                continue
+
+            lost = asyncio.Event()
+            connection.add_termination_listener(lambda _: lost.set())
+            try:
+                await connection.add_listener(self.channel, self._on_notify)
+                if self.reconnects:
+                    # Пока соединения не было, сообщения могли потеряться
+                    self.evict_all()
+                    logger.info("Шина инвалидации переподключена, локальные кэши сброшены")
+
+                # Проверяем соединение: обрыв TCP без закрытия иначе не обнаружить
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), INVALIDATION_SETTINGS["keepalive_interval"])
+                    except asyncio.TimeoutError:
+                        await connection.execute("SELECT 1", timeout=INVALIDATION_SETTINGS["keepalive_interval"])
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning(f"Шина инвалидации: соединение потеряно: {e}")
+            finally:
+                connection.terminate()
+
+            self.reconnects += 1
+            await asyncio.sleep(INVALIDATION_SETTINGS["reconnect_delay"])
+
+    def stats(self) -> Dict[str, int]:
+        """Количество отправленных и полученных сообщений, переподключений"""
+        return {"published": self.published, "received": self.received, "reconnects": self.reconnects}
+
+
+# Общая шина инвалидации приложения
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class ListingCache:
+    """
+    Кэш результатов запросов со stale-while-revalidate и объединением запросов.
+
+    - Свежее значение (моложе ttl) возвращается сразу.
+    - Устаревшее, но моложе ttl + stale_ttl, тоже возвращается сразу, а в фоне
+      запускается одно обновление.
+    - Если значения нет, одновременные запросы одного ключа ждут одну и ту же
+      загрузку (singleflight), поэтому запрос к базе данных выполняется один раз.
+
+    invalidate() помечает значения устаревшими: следующий читатель получит их
+    и запустит обновление. Загрузка, начатая до инвалидации, в кэш не попадает.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._loads: Dict[Hashable, asyncio.Future] = {}
+        # Поколение ключа увеличивается при инвалидации, чтобы не сохранять устаревшие загрузки
+        self._generations: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает значение ключа, загружая его через loader при необходимости.
+
+        Args:
+            key: Ключ кэша
+            loader: Асинхронная функция без аргументов. Открывает собственную сессию:
+                ее результат получат все ожидающие запросы.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.value
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                self._start_load(key, loader)
+                return entry.value
+
+        if key in self._loads:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        # shield: отмена одного ожидающего не прерывает загрузку для остальных
+        return await asyncio.shield(self._start_load(key, loader))
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        future = self._loads.get(key)
+        if future is None:
+            self.loads += 1
+            future = asyncio.ensure_future(self._load(key, loader, self._generations.get(key, 0)))
+            # Ошибку фонового обновления уже записали в лог, ожидающих у него может не быть
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._loads[key] = future
+        return future
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await loader()
+        except Exception as e:
+            logger.warning(f"Ошибка загрузки {key}: {e}")
+            raise
+        finally:
+            self._loads.pop(key, None)
+
+        if self._generations.get(key, 0) == generation:
+            now = time.monotonic()
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._evict(now)
+        return value
+
+    def _evict(self, now: float) -> None:
+        if len(self._entries) <= self.maxsize:
+            return
+        for key in [key for key, entry in self._entries.items() if entry.stale_until <= now]:
+            del self._entries[key]
+            self._generations.pop(key, None)
+        # Если просроченных нет, вытесняем самые старые записи
+        while len(self._entries) > self.maxsize:
+            key = next(iter(self._entries))
+            del self._entries[key]
+            self._generations.pop(key, None)
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        """
+        Помечает устаревшими значения ключей, для которых match(key) истинно.
+
+        Returns:
+            Количество затронутых ключей
+        """
+        keys = {key for key in self._entries if match(key)} | {key for key in self._loads if match(key)}
+        for key in keys:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.fresh_until = 0.0
+        return len(keys)
+
+    def clear(self) -> None:
+        """Удаляет все значения"""
+        for key in list(self._entries) + list(self._loads):
+            self._generations[key] = self._generations.get(key, 0) + 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Попадания (свежие и устаревшие), промахи, объединенные запросы и загрузки"""
+        return {
+            "cached": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+        }
@@ -0,0 +1,156 @@
+"""
+Неблокирующее логирование.
+
+Обработчики и сервисы пишут в лог как обычно, через logging.getLogger(__name__).
+Корневой логгер получает только QueueHandler: запись кладется в очередь,
+а форматирование и вывод выполняет отдельный поток QueueListener, поэтому
+запись в stdout не задерживает цикл событий даже при всплеске нагрузки.
+
+Каждая запись дополняется контекстом текущего обновления (update_id,
+user_id, handler) из contextvar, который заполняет LogContextMiddleware.
+Частые INFO-сообщения выбранных логгеров можно прореживать (sampling).
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from config import LOGGING_SETTINGS
+
+FORMAT_JSON = "json"
+FORMAT_TEXT = "text"
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Контекст обновления, которое сейчас обрабатывается: update_id, user_id, handler
+log_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_context", default=None)
+
+# Атрибуты, которые есть у любой LogRecord; остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_sampling: Optional["SamplingFilter"] = None
+
+
+class ContextFilter(logging.Filter):
+    """Копирует контекст обновления в запись (выполняется в потоке, который пишет в лог)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю INFO- и DEBUG-записей выбранных логгеров.
+
+    Предупреждения и ошибки не прореживаются.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def _rate(self, name: str) -> float:
+        # Настройка ближайшего родительского логгера: "handlers" действует на "handlers.events"
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который передает в поток вывода готовый текст сообщения и трассировку"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы сообщения могут измениться после возврата управления - форматируем сейчас
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: время, уровень, логгер, сообщение, контекст и поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOGGING_SETTINGS["level"], fmt: str = LOGGING_SETTINGS["format"],
+                  sampling: Dict[str, float] = LOGGING_SETTINGS["sampling"]) -> None:
+    """
+    Настраивает корневой логгер процесса на запись через очередь.
+
+    Повторный вызов ничего не делает. Поток вывода останавливается при выходе
+    из процесса, успев вывести записи из очереди.
+
+    Args:
+        level: Уровень корневого логгера
+        fmt: Формат вывода: "json" или "text"
+        sampling: Доля пропускаемых INFO-записей по именам логгеров
+    """
+    global _listener, _sampling
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == FORMAT_JSON else logging.Formatter(TEXT_FORMAT))
+
+    handler = _NonBlockingQueueHandler(queue.SimpleQueue())
+    handler.addFilter(ContextFilter())
+    _sampling = SamplingFilter(sampling)
+    handler.addFilter(_sampling)
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def logging_stats() -> Dict[str, int]:
+    """Размер очереди вывода и количество записей, отброшенных прореживанием"""
+    return {
+        "queued": _listener.queue.qsize() if _listener else 0,
+        "sampled_out": _sampling.dropped if _sampling else 0,
+    }
@@ -0,0 +1,188 @@
+"""
+Контроль задержек цикла событий.
+
+Пока обработчик выполняет синхронный код (разбор дат, построение большой
+клавиатуры, запись в файл), цикл событий стоит и все остальные обновления
+ждут. LoopMonitor находит такие остановки тремя способами:
+
+- задержка цикла: фоновая задача засыпает на interval и измеряет, насколько
+  позже она проснулась;
+- остановки: поток-наблюдатель замечает, что цикл не отвечает дольше
+  stall_threshold, и записывает в лог стек, на котором цикл стоит;
+- профилирование по требованию: поток снимает стек цикла с частотой
+  profile_hz в течение N секунд и сохраняет профиль в формате collapsed
+  stacks (flamegraph.pl, speedscope, inferno).
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from types import FrameType
+from typing import Dict, List, Optional
+
+from config import LOOP_MONITOR_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    """Стек в формате collapsed stacks: от внешнего вызова к внутреннему через ';'"""
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class LoopMonitor:
+    """Измерение задержки цикла событий, поиск остановок и профилирование"""
+
+    def __init__(self, interval: float = LOOP_MONITOR_SETTINGS["interval"],
+                 lag_warning: float = LOOP_MONITOR_SETTINGS["lag_warning"],
+                 stall_threshold: float = LOOP_MONITOR_SETTINGS["stall_threshold"]):
+        self.interval = interval
+        self.lag_warning = lag_warning
+        self.stall_threshold = stall_threshold
+        self._loop_thread_id: Optional[int] = None
+        # Последний раз, когда цикл событий выполнил задачу монитора
+        self._heartbeat = time.monotonic()
+        self._profiling = threading.Lock()
+        # Ссылки на профилирования, запущенные сигналом
+        self._tasks = set()
+        # Метрики
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.slow_ticks = 0
+        self.stalls = 0
+
+    async def run(self) -> None:
+        """
+        Измеряет задержку цикла, пока задачу не отменят.
+
+        Заодно запускает поток-наблюдатель за остановками и, если включено
+        asyncio_debug, встроенную проверку медленных callback'ов asyncio.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if LOOP_MONITOR_SETTINGS["asyncio_debug"]:
+            # Дорого: asyncio запоминает стек создания каждой задачи. Только для отладки
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.stall_threshold
+
+        stop = threading.Event()
+        watchdog = threading.Thread(target=self._watch, args=(stop,), name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                started = loop.time()
+                self._heartbeat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = loop.time() - started - self.interval
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.lag_warning:
+                    self.slow_ticks += 1
+                    logger.warning(f"Задержка цикла событий {lag * 1000:.0f} мс")
+        finally:
+            stop.set()
+
+    def _watch(self, stop: threading.Event) -> None:
+        reported = None
+        while not stop.wait(self.stall_threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.stall_threshold or heartbeat == reported:
+                continue
+            # Одна запись на остановку: стек снимаем, пока цикл еще стоит
+            reported = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "стек недоступен"
+            logger.warning(f"Цикл событий не отвечает {stalled * 1000:.0f} мс, выполняется:\n{stack}")
+
+    def _sample(self, seconds: float, hz: int) -> Counter:
+        samples: Counter = Counter()
+        period = 1 / hz
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                samples[_collapse(frame)] += 1
+            time.sleep(period)
+        return samples
+
+    async def profile(self, seconds: float, hz: int = LOOP_MONITOR_SETTINGS["profile_hz"]) -> str:
+        """
+        Снимает стек потока цикла событий seconds секунд и сохраняет профиль на диск.
+
+        Выборка идет в отдельном потоке, цикл событий продолжает работать.
+        Одновременно выполняется только одно профилирование.
+
+        Args:
+            seconds: Длительность профилирования
+            hz: Снимков стека в секунду
+
+        Returns:
+            Путь к файлу профиля в формате collapsed stacks
+        """
+        if self._loop_thread_id is None:
+            self._loop_thread_id = threading.get_ident()
+        if not self._profiling.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже выполняется")
+        try:
+            samples = await asyncio.to_thread(self._sample, seconds, hz)
+        finally:
+            self._profiling.release()
+
+        directory = LOOP_MONITOR_SETTINGS["profile_dir"]
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"loop_{os.getpid()}_{datetime.now():%Y%m%d_%H%M%S}.folded")
+        lines = [f"{stack} {count}\n" for stack, count in samples.most_common()]
+        await asyncio.to_thread(self._write, path, lines)
+        logger.info(f"Профиль цикла событий: {path}, снимков {sum(samples.values())}")
+        return path
+
+    def install_signal_handler(self) -> None:
+        """
+        По SIGUSR1 запускает профилирование на profile_seconds секунд (только Unix).
+
+        Пример: kill -USR1 <pid>; путь к профилю появится в логе.
+        """
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self._profile_on_signal)
+
+    def _profile_on_signal(self) -> None:
+        task = asyncio.ensure_future(self.profile(LOOP_MONITOR_SETTINGS["profile_seconds"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_profile_done)
+
+    def _on_profile_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Профилирование по сигналу не выполнено: {task.exception()}")
+
+    @staticmethod
+    def _write(path: str, lines: List[str]) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+
+    def stats(self) -> Dict[str, float]:
+        """Текущая и максимальная задержка цикла, медленные проверки и остановки"""
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "slow_ticks": self.slow_ticks,
+            "stalls": self.stalls,
+        }
+
+
+# Общий монитор цикла событий процесса
+loop_monitor = LoopMonitor()
@@ -0,0 +1,26 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodic(job: Callable[[], Awaitable[None]], interval: float, name: str) -> None:
+    """
+    Выполняет фоновую задачу с заданным интервалом, пока ее не отменят.
+
+    Ошибка одного запуска записывается в лог и не останавливает следующие.
+
+    Args:
+        job: Асинхронная функция без аргументов
+        interval: Пауза между запусками в секундах
+        name: Название задачи для логов
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка фоновой задачи {name}: {e}")
@@ -0,0 +1,44 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Ведро токенов: не более rate действий в секунду в среднем
+    и не более capacity действий подряд.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def consume(self, cost: float = 1, now: Optional[float] = None) -> bool:
+        """
+        Списывает cost токенов, если их достаточно.
+
+        Returns:
+            True, если действие разрешено
+        """
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    def delay(self, cost: float = 1, now: Optional[float] = None) -> float:
+        """Возвращает, через сколько секунд в ведре наберется cost токенов"""
+        self._refill(time.monotonic() if now is None else now)
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        """Ведро полностью восстановилось (пользователь давно ничего не делал)"""
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= self.capacity
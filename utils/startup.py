@@ -0,0 +1,45 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    """
+    Время этапов запуска бота.
+
+    Этапы, которые выполняются параллельно, измеряются каждый отдельно
+    (measure), поэтому в отчете их сумма может быть больше общего времени.
+    """
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, name: str) -> None:
+        """Записывает время от начала запуска до текущего момента как этап name"""
+        self.phases[name] = time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Измеряет блок кода: with timer.phase("обработчики"): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    async def measure(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Измеряет корутину; удобно внутри asyncio.gather"""
+        with self.phase(name):
+            return await awaitable
+
+    def report(self) -> None:
+        """Пишет в лог общее время запуска и время каждого этапа"""
+        total = time.perf_counter() - self.started
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases.items())
+        logger.info(f"Запуск за {total * 1000:.0f} мс: {phases}")
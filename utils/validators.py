@@ -1,6 +1,12 @@
 from datetime import datetime
 from typing import Tuple, Optional
 
+from config import CITY_ALIASES
+from utils.city_matcher import CityMatcher, city_matcher, prettify_city_name
+
+# Длина столбца cities.name (City.name = String(64))
+MAX_CITY_NAME_LENGTH = 64
+
 def validate_age(age_str: str) -> Tuple[bool, Optional[int], Optional[str]]:
     """
     Валидация введенного возраста.
@@ -50,13 +56,13 @@ def validate_event_datetime(datetime_str: str) -> Tuple[bool, Optional[datetime]
     except ValueError:
         return False, None, "Неверный формат даты и времени. Пожалуйста, укажите в формате ДД.ММ.ГГГГ ЧЧ:ММ, например: 15.06.2025 18:00"
 
-def validate_city(city: str, popular_cities: list) -> Tuple[bool, Optional[str], Optional[str]]:
+def validate_city(city: str, popular_cities: Optional[list] = None) -> Tuple[bool, Optional[str], Optional[str]]:
     """
     Валидация введенного города.
     
     Args:
         city: Название города
-        popular_cities: Список популярных городов для проверки
+        popular_cities: Список городов для проверки (по умолчанию общий справочник городов)
     
     Returns:
         Tuple с результатом валидации:
@@ -64,15 +70,19 @@ def validate_city(city: str, popular_cities: list) -> Tuple[bool, Optional[str],
         - Второй элемент: нормализованное название города, если валидация успешна, иначе None
         - Третий элемент: сообщение об ошибке, если валидация не удалась, иначе None
     """
-    city = city.strip().title()
-    
+    city = " ".join(city.split())
+
     if len(city) < 2:
         return False, None, "Название города слишком короткое. Пожалуйста, введите корректное название."
-    
-    # Простая нормализация названия города
-    normalized_city = " ".join(city.split())
-    
-    # Здесь можно добавить проверку по базе городов или по API
-    # Для простоты просто проверяем на корректность ввода
-    
+
+    if len(city) > MAX_CITY_NAME_LENGTH:
+        return False, None, f"Название города слишком длинное (не более {MAX_CITY_NAME_LENGTH} символов)."
+
+    # Сопоставляем ввод со справочником городов ("спб", "Питер" -> "Санкт-Петербург")
+    matcher = city_matcher if popular_cities is None else CityMatcher(popular_cities, CITY_ALIASES)
+    match = matcher.resolve(city)
+
+    # Неизвестный или неоднозначный город оставляем в аккуратном виде
+    normalized_city = match.city or prettify_city_name(city)
+
     return True, normalized_city, None
\ No newline at end of file